@@ -0,0 +1,217 @@
+"""
+Análise em lote de um diretório de diagramas de arquitetura, sem interface.
+
+Exemplo:
+    python analise_em_lote.py dataset --saida resultados.jsonl --pdfs relatorios --workers 4 --rpm 60
+
+O arquivo de saída tem uma linha JSON por diagrama. Ao reiniciar, os diagramas já concluídos com sucesso
+no arquivo de saída são ignorados.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from azure_services import search
+from openai_services import ai_flow
+from openai_services.analise_incremental import relatorio_incompleto
+from openai_services.resiliencia import TOKENS_POR_MINUTO, BaldeTaxa
+from services.gerar_pdf import gerar_relatorio_pdf
+from services.historico import HistoricoAnalises, execucoes_anteriores, hash_conteudo
+from services.recuperacao import recuperar_documentos
+
+# Configuração do log
+logging.basicConfig(level=logging.INFO)
+
+EXTENSOES = (".png", ".jpg", ".jpeg", ".pdf")
+
+
+def listar_diagramas(diretorio):
+    return sorted(p for p in Path(diretorio).rglob("*") if p.is_file() and p.suffix.lower() in EXTENSOES)
+
+
+def carregar_concluidos(caminho_saida):
+    """Lê o JSONL de saída e retorna os arquivos já analisados com sucesso."""
+    concluidos = set()
+    if not os.path.exists(caminho_saida):
+        return concluidos
+    with open(caminho_saida, "r", encoding="utf-8") as f:
+        for linha in f:
+            try:
+                registro = json.loads(linha)
+            except json.JSONDecodeError:
+                # Linha incompleta de uma execução interrompida
+                continue
+            if registro.get("status") == "ok":
+                concluidos.add(registro["arquivo"])
+    return concluidos
+
+
+def analisar_diagrama(chat, search_rag, caminho, historico=None, incremental=False, fanout=False, arquivo=None):
+    """
+    Executa o pipeline completo (arquitetura, busca e as duas análises STRIDE) para um diagrama.
+
+    Com um `historico`, diagramas já analisados com o mesmo modelo, prompts, modo de análise e backend de
+    busca (Chat.versao_analise) são respondidos a partir dele e as novas análises são gravadas nele. No modo `incremental`, só os componentes e
+    interações sem análise em cache vão ao modelo; no modo `fanout`, cada componente e interação vai em
+    uma requisição própria, em paralelo.
+
+    `arquivo` identifica o diagrama no histórico (a versão anterior usada nos modos incremental e fan-out
+    é a última com o mesmo valor); no lote é o caminho relativo ao diretório, para que diagramas de mesmo
+    nome em pastas diferentes não se confundam. Sem ele, vale o nome do arquivo.
+    """
+    arquivo = arquivo or Path(caminho).name
+    with open(caminho, "rb") as f:
+        conteudo = f.read()
+
+    hash_imagem = hash_conteudo(conteudo)
+    versao = chat.versao_analise(ai_flow.modo_analise(incremental, fanout), search_rag.backend)
+    anterior = historico.buscar(hash_imagem, chat.model, versao) if historico else None
+    if anterior is not None:
+        return {
+            "componentes_identificados": anterior["componentes"],
+            "descricao_componentes": anterior["descricao_componentes"],
+            "fluxo_aplicacao": anterior["fluxo_aplicacao"],
+            "resultado_items": anterior["resultado_items"],
+            "resultado_flow": anterior["resultado_flow"]
+        }
+
+    tempos = {}
+    inicio = time.perf_counter()
+    resultado = chat.interpretar_arquitetura(chat.read_architecture(io.BytesIO(conteudo)))
+    tempos["arquitetura"] = time.perf_counter() - inicio
+
+    resultados_itens = resultado.get("componentes_identificados", [])
+    resultados_fluxo = resultado.get("fluxo_aplicacao", [])
+
+    inicio = time.perf_counter()
+    docs_para_analise = recuperar_documentos(search_rag, resultados_itens, resultados_fluxo)
+    tempos["busca"] = time.perf_counter() - inicio
+
+    anteriores = None
+    if (incremental or fanout) and historico is not None:
+        anterior = historico.ultima_do_arquivo(arquivo, chat.model)
+        if anterior is not None:
+            anteriores = execucoes_anteriores(anterior)
+
+    inicio = time.perf_counter()
+    analises = chat.check_vulnerabilities(
+        {"items": resultados_itens, "data-flow": resultados_fluxo}, docs_para_analise,
+        incremental=incremental, anteriores=anteriores, fanout=fanout
+    )
+    tempos["analise"] = time.perf_counter() - inicio
+
+    # Unidades sem análise: o diagrama fica com erro (e é refeito na próxima execução) em vez de ir
+    # incompleto para o histórico
+    incompletas = [tipo for tipo, texto in analises.items() if relatorio_incompleto(texto)]
+    if incompletas:
+        raise ValueError(f"Análises {incompletas} incompletas: o modelo não devolveu todas as unidades.")
+
+    if historico is not None:
+        historico.registrar(hash_imagem, chat.model, versao, resultado, analises["items"],
+                            analises["data-flow"], tempos=tempos, arquivo=arquivo)
+
+    return {
+        "componentes_identificados": resultados_itens,
+        "descricao_componentes": resultado.get("descricao_componentes", {}),
+        "fluxo_aplicacao": resultados_fluxo,
+        "resultado_items": analises["items"],
+        "resultado_flow": analises["data-flow"]
+    }
+
+
+def salvar_pdf(registro, diretorio_pdfs):
+    nome = Path(registro["arquivo"]).with_suffix(".pdf").as_posix().replace("/", "__")
+    # Gravado direto no arquivo; cada diagrama gera um relatório diferente, então não vale guardar em memória
+    gerar_relatorio_pdf(
+        resultados_itens=registro["componentes_identificados"],
+        descricao_componentes=registro["descricao_componentes"],
+        resultados_fluxo=registro["fluxo_aplicacao"],
+        resultado_items=registro["resultado_items"],
+        resultado_flow=registro["resultado_flow"],
+        destino=os.path.join(diretorio_pdfs, nome),
+        memorizar=False
+    )
+
+
+def executar(diretorio, caminho_saida, chat, search_rag, workers=4, diretorio_pdfs=None, historico=None,
+             incremental=False, fanout=False):
+    """Processa todos os diagramas pendentes do diretório com até `workers` diagramas em paralelo."""
+    diretorio = Path(diretorio)
+    diagramas = listar_diagramas(diretorio)
+    concluidos = carregar_concluidos(caminho_saida)
+    pendentes = [p for p in diagramas if p.relative_to(diretorio).as_posix() not in concluidos]
+    logging.info(f"{len(diagramas)} diagramas encontrados, {len(pendentes)} pendentes.")
+
+    if diretorio_pdfs:
+        os.makedirs(diretorio_pdfs, exist_ok=True)
+
+    def processar(caminho):
+        inicio = time.perf_counter()
+        registro = {"arquivo": caminho.relative_to(diretorio).as_posix()}
+        try:
+            registro.update(analisar_diagrama(chat, search_rag, caminho, historico, incremental, fanout,
+                                              arquivo=registro["arquivo"]))
+            if diretorio_pdfs:
+                salvar_pdf(registro, diretorio_pdfs)
+            registro["status"] = "ok"
+        except Exception as e:
+            logging.error(f"Erro ao analisar {caminho}: {str(e)}")
+            registro.update({"status": "erro", "erro": str(e)})
+        registro["duracao_segundos"] = round(time.perf_counter() - inicio, 3)
+        return registro
+
+    totais = {"ok": 0, "erro": 0}
+    with open(caminho_saida, "a", encoding="utf-8") as saida, ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(processar, caminho) for caminho in pendentes]
+        for future in as_completed(futures):
+            registro = future.result()
+            totais[registro["status"]] += 1
+            # Cada registro é gravado assim que termina, para que uma interrupção não perca o que já foi feito
+            saida.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            saida.flush()
+            logging.info(f"{registro['arquivo']}: {registro['status']} em {registro['duracao_segundos']}s")
+
+    return totais
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Análise de vulnerabilidade em lote de diagramas de arquitetura.")
+    parser.add_argument("diretorio", help="Diretório com os diagramas (.png, .jpg, .jpeg, .pdf)")
+    parser.add_argument("--saida", default="resultados_lote.jsonl", help="Arquivo JSONL de resultados")
+    parser.add_argument("--pdfs", default=None, help="Diretório para gravar um PDF de relatório por diagrama")
+    parser.add_argument("--workers", type=int, default=4, help="Diagramas processados em paralelo")
+    parser.add_argument("--rpm", type=int, default=60, help="Limite global de requisições ao LLM por minuto")
+    parser.add_argument("--tpm", type=int, default=TOKENS_POR_MINUTO, help="Limite global de tokens ao LLM por minuto")
+    parser.add_argument("--model", default="o4-mini-2025-04-16", help="Modelo da OpenAI")
+    parser.add_argument("--search-backend", default=None, help="Backend de busca (azure, local, vector, hybrid)")
+    parser.add_argument("--sem-historico", action="store_true",
+                        help="Não consultar nem gravar o histórico de análises (refaz tudo)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Analisar só componentes e interações sem análise em cache (diagramas revisados)")
+    parser.add_argument("--fanout", action="store_true",
+                        help="Uma requisição por componente e interação, em paralelo (diagramas grandes)")
+    args = parser.parse_args()
+
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        parser.error("Defina a variável de ambiente OPENAI_API_KEY.")
+
+    # Um único balde para todas as threads: as novas tentativas e as chamadas do fan-out também contam
+    chat = ai_flow.Chat(api_key, model=args.model, balde=BaldeTaxa(args.rpm, args.tpm))
+    search_rag = search.criar_search(args.search_backend)
+
+    historico = None if args.sem_historico else HistoricoAnalises()
+
+    totais = executar(args.diretorio, args.saida, chat, search_rag, workers=args.workers,
+                      diretorio_pdfs=args.pdfs, historico=historico, incremental=args.incremental,
+                      fanout=args.fanout)
+    logging.info(f"Concluído: {totais['ok']} com sucesso, {totais['erro']} com erro.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import array
+import hashlib
+import json
+import math
+import mmap
+import os
+import re
+import unicodedata
+import uuid
+from collections import Counter
+
+# Caminhos padrão, relativos a este arquivo (mesma convenção de Search.carregar_urls)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CAMINHO_CORPUS = os.path.join(SCRIPT_DIR, "..", "documentacao_stride", "documentacao_stride.json")
+DIRETORIO_INDICE = os.path.join(SCRIPT_DIR, "..", ".cache", "indice_bm25")
+
+VERSAO_INDICE = 1
+
+# Palavras muito frequentes em português e inglês que não ajudam no ranqueamento
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "of", "on", "or",
+    "that", "the", "this", "to", "with", "o", "os", "de", "da", "do", "das", "dos", "e", "em", "um",
+    "uma", "para", "por", "com", "no", "na", "nos", "nas", "que", "se", "ao", "aos"
+}
+
+_PADRAO_TOKEN = re.compile(r"\w+")
+
+
+def tokenizar(texto):
+    """Normaliza (minúsculas, sem acentos) e quebra o texto em termos, removendo stopwords."""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return [t for t in _PADRAO_TOKEN.findall(texto) if t not in STOPWORDS and len(t) > 1]
+
+
+def carregar_documentos_corpus(caminho=CAMINHO_CORPUS):
+    """Lê o JSON gerado por conteudo_documentacao.py e monta os documentos no formato do índice."""
+    with open(caminho, "r", encoding="utf-8") as f:
+        dados = json.load(f)
+
+    # Versões mais novas do JSON trazem as URLs na mesma ordem dos conteúdos
+    urls = dados.get("urls", [])
+
+    documentos = []
+    for i, conteudo in enumerate(dados.get("documentacao_stride", [])):
+        documentos.append({
+            "id": f"stride-doc-{i+1}",
+            "titulo": "Sem título",
+            "conteudo": conteudo,
+            "url": urls[i] if i < len(urls) else "URL não disponível"
+        })
+    return documentos
+
+
+# Nomes dos arquivos de dados em índices gravados antes dos nomes por geração
+ARQUIVOS_LEGADOS = {"documentos": "documentos.jsonl", "postings": "postings.bin"}
+
+
+def _ler_meta(diretorio):
+    caminho = os.path.join(diretorio, "meta.json")
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _gravar_substituindo(caminho, conteudo):
+    # Grava ao lado e troca de uma vez: quem lê vê o arquivo antigo ou o novo, nunca um pela metade
+    temporario = f"{caminho}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        f.write(conteudo)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, caminho)
+
+
+def construir_indice(documentos, diretorio=DIRETORIO_INDICE, hash_corpus="", k1=1.5, b=0.75):
+    """
+    Constrói o índice invertido BM25 e o grava em disco.
+
+    Arquivos gerados:
+        postings-<geração>.bin: pares uint32 (posição do documento, frequência do termo), agrupados por termo
+        documentos-<geração>.jsonl: um documento por linha, lido sob demanda pelo deslocamento em bytes
+        meta.json: vocabulário (termo -> [início, df]), tamanhos dos documentos, parâmetros do BM25 e os
+            nomes dos dois arquivos acima
+
+    Os arquivos de dados de cada construção têm nomes novos e o meta.json é trocado por último, de uma vez:
+    leitores que já mapearam o índice anterior continuam com arquivos íntegros, e uma construção interrompida
+    deixa o índice anterior valendo. Os arquivos de duas construções atrás são apagados.
+    """
+    os.makedirs(diretorio, exist_ok=True)
+
+    geracao = uuid.uuid4().hex[:12]
+    arquivos = {"documentos": f"documentos-{geracao}.jsonl", "postings": f"postings-{geracao}.bin"}
+
+    postings_por_termo = {}
+    tamanhos = []
+    deslocamentos = []
+
+    with open(os.path.join(diretorio, arquivos["documentos"]), "wb") as arquivo_docs:
+        for posicao, documento in enumerate(documentos):
+            termos = tokenizar(f"{documento.get('titulo', '')} {documento.get('conteudo', '')}")
+            tamanhos.append(len(termos))
+            for termo, frequencia in Counter(termos).items():
+                postings_por_termo.setdefault(termo, []).append((posicao, frequencia))
+
+            deslocamentos.append(arquivo_docs.tell())
+            arquivo_docs.write(json.dumps(documento, ensure_ascii=False).encode("utf-8") + b"\n")
+        arquivo_docs.flush()
+        os.fsync(arquivo_docs.fileno())
+
+    vocabulario = {}
+    postings = array.array("I")
+    for termo in sorted(postings_por_termo):
+        vocabulario[termo] = [len(postings) // 2, len(postings_por_termo[termo])]
+        for posicao, frequencia in postings_por_termo[termo]:
+            postings.append(posicao)
+            postings.append(frequencia)
+
+    with open(os.path.join(diretorio, arquivos["postings"]), "wb") as f:
+        postings.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+    anterior = _ler_meta(diretorio)
+    meta = {
+        "versao": VERSAO_INDICE,
+        "hash_corpus": hash_corpus,
+        "k1": k1,
+        "b": b,
+        "n_docs": len(tamanhos),
+        "avgdl": (sum(tamanhos) / len(tamanhos)) if tamanhos else 0.0,
+        "tamanhos": tamanhos,
+        "deslocamentos": deslocamentos,
+        "vocabulario": vocabulario,
+        "arquivos": arquivos,
+        # Arquivos da construção anterior: ainda podem estar abertos por quem leu o meta.json antigo
+        "arquivos_anteriores": anterior.get("arquivos", ARQUIVOS_LEGADOS) if anterior else {}
+    }
+    _gravar_substituindo(os.path.join(diretorio, "meta.json"), json.dumps(meta, ensure_ascii=False))
+
+    if anterior:
+        for nome in anterior.get("arquivos_anteriores", {}).values():
+            if nome not in arquivos.values() and nome not in meta["arquivos_anteriores"].values():
+                try:
+                    os.remove(os.path.join(diretorio, nome))
+                except FileNotFoundError:
+                    pass
+
+
+class LocalSearch:
+    """
+    Busca BM25 em processo sobre a documentação STRIDE, com o mesmo contrato de Search.search_topic.
+
+    O índice é construído uma única vez (ou quando o corpus muda) e depois apenas mapeado em memória.
+    """
+
+    # Identificação do backend gravada com as análises no histórico
+    backend = "local"
+
+    def __init__(self, caminho_corpus=CAMINHO_CORPUS, diretorio_indice=DIRETORIO_INDICE, preparar_documentos=None):
+        self.caminho_corpus = caminho_corpus
+        self.diretorio_indice = diretorio_indice
+        # Transformação opcional aplicada aos documentos antes de indexar (ex.: divisão em trechos)
+        self.preparar_documentos = preparar_documentos
+        self._abrir_indice()
+
+    def _hash_corpus(self):
+        with open(self.caminho_corpus, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def _abrir_indice(self):
+        """Carrega o índice do disco, reconstruindo-o se não existir ou estiver desatualizado."""
+        hash_corpus = self._hash_corpus()
+
+        meta = _ler_meta(self.diretorio_indice)
+        if meta is None or meta.get("versao") != VERSAO_INDICE or meta.get("hash_corpus") != hash_corpus:
+            self.indexar_documentacao(hash_corpus)
+            meta = _ler_meta(self.diretorio_indice)
+
+        self.meta = meta
+        self.vocabulario = meta["vocabulario"]
+        self.tamanhos = meta["tamanhos"]
+        self.deslocamentos = meta["deslocamentos"]
+
+        arquivos = meta.get("arquivos", ARQUIVOS_LEGADOS)
+        self._postings_mmap = self._mapear(os.path.join(self.diretorio_indice, arquivos["postings"]))
+        self._postings = memoryview(self._postings_mmap).cast("I") if self._postings_mmap else []
+        self._documentos_mmap = self._mapear(os.path.join(self.diretorio_indice, arquivos["documentos"]))
+
+    @staticmethod
+    def _mapear(caminho):
+        # mmap não aceita arquivos vazios
+        if os.path.getsize(caminho) == 0:
+            return None
+        with open(caminho, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def indexar_documentacao(self, hash_corpus=None):
+        """Reconstrói o índice local a partir do JSON da documentação STRIDE."""
+        documentos = carregar_documentos_corpus(self.caminho_corpus)
+        if self.preparar_documentos:
+            documentos = list(self.preparar_documentos(documentos))
+        construir_indice(documentos, self.diretorio_indice, hash_corpus or self._hash_corpus())
+        print(f"Índice local criado com {len(documentos)} documentos.")
+
+    def _carregar_documento(self, posicao):
+        inicio = self.deslocamentos[posicao]
+        fim = self._documentos_mmap.find(b"\n", inicio)
+        return json.loads(self._documentos_mmap[inicio:fim].decode("utf-8"))
+
+    def pontuar(self, topic):
+        """Retorna {posição do documento: score BM25} para os documentos que contêm algum termo da consulta."""
+        n_docs = self.meta["n_docs"]
+        avgdl = self.meta["avgdl"] or 1.0
+        k1 = self.meta["k1"]
+        b = self.meta["b"]
+
+        scores = {}
+        for termo in set(tokenizar(topic)):
+            entrada = self.vocabulario.get(termo)
+            if entrada is None:
+                continue
+            inicio, df = entrada
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for i in range(inicio, inicio + df):
+                posicao = self._postings[2 * i]
+                frequencia = self._postings[2 * i + 1]
+                normalizacao = k1 * (1 - b + b * self.tamanhos[posicao] / avgdl)
+                scores[posicao] = scores.get(posicao, 0.0) + idf * frequencia * (k1 + 1) / (frequencia + normalizacao)
+        return scores
+
+    def search_topic(self, topic, top_k=50):
+        """
+        Pesquisa por um tópico no índice local e retorna resultados no mesmo formato de Search.search_topic.
+
+        Retorna:
+            List[Dict]: Lista de resultados com título, conteúdo, URL, ID e score, do mais ao menos relevante.
+        """
+        scores = self.pontuar(topic)
+        melhores = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+        resultados_formatados = []
+        for posicao, score in melhores:
+            documento = self._carregar_documento(posicao)
+            resultados_formatados.append({
+                "id": documento.get("id", "ID não disponível"),
+                "titulo": documento.get("titulo", "Sem título"),
+                "conteudo": documento.get("conteudo", "Sem conteúdo"),
+                "url": documento.get("url", "URL não disponível"),
+                "score": score
+            })
+
+        return resultados_formatados
+
+    def search_topics(self, topics, top_k=50):
+        """Executa várias pesquisas de uma vez; a pontuação local é em memória, então roda em sequência."""
+        return [self.search_topic(topic, top_k=top_k) for topic in topics]
@@ -1,7 +1,11 @@
+import hashlib
+import json
 import os
-import requests
-from bs4 import BeautifulSoup
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import AzureError, HttpResponseError
 from azure.search.documents import SearchClient
 from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents.indexes.models import (
@@ -11,22 +15,85 @@ from azure.search.documents.indexes.models import (
     SearchFieldDataType
 )
 
+from services import rastreamento
+from services.crawler import (
+    CAMINHO_ESTADO_LEGADO, TIMEOUT_SEGUNDOS, Crawler, caminho_estado_consumidor, criar_sessao, extrair_conteudo_html
+)
+from services.trechos import agrupar_em_lotes, dividir_em_trechos
+
 # Configurações do Azure Search
 # service_endpoint = os.environ.get("AZURE_SEARCH_ENDPOINT")
 # admin_key = os.environ.get("AZURE_SEARCH_ADMIN_KEY")
 # index_name = os.environ.get("AZURE_SEARCH_INDEX_NAME")
 
+# Backend de busca: "azure" (Azure Cognitive Search), "local" (índice BM25 em processo), "vector" (similaridade
+# de embeddings) ou "hybrid" (embeddings + BM25). Os três últimos funcionam offline com o embedding "hash".
+SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "azure")
+
+# Embedding dos backends "vector" e "hybrid": "hash" (local, só lexical) ou "openai" (API de embeddings, com
+# a chave de OPENAI_API_KEY e o modelo de SEARCH_EMBEDDING_MODELO)
+SEARCH_EMBEDDING = os.environ.get("SEARCH_EMBEDDING", "hash")
+SEARCH_EMBEDDING_MODELO = os.environ.get("SEARCH_EMBEDDING_MODELO", "text-embedding-3-small")
+
+# Envio dos trechos ao índice
+TAMANHO_LOTE_UPLOAD = 100
+MAX_TENTATIVAS_UPLOAD = 5
+BACKOFF_BASE_SEGUNDOS = 1.0
+
+
+def gerar_id_documento(url):
+    """ID estável do documento, derivado da URL, para que reindexações substituam a versão anterior."""
+    return f"stride-doc-{hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]}"
+
+
+def ids_legados(urls):
+    """IDs da indexação original, um documento por página numerado pela posição no arquivo de URLs."""
+    return [f"stride-doc-{posicao}" for posicao in range(1, len(urls) + 1)]
+
+
+def criar_search(backend=None, embedding=None):
+    """
+    Cria o cliente de busca configurado; todos expõem search_topic com o mesmo contrato.
+
+    Nos backends "vector" e "hybrid", o embedding "hash" (padrão) roda offline, mas é um substituto lexical:
+    compara termos e n-gramas de caracteres, sem capturar sinônimos nem paráfrases. Para busca semântica de
+    fato, use o embedding "openai".
+    """
+    backend = backend or SEARCH_BACKEND
+    if backend == "local":
+        from azure_services.local_search import LocalSearch
+        return LocalSearch()
+    if backend in ("vector", "hybrid"):
+        from azure_services.vector_search import PESO_PALAVRAS_CHAVE, EmbeddingHash, EmbeddingOpenAI, VectorSearch
+        embedding = embedding or SEARCH_EMBEDDING
+        if embedding == "openai":
+            from openai import OpenAI
+            funcao_embedding = EmbeddingOpenAI(OpenAI(), model=SEARCH_EMBEDDING_MODELO)
+        elif embedding == "hash":
+            funcao_embedding = EmbeddingHash()
+        else:
+            raise ValueError(f"Embedding de busca desconhecido: {embedding}")
+        return VectorSearch(embedding=funcao_embedding,
+                            peso_palavras_chave=PESO_PALAVRAS_CHAVE if backend == "hybrid" else 0)
+    if backend != "azure":
+        raise ValueError(f"Backend de busca desconhecido: {backend}")
+    return Search()
+
 class Search:
 
-    def __init__(self):
+    def __init__(self, search_client=None):
         self.service_endpoint = "https://hackathon-fase-cinco-grupo-vinteecinco-rag.search.windows.net"
         self.admin = "LQs2MMwot4X1VONayHbBb4lZDdKUMznYfnKXrzwp0IAzSeAO4QV4"
         self.index_name = "stride-documentation-index"
-        self.search_client = SearchClient(
+        # Um cliente compatível pode ser injetado (ex.: o simulado de benchmarks/simulados.py)
+        self.search_client = search_client or SearchClient(
                                 endpoint=self.service_endpoint,
                                 index_name=self.index_name,
                                 credential=AzureKeyCredential(self.admin)
                             )
+        self.sessao = criar_sessao()
+        # Identificação do backend gravada com as análises no histórico
+        self.backend = "azure"
         
     def criar_indice_se_nao_existe(self):
         """Cria o índice de pesquisa caso não exista."""
@@ -53,39 +120,9 @@ class Search:
     def extrair_conteudo_url(self, url):
         """Extrai o conteúdo HTML de uma URL da documentação STRIDE."""
         try:
-            response = requests.get(url)
+            response = self.sessao.get(url, timeout=TIMEOUT_SEGUNDOS)
             response.raise_for_status()
-
-            soup = BeautifulSoup(response.text, 'html.parser')
-            titulo = soup.title.string if soup.title else "Sem título"
-
-            # Nova lógica para extração do conteúdo principal
-            conteudo_documentacoes_divs = soup.find_all('div', class_='content')
-            print(conteudo_documentacoes_divs)
-
-            if conteudo_documentacoes_divs:
-                conteudo = ""
-                for div in conteudo_documentacoes_divs:
-                    paragrafos = div.find_all('p')
-                    # Concatena o texto de todos os parágrafos encontrados em cada div
-                    conteudo += ' ' + ' '.join(p.get_text(strip=True) for p in paragrafos)
-                conteudo = conteudo.strip()
-            else:
-                # Fallback
-                conteudo_principal = soup.find('main') or soup.find('article') or soup.find('div', id='main')
-                if conteudo_principal:
-                    # Remover scripts e estilos
-                    for script in conteudo_principal(["script", "style"]):
-                        script.extract()
-                    conteudo = conteudo_principal.get_text(separator=' ', strip=True)
-                else:
-                    conteudo = soup.body.get_text(separator=' ', strip=True) if soup.body else ""
-
-            return {
-                "titulo": titulo,
-                "conteudo": conteudo,
-                "url": url
-            }
+            return extrair_conteudo_html(response.text, url)
         except Exception as e:
             print(f"Erro ao processar URL {url}: {str(e)}")
             return None
@@ -109,40 +146,135 @@ class Search:
             print(f"Erro ao ler arquivo de URLs: {str(e)}")
             return []
 
-    def indexar_documentacao(self):
-        """Função principal para indexar a documentação STRIDE."""
+    def _herdar_trechos(self, crawler, caminho_legado=CAMINHO_ESTADO_LEGADO):
+        """
+        Primeira execução com o estado próprio do índice: do arquivo compartilhado anterior vem só a quantidade
+        de trechos de cada página, para que os excedentes continuem sendo apagados. Validadores e hash não são
+        copiados, porque podem ter sido gravados pelo conteudo_documentacao; as páginas são reprocessadas uma vez.
+        """
+        if crawler.estado or not os.path.exists(caminho_legado):
+            return
+        with open(caminho_legado, "r", encoding="utf-8") as f:
+            legado = json.load(f)
+        crawler.estado.update({url: {"trechos": estado["trechos"]} for url, estado in legado.items()
+                               if "trechos" in estado})
+
+    def _migrar_estado(self, crawler, urls):
+        """
+        Páginas sem 'trechos' no estado, que nunca foram indexadas em trechos (vêm de versões anteriores da
+        indexação), são tratadas como alteradas.
+
+        Retorna:
+            list[str]: URLs que serão reprocessadas.
+        """
+        pendentes = [url for url in urls if "trechos" not in crawler.estado.get(url, {})]
+        for url in pendentes:
+            crawler.esquecer(url)
+        if pendentes:
+            print(f"{len(pendentes)} páginas sem trechos indexados serão reprocessadas.")
+        return pendentes
+
+    def _gerar_trechos(self, crawler, urls, ids_obsoletos):
+        """Gera os trechos das páginas novas ou alteradas, uma página por vez."""
+        for documento in crawler.paginas_alteradas(urls):
+            documento["id"] = gerar_id_documento(documento["url"])
+
+            total = 0
+            for trecho in dividir_em_trechos(documento):
+                total += 1
+                yield trecho
+
+            estado = crawler.estado.setdefault(documento["url"], {})
+            if "trechos" not in estado:
+                # Indexada antes como página inteira, com o ID sem a posição do trecho
+                ids_obsoletos.append(documento["id"])
+            # Se a página encolheu, os trechos excedentes da versão anterior precisam sair do índice
+            ids_obsoletos.extend(f"{documento['id']}-{posicao}" for posicao in range(total, estado.get("trechos", 0)))
+            estado["trechos"] = total
+
+    def _enviar_lote(self, lote, tentativas=MAX_TENTATIVAS_UPLOAD):
+        """Envia um lote ao índice, reenviando com backoff exponencial apenas os documentos que falharam."""
+        pendentes = lote
+        for tentativa in range(tentativas):
+            try:
+                resultados = self.search_client.upload_documents(documents=pendentes)
+                falhas = {resultado.key for resultado in resultados if not resultado.succeeded}
+            except HttpResponseError as e:
+                # Requisição grande demais: divide o lote ao meio em vez de repetir o mesmo envio
+                if e.status_code == 413 and len(pendentes) > 1:
+                    meio = len(pendentes) // 2
+                    return self._enviar_lote(pendentes[:meio], tentativas) + \
+                        self._enviar_lote(pendentes[meio:], tentativas)
+                print(f"Erro ao enviar lote de {len(pendentes)} documentos: {str(e)}")
+                falhas = {documento["id"] for documento in pendentes}
+            except AzureError as e:
+                print(f"Erro ao enviar lote de {len(pendentes)} documentos: {str(e)}")
+                falhas = {documento["id"] for documento in pendentes}
+
+            pendentes = [documento for documento in pendentes if documento["id"] in falhas]
+            if not pendentes:
+                return len(lote)
+
+            espera = BACKOFF_BASE_SEGUNDOS * (2 ** tentativa) * (1 + random.random())
+            print(f"{len(pendentes)} documentos falharam; nova tentativa em {espera:.1f}s.")
+            time.sleep(espera)
+
+        raise RuntimeError(f"{len(pendentes)} documentos não foram indexados após {tentativas} tentativas.")
+
+    def indexar_documentacao(self, crawler=None, tamanho_lote=TAMANHO_LOTE_UPLOAD):
+        """
+        Função principal para indexar a documentação STRIDE.
+
+        As URLs são baixadas em paralelo com requisições condicionais; apenas páginas novas ou alteradas
+        são extraídas, divididas em trechos sobrepostos e enviadas ao índice em lotes de `tamanho_lote`.
+        Os trechos são processados em fluxo, então o uso de memória não cresce com o tamanho do corpus.
+        """
         self.criar_indice_se_nao_existe()
 
         urls = self.carregar_urls()
         print(f"Processando {len(urls)} URLs...")
 
-        documentos = []
-        for i, url in enumerate(urls):
-            documento = self.extrair_conteudo_url(url)
-            if documento:
-                documento["id"] = f"stride-doc-{i+1}"
-                documentos.append(documento)
-
-        if documentos:
-            result = self.search_client.upload_documents(documents=documentos)
-            print(f"Indexados {len(documentos)} documentos com sucesso.")
-            return result
+        if crawler is None:
+            crawler = Crawler(caminho_estado_consumidor("indice"))
+            self._herdar_trechos(crawler)
+        migradas = self._migrar_estado(crawler, urls)
+        ids_obsoletos = []
+        total = 0
+        for lote in agrupar_em_lotes(self._gerar_trechos(crawler, urls, ids_obsoletos), tamanho_lote):
+            total += self._enviar_lote(lote)
+            print(f"{total} trechos indexados até agora.")
+
+        # Os IDs por posição da indexação original não apontam para uma URL: só saem do índice quando
+        # todas as páginas já estão indexadas em trechos
+        if migradas and all("trechos" in crawler.estado.get(url, {}) for url in urls):
+            ids_obsoletos.extend(ids_legados(urls))
+
+        for lote in agrupar_em_lotes(ids_obsoletos, tamanho_lote):
+            self.search_client.delete_documents(documents=[{"id": doc_id} for doc_id in lote])
+
+        crawler.salvar_estado()
+        if total:
+            print(f"Indexados {total} trechos com sucesso.")
         else:
-            print("Nenhum documento para indexar.")
+            print("Nenhum documento novo ou alterado para indexar.")
+        return total
 
-    def search_topic(self, topic):
+    def search_topic(self, topic, top_k=50):
         """
         Pesquisa por um tópico na Azure Search e retorna resultados formatados para exibição no Streamlit.
         
         Retorna:
-            List[Dict]: Lista de resultados com título, conteúdo, URL e ID.
+            List[Dict]: Lista de resultados com título, conteúdo, URL, ID e score.
         """
         resultados_formatados = []
 
-        # Realiza a pesquisa
-        results = self.search_client.search(topic)
+        with rastreamento.span("search_topic", backend="azure", top_k=top_k) as span:
+            # Realiza a pesquisa; o SearchClient busca as páginas de resultado sob demanda durante a iteração
+            results = self.search_client.search(topic, top=top_k)
+            resultados = list(results)
+            span.definir(resultados=len(resultados))
 
-        for document in results:
+        for document in resultados:
             titulo = document.get("titulo") or document.get("title", "Sem título")
             conteudo = document.get("conteudo") or document.get("content", "Sem conteúdo")
             url = document.get("url", "URL não disponível")
@@ -152,9 +284,23 @@ class Search:
                 "id": doc_id,
                 "titulo": titulo,
                 "conteudo": conteudo,
-                "url": url
+                "url": url,
+                "score": document.get("@search.score", 0.0)
             }
 
             resultados_formatados.append(resultado)
 
-        return resultados_formatados
\ No newline at end of file
+        return resultados_formatados
+
+    def search_topics(self, topics, top_k=50, max_workers=8):
+        """
+        Executa várias pesquisas de uma vez, em paralelo, mantendo a ordem das consultas.
+
+        Retorna:
+            List[List[Dict]]: Resultados de search_topic para cada tópico.
+        """
+        if not topics:
+            return []
+        with ThreadPoolExecutor(max_workers=min(len(topics), max_workers)) as executor:
+            futures = [rastreamento.submeter(executor, self.search_topic, topic, top_k=top_k) for topic in topics]
+            return [future.result() for future in futures]
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import zlib
+
+import numpy as np
+
+from azure_services.local_search import CAMINHO_CORPUS, LocalSearch, carregar_documentos_corpus, tokenizar
+from services.trechos import dividir_em_trechos
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DIRETORIO_INDICE_VETORIAL = os.path.join(SCRIPT_DIR, "..", ".cache", "indice_vetorial")
+
+VERSAO_INDICE_VETORIAL = 1
+
+# Peso da pontuação por palavras-chave (BM25) na fusão híbrida; 0 usa apenas a similaridade vetorial
+PESO_PALAVRAS_CHAVE = 0.3
+
+
+class EmbeddingHash:
+    """
+    Embedding local e determinístico (hashing trick sobre termos, pares de termos e n-gramas de caracteres).
+
+    Não captura sinônimos como um modelo treinado, mas roda offline e serve para testes e ambientes sem API.
+    """
+
+    def __init__(self, dimensao=512):
+        self.dimensao = dimensao
+        self.nome = f"hash-{dimensao}"
+
+    def _caracteristicas(self, texto):
+        termos = tokenizar(texto)
+        for termo in termos:
+            yield termo, 1.0
+            # N-gramas de caracteres aproximam variações como plural e flexões
+            marcado = f"#{termo}#"
+            for i in range(len(marcado) - 3):
+                yield marcado[i:i + 4], 0.5
+        for anterior, atual in zip(termos, termos[1:]):
+            yield f"{anterior} {atual}", 0.7
+
+    def __call__(self, textos):
+        matriz = np.zeros((len(textos), self.dimensao), dtype=np.float32)
+        for linha, texto in enumerate(textos):
+            for caracteristica, peso in self._caracteristicas(texto):
+                valor = zlib.crc32(caracteristica.encode("utf-8"))
+                sinal = 1.0 if valor & 1 else -1.0
+                matriz[linha, (valor >> 1) % self.dimensao] += sinal * peso
+        return matriz
+
+
+class EmbeddingOpenAI:
+    """Embedding pela API da OpenAI, enviado em lotes."""
+
+    def __init__(self, client, model="text-embedding-3-small", tamanho_lote=256):
+        self.client = client
+        self.model = model
+        self.tamanho_lote = tamanho_lote
+        self.nome = f"openai-{model}"
+
+    def __call__(self, textos):
+        vetores = []
+        for inicio in range(0, len(textos), self.tamanho_lote):
+            response = self.client.embeddings.create(model=self.model, input=textos[inicio:inicio + self.tamanho_lote])
+            vetores.extend(item.embedding for item in response.data)
+        return np.asarray(vetores, dtype=np.float32).reshape(len(textos), -1)
+
+
+def _normalizar(matriz):
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return (matriz / normas).astype(np.float32)
+
+
+def dividir_documentos(documentos):
+    """Divide os documentos do corpus nos trechos que são indexados pela busca vetorial."""
+    for documento in documentos:
+        yield from dividir_em_trechos(documento)
+
+
+class VectorSearch:
+    """
+    Busca vetorial sobre os trechos da documentação STRIDE, com o mesmo contrato de Search.search_topic.
+
+    Os embeddings dos trechos são calculados uma única vez e gravados como uma matriz float32 contígua
+    (vetores.npy), lida com memory-map. As consultas são respondidas por similaridade de cosseno, opcionalmente
+    combinada à pontuação BM25 dos mesmos trechos (modo híbrido).
+    """
+
+    def __init__(self, embedding=None, caminho_corpus=CAMINHO_CORPUS, diretorio_indice=DIRETORIO_INDICE_VETORIAL,
+                 peso_palavras_chave=PESO_PALAVRAS_CHAVE):
+        self.embedding = embedding or EmbeddingHash()
+        self.caminho_corpus = caminho_corpus
+        self.diretorio_indice = diretorio_indice
+        self.peso_palavras_chave = peso_palavras_chave
+        # Identificação do backend gravada com as análises no histórico: o embedding muda os documentos recuperados
+        self.backend = f"{'hybrid' if peso_palavras_chave > 0 else 'vector'}-{self.embedding.nome}"
+
+        # Índice BM25 sobre os mesmos trechos, na mesma ordem, usado na fusão híbrida
+        self.busca_palavras = None
+        if peso_palavras_chave > 0:
+            self.busca_palavras = LocalSearch(
+                caminho_corpus=caminho_corpus,
+                diretorio_indice=os.path.join(diretorio_indice, "bm25"),
+                preparar_documentos=dividir_documentos
+            )
+
+        self._abrir_indice()
+
+    def _hash_corpus(self):
+        with open(self.caminho_corpus, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def _abrir_indice(self):
+        """Carrega o índice do disco, reconstruindo-o se o corpus ou a função de embedding mudaram."""
+        hash_corpus = self._hash_corpus()
+        caminho_meta = os.path.join(self.diretorio_indice, "meta.json")
+
+        meta = None
+        if os.path.exists(caminho_meta):
+            with open(caminho_meta, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+
+        if (meta is None or meta.get("versao") != VERSAO_INDICE_VETORIAL or meta.get("hash_corpus") != hash_corpus
+                or meta.get("embedding") != self.embedding.nome):
+            self.indexar_documentacao(hash_corpus)
+            with open(caminho_meta, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+
+        self.meta = meta
+        self.vetores = np.load(os.path.join(self.diretorio_indice, "vetores.npy"), mmap_mode="r")
+        with open(os.path.join(self.diretorio_indice, "documentos.json"), "r", encoding="utf-8") as f:
+            self.documentos = json.load(f)
+
+    def indexar_documentacao(self, hash_corpus=None):
+        """Calcula os embeddings de todos os trechos e grava a matriz e os metadados em disco."""
+        os.makedirs(self.diretorio_indice, exist_ok=True)
+        documentos = list(dividir_documentos(carregar_documentos_corpus(self.caminho_corpus)))
+
+        vetores = self.embedding([f"{d['titulo']} {d['conteudo']}" for d in documentos]) if documentos \
+            else np.zeros((0, 1), dtype=np.float32)
+        np.save(os.path.join(self.diretorio_indice, "vetores.npy"), np.ascontiguousarray(_normalizar(vetores)))
+
+        with open(os.path.join(self.diretorio_indice, "documentos.json"), "w", encoding="utf-8") as f:
+            json.dump(documentos, f, ensure_ascii=False)
+
+        with open(os.path.join(self.diretorio_indice, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "versao": VERSAO_INDICE_VETORIAL,
+                "hash_corpus": hash_corpus or self._hash_corpus(),
+                "embedding": self.embedding.nome,
+                "n_docs": len(documentos)
+            }, f)
+        print(f"Índice vetorial criado com {len(documentos)} trechos.")
+
+    def pontuar(self, topics):
+        """
+        Calcula a matriz de pontuação (consultas x trechos) com uma única multiplicação de matrizes.
+
+        No modo híbrido, soma a pontuação BM25 normalizada por consulta, ponderada por `peso_palavras_chave`.
+        """
+        consultas = _normalizar(self.embedding(list(topics)))
+        scores = consultas @ np.asarray(self.vetores).T
+
+        if self.busca_palavras is not None:
+            peso = self.peso_palavras_chave
+            palavras = np.zeros_like(scores)
+            for linha, topic in enumerate(topics):
+                for posicao, score in self.busca_palavras.pontuar(topic).items():
+                    palavras[linha, posicao] = score
+            maximos = palavras.max(axis=1, keepdims=True)
+            maximos[maximos == 0] = 1.0
+            scores = (1 - peso) * scores + peso * (palavras / maximos)
+        return scores
+
+    def search_topics(self, topics, top_k=50):
+        """Executa várias pesquisas de uma vez; todas as consultas são pontuadas juntas."""
+        topics = list(topics)
+        if not topics or not self.documentos:
+            return [[] for _ in topics]
+
+        scores = self.pontuar(topics)
+        k = min(top_k, scores.shape[1])
+        # argpartition seleciona os k melhores sem ordenar a linha inteira
+        melhores = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+        resultados = []
+        for linha, indices in enumerate(melhores):
+            indices = indices[np.argsort(-scores[linha, indices])]
+            resultados_formatados = []
+            for posicao in indices:
+                score = float(scores[linha, posicao])
+                if score <= 0:
+                    continue
+                documento = self.documentos[posicao]
+                resultados_formatados.append({
+                    "id": documento.get("id", "ID não disponível"),
+                    "titulo": documento.get("titulo", "Sem título"),
+                    "conteudo": documento.get("conteudo", "Sem conteúdo"),
+                    "url": documento.get("url", "URL não disponível"),
+                    "score": score
+                })
+            resultados.append(resultados_formatados)
+        return resultados
+
+    def search_topic(self, topic, top_k=50):
+        """
+        Pesquisa por um tópico no índice vetorial e retorna resultados no mesmo formato de Search.search_topic.
+
+        Retorna:
+            List[Dict]: Lista de resultados com título, conteúdo, URL, ID e score, do mais ao menos relevante.
+        """
+        return self.search_topics([topic], top_k=top_k)[0]
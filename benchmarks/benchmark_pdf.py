@@ -0,0 +1,139 @@
+"""
+Benchmark da geração do relatório em PDF com relatórios grandes montados a partir das listas de
+componentes de metricas/respostas retornadas.
+
+Cada componente (e cada interação entre componentes vizinhos) recebe uma seção STRIDE completa, com as
+seis categorias, justificativa e mitigações; --fator multiplica os componentes para relatórios maiores.
+Mede a conversão do texto das análises nos elementos do PDF (a mesma de gerar_relatorio_pdf), a geração
+em memória, a gravação direta em arquivo e a geração repetida (memorizada) e reporta p50/p95.
+
+O horário impresso no relatório faz parte da chave da memorização, com resolução de minutos: "pdf_memorizado"
+mede acertos dentro do mesmo minuto, e uma medição que cruza a virada do minuto inclui uma geração completa.
+
+Exemplo (a partir da raiz do projeto):
+    python -m benchmarks.benchmark_pdf --fator 5 --execucoes 5
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks.benchmark_pipeline import percentil
+from benchmarks.simulados import DIRETORIO_RESPOSTAS, _ler
+from openai_services.analise_incremental import CATEGORIAS_STRIDE, montar_relatorio, normalizar_unidade
+from services.gerar_pdf import _elementos_analise, gerar_relatorio_pdf
+
+ETAPAS = ("elementos", "pdf_memoria", "pdf_arquivo", "pdf_memorizado")
+
+
+def _secao(unidade):
+    return {
+        "ameacas": [
+            {"categoria": categoria,
+             "descricao": f"Cenário de {categoria.split(' (')[1][:-1].lower()} envolvendo {unidade}, explorado a "
+                          f"partir de credenciais, configurações ou tráfego não validados entre os componentes."}
+            for categoria in CATEGORIAS_STRIDE
+        ],
+        "justificativa": f"{unidade} recebe dados de outros componentes e de usuários externos; sem controles de "
+                         f"identidade, integridade e registro, um atacante consegue se passar por um cliente "
+                         f"legítimo, alterar mensagens em trânsito e negar ações executadas.",
+        "mitigacoes": [
+            "Exigir autenticação forte e autorização por menor privilégio em todas as chamadas.",
+            "Criptografar os dados em trânsito e em repouso com chaves gerenciadas e rotacionadas.",
+            "Registrar e auditar alterações com logs imutáveis e alertas de comportamento anômalo.",
+            "Aplicar limites de taxa, cotas e proteção contra negação de serviço na borda."
+        ]
+    }
+
+
+def montar_resultado(componentes, fator):
+    """Resultado de análise completo (no formato do app) para os componentes, repetidos `fator` vezes."""
+    componentes = [componente if k == 0 else f"{componente} #{k + 1}"
+                   for k in range(fator) for componente in componentes]
+    interacoes = [f"{origem} → {destino}" for origem, destino in zip(componentes, componentes[1:])]
+    return {
+        "resultados_itens": componentes,
+        "descricao_componentes": {c: f"Componente {c} da arquitetura." for c in componentes},
+        "resultados_fluxo": "\n".join(f"{i}. {interacao}: requisições entre os componentes."
+                                      for i, interacao in enumerate(interacoes, start=1)),
+        "resultado_items": montar_relatorio(componentes, {normalizar_unidade(c): _secao(c) for c in componentes}),
+        "resultado_flow": montar_relatorio(interacoes, {normalizar_unidade(i): _secao(i) for i in interacoes})
+    }
+
+
+def medir(resultado, execucoes, diretorio):
+    """Executa cada etapa `execucoes` vezes para o resultado e retorna as durações em segundos."""
+    tempos = defaultdict(list)
+    caminho = os.path.join(diretorio, "relatorio.pdf")
+    for _ in range(execucoes):
+        inicio = time.perf_counter()
+        _elementos_analise(resultado["resultado_items"])
+        _elementos_analise(resultado["resultado_flow"])
+        tempos["elementos"].append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        gerar_relatorio_pdf(**resultado, memorizar=False)
+        tempos["pdf_memoria"].append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        gerar_relatorio_pdf(**resultado, destino=caminho, memorizar=False)
+        tempos["pdf_arquivo"].append(time.perf_counter() - inicio)
+
+    # A primeira chamada memorizada gera o PDF; as seguintes imitam cliques repetidos no botão
+    gerar_relatorio_pdf(**resultado)
+    for _ in range(execucoes):
+        inicio = time.perf_counter()
+        gerar_relatorio_pdf(**resultado)
+        tempos["pdf_memorizado"].append(time.perf_counter() - inicio)
+    return tempos, os.path.getsize(caminho)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da geração do relatório em PDF.")
+    parser.add_argument("--respostas", default=DIRETORIO_RESPOSTAS, help="Listas de componentes usadas nos relatórios")
+    parser.add_argument("--fator", type=int, default=3, help="Repetições dos componentes de cada diagrama")
+    parser.add_argument("--execucoes", type=int, default=5, help="Medições por relatório")
+    parser.add_argument("--json", default=None, help="Arquivo para gravar o relatório em JSON")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    nomes = sorted(n for n in os.listdir(args.respostas) if n.endswith(".txt"))
+    if not nomes:
+        parser.error(f"Nenhuma lista de componentes encontrada em {args.respostas}.")
+
+    relatorios = []
+    por_etapa = defaultdict(list)
+    with tempfile.TemporaryDirectory() as diretorio:
+        for nome in nomes:
+            componentes = json.loads(_ler(os.path.join(args.respostas, nome)))
+            resultado = montar_resultado(componentes, args.fator)
+            tempos, tamanho = medir(resultado, args.execucoes, diretorio)
+            caracteres = len(resultado["resultado_items"]) + len(resultado["resultado_flow"])
+            relatorios.append({
+                "arquivo": nome,
+                "componentes": len(resultado["resultados_itens"]),
+                "caracteres_analise": caracteres,
+                "bytes_pdf": tamanho,
+                "etapas": {etapa: {"p50_ms": percentil(tempos[etapa], 50) * 1000,
+                                   "p95_ms": percentil(tempos[etapa], 95) * 1000} for etapa in ETAPAS}
+            })
+            for etapa in ETAPAS:
+                por_etapa[etapa].extend(tempos[etapa])
+            print(f"{nome:<28}{len(resultado['resultados_itens']):>5} componentes {caracteres:>9} caracteres "
+                  f"{tamanho / 1024:>8.1f} KiB  pdf p50 {relatorios[-1]['etapas']['pdf_memoria']['p50_ms']:.1f} ms")
+
+    print(f"\n{'etapa':<22}{'p50 (ms)':>12}{'p95 (ms)':>12}")
+    for etapa in ETAPAS:
+        print(f"{etapa:<22}{percentil(por_etapa[etapa], 50) * 1000:>12.2f}{percentil(por_etapa[etapa], 95) * 1000:>12.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(relatorios, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Benchmark de ponta a ponta do pipeline de análise com os substitutos locais de OpenAI e Azure Search.
+
+Mede cada etapa (codificação da imagem, leitura da arquitetura, busca, as duas análises STRIDE,
+conversão do JSON e geração do PDF) e reporta p50/p95 e vazão para cada nível de concorrência.
+
+Exemplo (a partir da raiz do projeto):
+    python -m benchmarks.benchmark_pipeline --concorrencia 1 4 8 --execucoes 16 --latencia 0.3
+
+Com --fanout, as análises STRIDE usam uma requisição por componente e interação do fluxo.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from azure_services.search import Search
+from benchmarks.simulados import CacheDesativado, OpenAISimulado, SearchClientSimulado
+from openai_services import ai_flow
+from services import rastreamento
+from services.gerar_pdf import gerar_relatorio_pdf
+from services.hash_perceptual import IndicePerceptual
+from services.recuperacao import recuperar_documentos
+
+ETAPAS = (
+    "codificacao_imagem",
+    "leitura_arquitetura",
+    "conversao_json",
+    "busca",
+    "analise_items",
+    "analise_fluxo",
+    "geracao_pdf",
+    "total"
+)
+
+
+def percentil(valores, p):
+    """Percentil pelo método do posto mais próximo."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[indice]
+
+
+def executar_pipeline(chat, search_rag, imagem, fanout=False):
+    """Executa o pipeline completo uma vez e retorna a duração de cada etapa em segundos."""
+    tempos = {}
+    inicio_total = time.perf_counter()
+
+    inicio = time.perf_counter()
+    chat._mensagens_arquitetura(imagem)
+    tempos["codificacao_imagem"] = time.perf_counter() - inicio
+
+    # A leitura inclui de novo a codificação, como acontece no app
+    inicio = time.perf_counter()
+    response = chat.read_architecture(io.BytesIO(imagem))
+    tempos["leitura_arquitetura"] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    resultado = ai_flow.carregar_json(response)
+    tempos["conversao_json"] = time.perf_counter() - inicio
+
+    resultados_itens = resultado.get("componentes_identificados", [])
+    resultados_fluxo = resultado.get("fluxo_aplicacao", [])
+
+    inicio = time.perf_counter()
+    docs_para_analise = recuperar_documentos(search_rag, resultados_itens, resultados_fluxo)
+    tempos["busca"] = time.perf_counter() - inicio
+
+    # As análises rodam em paralelo; cada uma é medida até o momento em que fica pronta
+    inicio = time.perf_counter()
+    analises = {}
+    em_andamento = chat.iter_vulnerability_analyses(
+        {"items": resultados_itens, "data-flow": resultados_fluxo}, docs_para_analise, fanout=fanout
+    )
+    for analysis_type, resposta in em_andamento:
+        analises[analysis_type] = resposta
+        etapa = "analise_items" if analysis_type == "items" else "analise_fluxo"
+        tempos[etapa] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    # Sem memória de relatórios: as execuções repetem as mesmas imagens e mediriam só a consulta
+    gerar_relatorio_pdf(
+        resultados_itens=resultados_itens,
+        descricao_componentes=resultado.get("descricao_componentes", {}),
+        resultados_fluxo=resultados_fluxo,
+        resultado_items=analises["items"],
+        resultado_flow=analises["data-flow"],
+        memorizar=False
+    )
+    tempos["geracao_pdf"] = time.perf_counter() - inicio
+
+    tempos["total"] = time.perf_counter() - inicio_total
+    return tempos
+
+
+def medir(concorrencia, execucoes, imagens, latencia, tokens_por_segundo, latencia_busca, fanout=False,
+          taxa_limitacao=0.0):
+    """
+    Executa `execucoes` pipelines com até `concorrencia` em paralelo e agrega as medições.
+
+    O índice perceptual fica em uma pasta temporária e a exportação de spans é desligada durante a medição,
+    para que o benchmark não grave leituras simuladas nem rastros no .cache do projeto.
+    """
+    cliente = OpenAISimulado(latencia_primeiro_token=latencia, tokens_por_segundo=tokens_por_segundo, semente=42,
+                             taxa_limitacao=taxa_limitacao)
+    search_rag = Search(search_client=SearchClientSimulado(latencia=latencia_busca))
+
+    exportador = rastreamento.rastreador.exportador
+    rastreamento.rastreador.exportador = rastreamento.ExportadorNulo()
+    try:
+        with tempfile.TemporaryDirectory() as diretorio:
+            indice = IndicePerceptual(os.path.join(diretorio, "indice_perceptual.sqlite"))
+            chat = ai_flow.Chat("simulado", model="simulado", cache=CacheDesativado(), client=cliente,
+                                indice_similares=indice)
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+                medicoes = list(executor.map(
+                    lambda i: executar_pipeline(chat, search_rag, imagens[i % len(imagens)], fanout),
+                    range(execucoes)
+                ))
+            duracao = time.perf_counter() - inicio
+    finally:
+        rastreamento.rastreador.exportador = exportador
+
+    por_etapa = defaultdict(list)
+    for tempos in medicoes:
+        for etapa, valor in tempos.items():
+            por_etapa[etapa].append(valor)
+
+    return {
+        "concorrencia": concorrencia,
+        "execucoes": execucoes,
+        "chamadas_recusadas": cliente.recusadas,
+        "uso_tokens": chat.client.estatisticas_uso(),
+        "vazao_por_segundo": execucoes / duracao if duracao else 0.0,
+        "etapas": {
+            etapa: {
+                "p50_ms": percentil(por_etapa[etapa], 50) * 1000,
+                "p95_ms": percentil(por_etapa[etapa], 95) * 1000
+            }
+            for etapa in ETAPAS
+        }
+    }
+
+
+def imprimir(relatorio):
+    print(f"\n=== Concorrência {relatorio['concorrencia']} | {relatorio['execucoes']} execuções | "
+          f"vazão {relatorio['vazao_por_segundo']:.2f} pipelines/s | "
+          f"{relatorio['chamadas_recusadas']} chamadas recusadas com 429 ===")
+    uso = relatorio["uso_tokens"]
+    print(f"tokens de prompt: {uso['tokens_prompt']} ({uso['fracao_cache']:.0%} do cache de prompt)")
+    print(f"{'etapa':<22}{'p50 (ms)':>12}{'p95 (ms)':>12}")
+    for etapa, valores in relatorio["etapas"].items():
+        print(f"{etapa:<22}{valores['p50_ms']:>12.1f}{valores['p95_ms']:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline com OpenAI e Azure Search simulados.")
+    parser.add_argument("--concorrencia", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--execucoes", type=int, default=16, help="Pipelines por nível de concorrência")
+    parser.add_argument("--latencia", type=float, default=0.5, help="Segundos até o primeiro token do LLM")
+    parser.add_argument("--tokens-por-segundo", type=float, default=200.0, help="Velocidade de geração do LLM")
+    parser.add_argument("--latencia-busca", type=float, default=0.15, help="Latência de cada busca no Azure")
+    parser.add_argument("--imagens", default="dataset", help="Diretório com os diagramas usados como entrada")
+    parser.add_argument("--json", default=None, help="Arquivo para gravar o relatório em JSON")
+    parser.add_argument("--fanout", action="store_true",
+                        help="Analisar cada componente e interação em uma requisição própria")
+    parser.add_argument("--taxa-429", type=float, default=0.0,
+                        help="Fração das chamadas ao LLM simulado recusadas com 429 (testa as novas tentativas)")
+    args = parser.parse_args()
+
+    # Os logs por chamada dos módulos do app distorceriam as medições
+    logging.getLogger().setLevel(logging.WARNING)
+
+    imagens = [p.read_bytes() for p in sorted(Path(args.imagens).glob("*.png"))]
+    if not imagens:
+        parser.error(f"Nenhuma imagem .png encontrada em {args.imagens}.")
+
+    relatorios = []
+    for concorrencia in args.concorrencia:
+        relatorio = medir(concorrencia, args.execucoes, imagens, args.latencia, args.tokens_por_segundo,
+                          args.latencia_busca, args.fanout, args.taxa_429)
+        imprimir(relatorio)
+        relatorios.append(relatorio)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(relatorios, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
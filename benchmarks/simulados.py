@@ -0,0 +1,236 @@
+"""
+Substitutos locais do cliente OpenAI e do SearchClient do Azure, com latência configurável.
+
+Permitem medir o pipeline sem chamadas externas. As respostas vêm dos arquivos do projeto:
+a leitura de arquitetura usa as listas de componentes de metricas/respostas retornadas e as análises
+STRIDE usam os exemplos de openai_services/sample_*.txt.
+"""
+import json
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+
+from azure_services.local_search import carregar_documentos_corpus, tokenizar
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.join(SCRIPT_DIR, "..")
+DIRETORIO_RESPOSTAS = os.path.join(RAIZ, "metricas", "respostas retornadas")
+
+
+def _ler(caminho):
+    with open(caminho, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def gerar_resposta_secoes(prompt):
+    """Resposta estruturada da análise por unidades: uma seção para cada item listado no prompt."""
+    lista = prompt.split("Analise somente os seguintes", 1)[1]
+    unidades = [linha.strip()[2:] for linha in lista.split("\n") if linha.strip().startswith("- ")]
+    return json.dumps({
+        "secoes": [
+            {
+                "unidade": unidade,
+                "ameacas": [
+                    {"categoria": "S (Spoofing)", "descricao": f"Identidade falsificada ao acessar {unidade}."},
+                    {"categoria": "T (Tampering)", "descricao": f"Alteração não autorizada da configuração de {unidade}."}
+                ],
+                "justificativa": f"{unidade} é exposto a outros componentes da arquitetura.",
+                "mitigacoes": ["Exigir autenticação forte.", "Registrar e auditar alterações."]
+            }
+            for unidade in unidades
+        ]
+    }, ensure_ascii=False)
+
+
+def carregar_respostas_arquitetura(diretorio=DIRETORIO_RESPOSTAS):
+    """Monta respostas de leitura de arquitetura no formato JSON esperado a partir das listas de componentes."""
+    respostas = []
+    for nome in sorted(os.listdir(diretorio)):
+        componentes = json.loads(_ler(os.path.join(diretorio, nome)))
+        fluxo = "\n".join(
+            f"{i}. {origem} → {destino}: {origem} envia requisições para {destino}."
+            for i, (origem, destino) in enumerate(zip(componentes, componentes[1:]), start=1)
+        )
+        respostas.append(json.dumps({
+            "componentes_identificados": componentes,
+            "descricao_componentes": {c: f"Componente {c} da arquitetura." for c in componentes},
+            "fluxo_aplicacao": fluxo
+        }, ensure_ascii=False))
+    return respostas
+
+
+class CacheDesativado:
+    """Cache que nunca acerta, para que toda leitura de arquitetura passe pelo modelo."""
+
+    hits = 0
+    misses = 0
+    gerar_chave = staticmethod(lambda conteudo, model, prompt_version: "")
+
+    def get(self, chave):
+        return None
+
+    def set(self, chave, valor):
+        pass
+
+    def estatisticas(self):
+        return {"hits": 0, "misses": 0, "entradas": 0, "bytes": 0}
+
+
+class _CompletionsSimuladas:
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+
+    def create(self, model, messages, stream=False, **kwargs):
+        return self.cliente._responder(messages, stream)
+
+
+class OpenAISimulado:
+    """
+    Imita `client.chat.completions.create` da OpenAI.
+
+    Parâmetros:
+        latencia_primeiro_token (float): Segundos até o primeiro token
+        tokens_por_segundo (float): Velocidade de geração; define o tempo total pela quantidade de tokens
+        variacao (float): Fração de variação aleatória aplicada às latências
+        taxa_limitacao (float): Fração das chamadas recusadas com 429 e Retry-After, como sob cota estourada
+    """
+
+    def __init__(self, latencia_primeiro_token=0.5, tokens_por_segundo=200.0, variacao=0.1, semente=None,
+                 taxa_limitacao=0.0, retry_after=0.2):
+        self.latencia_primeiro_token = latencia_primeiro_token
+        self.tokens_por_segundo = tokens_por_segundo
+        self.variacao = variacao
+        self.taxa_limitacao = taxa_limitacao
+        self.retry_after = retry_after
+        self.recusadas = 0
+        # Prefixos já vistos, como no cache de prompt da OpenAI: blocos de 128 tokens a partir de 1024
+        self._prefixos = set()
+        self._random = random.Random(semente)
+        self._lock = threading.Lock()
+        self.chamadas = 0
+
+        self.respostas_arquitetura = carregar_respostas_arquitetura()
+        self.respostas_stride = {
+            "items": _ler(os.path.join(RAIZ, "openai_services", "sample_items.txt")),
+            "data-flow": _ler(os.path.join(RAIZ, "openai_services", "sample_dataflow.txt"))
+        }
+        self.chat = SimpleNamespace(completions=_CompletionsSimuladas(self))
+
+    def _fator(self):
+        with self._lock:
+            return 1 + self._random.uniform(-self.variacao, self.variacao)
+
+    def _escolher_resposta(self, messages):
+        partes = []
+        for mensagem in messages:
+            conteudo = mensagem["content"]
+            partes.extend(conteudo if isinstance(conteudo, list) else [{"type": "text", "text": conteudo}])
+        texto = " ".join(p.get("text", "") for p in partes if p.get("type") == "text")
+
+        with self._lock:
+            self.chamadas += 1
+            chamada = self.chamadas
+
+        if any(p.get("type") == "image_url" for p in partes):
+            return texto, self.respostas_arquitetura[chamada % len(self.respostas_arquitetura)]
+        if "Analise somente os seguintes" in texto:
+            return texto, gerar_resposta_secoes(texto)
+        if "data-flow" in texto:
+            return texto, self.respostas_stride["data-flow"]
+        return texto, self.respostas_stride["items"]
+
+    def _limitar(self):
+        with self._lock:
+            recusar = self._random.random() < self.taxa_limitacao
+            if recusar:
+                self.recusadas += 1
+        if recusar:
+            requisicao = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+            resposta = httpx.Response(429, headers={"retry-after": str(self.retry_after)}, request=requisicao)
+            raise openai.RateLimitError("Rate limit reached (simulado)", response=resposta, body=None)
+
+    def _tokens_em_cache(self, prompt):
+        """Tokens do maior prefixo já enviado antes (múltiplo de 128 tokens, mínimo de 1024), e registra este prompt."""
+        blocos = [hash(prompt[:fim]) for fim in range(1024 * 4, len(prompt) + 1, 128 * 4)]
+        with self._lock:
+            em_cache = 0
+            for i, bloco in enumerate(blocos):
+                if bloco not in self._prefixos:
+                    break
+                em_cache = 1024 + 128 * i
+            self._prefixos.update(blocos)
+        return em_cache
+
+    def _responder(self, messages, stream):
+        self._limitar()
+        prompt, resposta = self._escolher_resposta(messages)
+        # Aproximação de 4 caracteres por token, a mesma de openai_services.contexto sem tiktoken
+        prompt_tokens = max(1, len(prompt) // 4)
+        cached_tokens = self._tokens_em_cache(prompt)
+        completion_tokens = max(1, len(resposta) // 4)
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens)
+        )
+
+        latencia = self.latencia_primeiro_token * self._fator()
+        duracao_geracao = completion_tokens / self.tokens_por_segundo * self._fator()
+
+        if not stream:
+            time.sleep(latencia + duracao_geracao)
+            mensagem = SimpleNamespace(content=resposta, role="assistant")
+            return SimpleNamespace(choices=[SimpleNamespace(message=mensagem, finish_reason="stop")], usage=usage)
+
+        def gerar():
+            time.sleep(latencia)
+            pedacos = [resposta[i:i + 16] for i in range(0, len(resposta), 16)]
+            intervalo = duracao_geracao / max(1, len(pedacos))
+            for pedaco in pedacos:
+                time.sleep(intervalo)
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=pedaco))], usage=None)
+            yield SimpleNamespace(choices=[], usage=usage)
+
+        return gerar()
+
+
+class _ResultadoIndexacao:
+
+    def __init__(self, key):
+        self.key = key
+        self.succeeded = True
+        self.status_code = 201
+
+
+class SearchClientSimulado:
+    """Imita o SearchClient do Azure sobre o corpus local, com latência de rede configurável."""
+
+    def __init__(self, latencia=0.15, documentos=None):
+        self.latencia = latencia
+        self.documentos = documentos if documentos is not None else carregar_documentos_corpus()
+
+    def search(self, topic, top=50, **kwargs):
+        time.sleep(self.latencia)
+        termos = set(tokenizar(topic))
+        resultados = []
+        for documento in self.documentos:
+            score = len(termos & set(tokenizar(documento["conteudo"])))
+            if score:
+                resultados.append({**documento, "@search.score": float(score)})
+        resultados.sort(key=lambda d: d["@search.score"], reverse=True)
+        return iter(resultados[:top])
+
+    def upload_documents(self, documents):
+        time.sleep(self.latencia)
+        return [_ResultadoIndexacao(documento["id"]) for documento in documents]
+
+    def delete_documents(self, documents):
+        time.sleep(self.latencia)
+        return [_ResultadoIndexacao(documento["id"]) for documento in documents]
@@ -1,42 +1,59 @@
 import json
+import os
 
-import requests
-from bs4 import BeautifulSoup
+from services.crawler import Crawler, caminho_estado_consumidor, extrair_conteudo_html
 
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
-def get_conteudo_documentacao(links_file):
-    # Carrega o arquivo com os links e retorna uma lista
-    with open(links_file, 'r') as file:
-        links = set(file.readlines())
-    conteudo_documentacoes = []
-
-    for link in links:
-        link = link.strip()  # Limpa a URL, se necessário
-        print(link)
-        response = requests.get(link)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # Localiza o elemento que contém o conteúdo do artigo
-            conteudo_documentacoes_divs = soup.find_all('div', class_='content')
-            print(conteudo_documentacoes_divs)
-            if conteudo_documentacoes_divs:
-                conteudo = ""
-                for div in conteudo_documentacoes_divs:
-                    paragrafos = div.find_all('p')
-                    # Concatena o texto de todos os parágrafos encontrados em cada div
-                    conteudo += ' ' + ' '.join(p.get_text(strip=True) for p in paragrafos)
-                conteudo_documentacoes.append(conteudo.strip())
-                print(conteudo)
-            else:
-                conteudo_documentacoes.append("Conteúdo não encontrado.")
-        else:
-            conteudo_documentacoes.append(f"Falha ao extrair o conteúdo da documentação): {response.status_code}")
 
-    # Salva o conteúdo em um arquivo JSON
-    with open('documentacao_stride.json', 'w') as json_file:
-        json.dump({"documentacao_stride": conteudo_documentacoes}, json_file)
+def extrair_conteudo(html, url):
+    """Conteúdo principal da página, com a mesma extração usada na indexação (services.crawler)."""
+    return extrair_conteudo_html(html, url)["conteudo"] or "Conteúdo não encontrado."
 
 
-# Chamada da função para extrair os conteúdos
-get_conteudo_documentacao('urls_documentacao_stride.txt')
+def get_conteudo_documentacao(links_file, output_file, crawler=None):
+    # Carrega o arquivo com os links e retorna uma lista sem repetições
+    with open(links_file, 'r') as file:
+        links = list(dict.fromkeys(linha.strip() for linha in file if linha.strip()))
+
+    # Conteúdo já extraído em execuções anteriores, reaproveitado para páginas que não mudaram
+    anteriores = {}
+    if os.path.exists(output_file):
+        with open(output_file, 'r', encoding='utf-8') as json_file:
+            dados = json.load(json_file)
+        anteriores = dict(zip(dados.get("urls", []), dados.get("documentacao_stride", [])))
+
+    crawler = crawler or Crawler(caminho_estado_consumidor("corpus"))
+    conteudos = {}
+    for resultado in crawler.baixar_varias(links):
+        link = resultado["url"]
+        print(f"{link}: {resultado['status']}")
+        if resultado["status"] == "alterada":
+            conteudos[link] = extrair_conteudo(resultado["html"], link)
+        elif resultado["status"] == "inalterada" and link in anteriores:
+            conteudos[link] = anteriores[link]
+        elif resultado["status"] == "inalterada":
+            # Sem conteúdo anterior salvo: baixa novamente sem requisição condicional
+            crawler.esquecer(link)
+            novo = crawler.baixar(link)
+            conteudos[link] = extrair_conteudo(novo["html"], link) if novo["status"] == "alterada" else \
+                f"Falha ao extrair o conteúdo da documentação): {novo.get('erro')}"
+        else:
+            conteudos[link] = f"Falha ao extrair o conteúdo da documentação): {resultado.get('erro')}"
+
+    # Salva o conteúdo em um arquivo JSON, mantendo a ordem do arquivo de links
+    with open(output_file, 'w', encoding='utf-8') as json_file:
+        json.dump({
+            "documentacao_stride": [conteudos[link] for link in links],
+            "urls": links
+        }, json_file)
+    crawler.salvar_estado()
+
+
+# Chamada da função para extrair os conteúdos (execute a partir da raiz do projeto:
+# python -m documentacao_stride.conteudo_documentacao)
+if __name__ == "__main__":
+    get_conteudo_documentacao(
+        os.path.join(SCRIPT_DIR, 'urls_documentacao_stride.txt'),
+        os.path.join(SCRIPT_DIR, 'documentacao_stride.json')
+    )
@@ -1,19 +1,118 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from openai import OpenAI
 import base64
+import hashlib
+import httpx
+import json
 import logging
+import os
+import queue
+import threading
+import time
+
+from openai_services.analise_incremental import (
+    PROMPT_VERSION_SECOES, diferenca_unidades, extrair_secoes, impressao_contexto, montar_relatorio, normalizar_unidade,
+    prompt_secoes, unidades_com_texto
+)
+from openai_services.cache import CacheResultados
+from openai_services.contexto import ORCAMENTO_TOKENS_PADRAO, empacotar_contexto
+from openai_services.modelos_prompt import DIRETORIO_PROMPTS, carregar_exemplo, carregar_modelo
+from openai_services.resiliencia import PRAZO_PADRAO_SEGUNDOS, ClienteResiliente
+from openai_services.saida_estruturada import (
+    FORMATO_JSON, ErroSaidaEstruturada, carregar_json, interpretar_arquitetura, mensagens_correcao
+)
+from services import rastreamento
+from services.hash_perceptual import indice_compartilhado
+from services.imagem import MAX_LADO_PADRAO, preprocessar_imagem
+from services.pdf_arquitetura import eh_pdf, mesclar_resultados, rasterizar_paginas
 
 # Configuração do logging
 logging.basicConfig(level=logging.INFO)
 
+# Limite de conexões HTTP abertas por cliente, compartilhadas entre as chamadas concorrentes
+MAX_CONEXOES = 8
+
+# Versão do prompt de leitura de arquitetura (prompts/arquitetura_v<versão>.txt); altere sempre que o
+# prompt mudar para invalidar o cache
+PROMPT_VERSION_ARQUITETURA = "3"
+
+# Versão do prompt das análises STRIDE (prompts/vulnerabilidade_v<versão>.txt); entra na versão com que as
+# análises são gravadas no histórico (Chat.versao_analise)
+PROMPT_VERSION_VULNERABILIDADE = "2"
+
+# Modelos lidos uma vez, na importação
+PROMPT_ARQUITETURA = carregar_modelo("arquitetura", PROMPT_VERSION_ARQUITETURA).template
+MODELO_VULNERABILIDADE = carregar_modelo("vulnerabilidade", PROMPT_VERSION_VULNERABILIDADE)
+EXEMPLOS_VULNERABILIDADE = {
+    "items": carregar_exemplo("sample_items.txt"),
+    "data-flow": carregar_exemplo("sample_dataflow.txt")
+}
+
+# Quantidade de respostas de arquitetura já interpretadas mantidas em memória por cliente
+MAX_INTERPRETACOES = 32
+
+# Requisições simultâneas por análise no modo fan-out (uma requisição por componente ou interação)
+MAX_CONCORRENCIA_UNIDADES = MAX_CONEXOES
+
+# Modos da análise STRIDE: uma requisição por tipo de análise, só as unidades sem seção em cache, ou uma
+# requisição por unidade
+MODO_COMPLETO = "completo"
+MODO_INCREMENTAL = "incremental"
+MODO_FANOUT = "fanout"
+
+
+def modo_analise(incremental=False, fanout=False):
+    """Modo efetivo da análise para as opções de iter_vulnerability_analyses (o fan-out prevalece)."""
+    if fanout:
+        return MODO_FANOUT
+    return MODO_INCREMENTAL if incremental else MODO_COMPLETO
+
 class Chat:
 
-    def __init__(self, openai_api_key, model):
-        self.client = OpenAI(api_key=openai_api_key)
+    def __init__(self, openai_api_key, model, max_conexoes=MAX_CONEXOES, cache=None,
+                 orcamento_tokens_contexto=ORCAMENTO_TOKENS_PADRAO, max_lado_imagem=MAX_LADO_PADRAO, client=None,
+                 indice_similares=None, balde=None, concorrencia=None, prazo_segundos=PRAZO_PADRAO_SEGUNDOS):
+        self.max_conexoes = max_conexoes
+        self.max_lado_imagem = max_lado_imagem
+        self.orcamento_tokens_contexto = orcamento_tokens_contexto
+        # Estatísticas do último empacotamento de contexto por tipo de análise
+        self.estatisticas_contexto = {}
+        # Estatísticas da última análise incremental por tipo (unidades reaproveitadas e enviadas)
+        self.estatisticas_incrementais = {}
+        # Texto bruto -> resultado da interpretação (dict ou erro), para não repetir o pedido de correção
+        self._interpretacoes = OrderedDict()
+        self._lock_interpretacoes = threading.Lock()
+        self.cache = cache if cache is not None else CacheResultados()
+        # Leituras anteriores pesquisáveis por semelhança visual (diagramas reexportados ou pouco editados)
+        self.indice_similares = indice_similares if indice_similares is not None else indice_compartilhado()
+        self.http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=max_conexoes, max_keepalive_connections=max_conexoes)
+        )
+        # Um cliente compatível pode ser injetado (ex.: o simulado de benchmarks/simulados.py). Todas as
+        # chamadas passam pelo ClienteResiliente, que cuida de cota, concorrência, novas tentativas e prazo;
+        # por isso as novas tentativas do próprio SDK ficam desligadas. Sem `balde` e `concorrencia`, os
+        # limites são os compartilhados pelos clientes da mesma conta (chave de API).
+        self.client = ClienteResiliente(
+            client or OpenAI(api_key=openai_api_key, http_client=self.http_client, max_retries=0),
+            balde=balde, concorrencia=concorrencia, prazo_segundos=prazo_segundos
+        )
         self.model = model
+        self.versao_prompts = f"{PROMPT_VERSION_ARQUITETURA}.{PROMPT_VERSION_VULNERABILIDADE}.{max_lado_imagem}"
+
+    def versao_analise(self, modo, backend):
+        """
+        Versão gravada no histórico com cada análise completa: prompts usados, modo da análise STRIDE (ver
+        modo_analise) e backend de busca. Um relatório só é devolvido do histórico para a mesma combinação.
+        """
+        partes = [self.versao_prompts]
+        if modo != MODO_COMPLETO:
+            partes.append(f"secoes{PROMPT_VERSION_SECOES}")
+        return ".".join([*partes, modo, backend])
 
     def load_prompt(self, filename):
         try:
-            with open('prompts/' + filename, 'r', encoding='utf-8') as f:
+            with open(os.path.join(DIRETORIO_PROMPTS, filename), 'r', encoding='utf-8') as f:
                 conteudo = f.read()
             return conteudo
         except FileNotFoundError:
@@ -23,107 +122,190 @@ class Chat:
             print(f"Erro ao ler o arquivo: {e}")
             return None
     
-    def read_architecture(self, uploaded_file): 
+    def _mensagens_arquitetura(self, conteudo):
+        """Monta as mensagens da análise de arquitetura para os bytes da imagem enviada."""
+        # Reduz e recodifica a imagem antes do envio; conteúdos que não são imagem seguem como estão
+        conteudo, mime, relatorio = preprocessar_imagem(conteudo, max_lado=self.max_lado_imagem)
+        logging.info(f"Pré-processamento da imagem: {relatorio}")
 
-        document = base64.b64encode(uploaded_file.read()).decode("utf-8")
+        document = base64.b64encode(conteudo).decode("utf-8")
+        rastreamento.definir_atributos(bytes_imagem=len(conteudo), bytes_payload=len(document))
         messages = [
             {
                 "role": "user",
                 "content": [
                     {
                         "type": "text",
-                        "text": f"""Você é um agente especialista em arquitetura de sistemas e irá receber uma imagem de arquitetura para análise geral.
-                            Seus objetivos são:
-                            1. Interpretar a arquitetura e montar uma lista de componentes de cada elemento presente na imagem. Exemplo: AWS - S3, AWS - EC2, AWS - ECR, AWS - Lambda.
-                            2. Explicar o que cada componente faz. Exemplo: AWS - S3: serviço de armazenamento em nuvem de arquivos.
-                            3. Explicar o fluxo da aplicação apresentada com base na imagem.
-                            
-                            ⚠️ Responda exclusivamente no formato JSON, utilizando as seguintes chaves:
-
-                            {{
-                            "componentes_identificados": [ "AWS - S3", "AWS - EC2", ... ],
-                            "descricao_componentes": {{
-                                "AWS - S3": "Serviço de armazenamento de objetos em nuvem...",
-                                "AWS - EC2": "Serviço de computação elástica para hospedar aplicações..."
-                            }},
-                            "fluxo_aplicacao": "Descreva aqui o fluxo de como os componentes interagem entre si com base nas setas e estrutura da imagem.
-                            Descreva em itens enumerados, nomeando a interação entre eles como o exemplo a seguir:
-
-                            1. Business users/back-office apps ↔ Customer On-Premises Gateway: Usuários e aplicações locais iniciam conexões via VPN Gateway ou ExpressRoute para o Azure.
-                            2. Customer On-Premises Gateway ↔ Azure Virtual Network Gateway (Hub): O tráfego ingressa na rede hub do SWIFT Integration Layer pela Virtual Network Gateway.
-                            3. Hub Virtual Network ↔ Alliance Connect Virtual Subscription (Peering): Através de Virtual Network Peering, o tráfego é roteado para a assinatura Alliance Connect Virtual.
-                            4. Gateway Subnet ↔ vSRX Untrust NIC (VA ou VB): O Virtual Network Gateway entrega o tráfego à subnet de gateway; o vSRX recebe pela interface Untrust.
-                            5. vSRX Untrust NIC → vSRX Interconnect NIC → vSRX Trust NIC: O appliance Juniper vSRX aplica políticas (NSG, UDR, Policy Set) e encaminha internamente dos lados Untrust para Trust.
-                            
-                            }}
-                            """
+                        "text": PROMPT_ARQUITETURA
                     },
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{document}"
+                            "url": f"data:{mime or 'image/jpeg'};base64,{document}"
                         }
                     }
                 ]
             }
 
         ]
-        logging.info("Enviando mensagem para análise de arquitetura.")
-        stream = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-            )
-        
-        response = stream.choices[0].message.content
-        logging.info("Análise de arquitetura concluída.")
-        return response
-    
-    def check_vulnerability_per_item(self, analysis_type, docs_content, arch_content):
+        return messages
+
+    def _chave_cache_arquitetura(self, conteudo):
+        # O tamanho máximo da imagem muda o que o modelo vê, então também faz parte da chave
+        return self.cache.gerar_chave(conteudo, self.model, f"{PROMPT_VERSION_ARQUITETURA}-{self.max_lado_imagem}")
+
+    def read_architecture(self, uploaded_file): 
+
+        conteudo = uploaded_file.read()
+
+        with rastreamento.span("read_architecture", model=self.model, bytes_upload=len(conteudo)) as span:
+            # Uploads repetidos do mesmo diagrama não chamam o LLM novamente. A chave usa os bytes recebidos:
+            # o pré-processamento da imagem só acontece quando o LLM é chamado
+            chave_cache = self._chave_cache_arquitetura(conteudo)
+            response = self.cache.get(chave_cache)
+            span.definir(cache_hit=response is not None)
+            if response is not None:
+                logging.info(f"Análise de arquitetura recuperada do cache. Estatísticas: {self.cache.estatisticas()}")
+                return response
 
+            if eh_pdf(conteudo):
+                response = self._analisar_pdf(conteudo)
+            else:
+                # O cache guarda o JSON já validado (e corrigido, se foi preciso)
+                response = json.dumps(self.interpretar_arquitetura(self._analisar_imagem(conteudo)),
+                                      ensure_ascii=False)
+
+            self.cache.set(chave_cache, response)
+            self.indice_similares.adicionar(conteudo, self.model, self.versao_prompts, response)
+            logging.info("Análise de arquitetura concluída.")
+            return response
+
+    def buscar_similar(self, conteudo, max_distancia=None):
         """
-        Faz análise STRIDE baseada em conteúdo retornado da busca.
-        
-        Parâmetros:
-            analysis_type (str): 'items' ou 'data-flow'
-            content (list[dict]): Lista com chaves 'id' e 'conteudo'
-            arch_content (str): Conteudo da arquitetura (itens ou dataflow)
+        Procura uma leitura de arquitetura já feita para um diagrama visualmente parecido com `conteudo`.
+
+        Retorna:
+            tuple[int, dict] | None: (distância de Hamming, resultado da leitura) ou None se nenhum estiver
+            dentro do limite.
         """
-        # Construir string formatada para o prompt
-        blocos_documento = []
-        for doc in docs_content:
-            bloco = f"### Documento: {doc['id']}\n{doc['conteudo']}\n"
-            blocos_documento.append(bloco)
+        encontrado = self.indice_similares.buscar(conteudo, self.model, self.versao_prompts, max_distancia)
+        if encontrado is None:
+            return None
+        distancia, resultado = encontrado
+        return distancia, json.loads(resultado)
 
-        content_doc_string = "\n---\n".join(blocos_documento)
+    def _analisar_imagem(self, conteudo):
+        with rastreamento.span("llm.arquitetura", model=self.model):
+            messages = self._mensagens_arquitetura(conteudo)
+            logging.info("Enviando mensagem para análise de arquitetura.")
+            stream = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    response_format=FORMATO_JSON,
+                )
+            rastreamento.registrar_uso(getattr(stream, "usage", None))
+            return stream.choices[0].message.content
 
-        if analysis_type == 'items':
-            with open('openai_services/sample_items.txt', encoding="utf-8") as f:
-                sample = f.read()
-        
-        if analysis_type == 'data-flow':
-            with open('openai_services/sample_dataflow.txt', encoding="utf-8") as f:
-                sample = f.read()
+    def _analisar_pdf(self, conteudo):
+        """
+        Analisa um PDF de arquitetura: as páginas com diagramas são rasterizadas em paralelo, enviadas ao
+        modelo ao mesmo tempo e os resultados por página são mesclados em um único JSON.
+        """
+        paginas = rasterizar_paginas(conteudo)
+        logging.info(f"PDF com {len(paginas)} páginas de diagrama para análise.")
+        if not paginas:
+            raise ValueError("O PDF não contém páginas com diagramas de arquitetura.")
 
+        with ThreadPoolExecutor(max_workers=min(len(paginas), self.max_conexoes)) as executor:
+            futures = [rastreamento.submeter(executor, self._analisar_imagem, imagem) for _, imagem in paginas]
+            respostas = [future.result() for future in futures]
 
-        prompt = f"""
-            Você está prestes a realizar uma análise de vulnerabilidade de arquitetura de sistemas em cloud com base na metodologia STRIDE.
+        resultados = []
+        for (numero, _), resposta in zip(paginas, respostas):
+            try:
+                resultados.append(self.interpretar_arquitetura(resposta))
+            except ErroSaidaEstruturada as e:
+                logging.error(f"Resposta da página {numero} não é um JSON válido ({str(e)}); página ignorada.")
 
-            Abaixo estão os documentos relevantes que contêm diretrizes sobre ameaças e mitigações:
+        return json.dumps(mesclar_resultados(resultados), ensure_ascii=False)
 
-            {content_doc_string}
-            
-            Abaixo está o conteúdo da arquitetura que você deve analisar:
-            {arch_content}
+    def interpretar_arquitetura(self, resposta):
+        """
+        Converte a resposta da leitura de arquitetura em dict validado.
 
-            Com base no conteúdo acima, realize a análise do tipo **{analysis_type}** e forneça:
-            - As ameaças STRIDE relevantes
-            - As justificativas técnicas detalhadas
-            - Recomendações de mitigação detalhadas
-            - E, se possível, uma organização em tópicos por componente ou interação.
+        Tenta primeiro a extração e a correção locais; se falharem, faz um único pedido de correção só com
+        texto, sem repetir a análise da imagem.
 
-            Evite o uso de markdowns, pois será exibido em um streamlit e siga o exemplo a seguir:
-            {sample}
+        Levanta:
+            ErroSaidaEstruturada: Se nem o pedido de correção produzir um JSON válido.
         """
+        chave = hashlib.sha256(resposta.encode("utf-8")).hexdigest()
+        with self._lock_interpretacoes:
+            resultado = self._interpretacoes.get(chave)
+        if resultado is None:
+            resultado = self._interpretar_arquitetura(resposta)
+            with self._lock_interpretacoes:
+                self._interpretacoes[chave] = resultado
+                while len(self._interpretacoes) > MAX_INTERPRETACOES:
+                    self._interpretacoes.popitem(last=False)
+
+        if isinstance(resultado, ErroSaidaEstruturada):
+            raise resultado
+        # Cópia rasa, para que quem recebe possa alterar o resultado sem afetar a memória
+        return dict(resultado)
+
+    def _interpretar_arquitetura(self, resposta):
+        with rastreamento.span("json.parse", caracteres=len(resposta)) as span:
+            try:
+                return interpretar_arquitetura(resposta)
+            except ErroSaidaEstruturada as e:
+                erro = e
+
+            logging.warning(f"Resposta de arquitetura inválida ({str(erro)}); pedindo correção ao modelo.")
+            span.definir(pedido_correcao=True)
+            correcao = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=mensagens_correcao(resposta, erro),
+                    response_format=FORMATO_JSON,
+                )
+            rastreamento.registrar_uso(getattr(correcao, "usage", None))
+            try:
+                return interpretar_arquitetura(correcao.choices[0].message.content)
+            except ErroSaidaEstruturada as e:
+                span.definir(erro_final=str(e))
+                return e
+    
+    def _documentos_prompt(self, analysis_type, docs_content, consulta):
+        """Empacota os documentos no orçamento de tokens e os formata como blocos para o prompt."""
+        # Mantém no prompt apenas os trechos mais relevantes que cabem no orçamento de tokens
+        docs_content, estatisticas = empacotar_contexto(
+            docs_content, consulta=consulta, orcamento_tokens=self.orcamento_tokens_contexto
+        )
+        self.estatisticas_contexto[analysis_type] = estatisticas
+        logging.info(f"Contexto da análise {analysis_type}: {estatisticas}")
+        rastreamento.definir_atributos(
+            tokens_contexto=estatisticas["tokens_enviados"], tokens_contexto_economizados=estatisticas["tokens_economizados"]
+        )
+
+        # Construir string formatada para o prompt
+        blocos_documento = []
+        for doc in docs_content:
+            bloco = f"### Documento: {doc['id']}\n{doc['conteudo']}\n"
+            blocos_documento.append(bloco)
+
+        return "\n---\n".join(blocos_documento)
+
+    def _mensagens_vulnerabilidade(self, analysis_type, docs_content, arch_content):
+        """Monta as mensagens da análise STRIDE, empacotando os documentos no orçamento de tokens."""
+        content_doc_string = self._documentos_prompt(analysis_type, docs_content, arch_content)
+
+        # Instruções e exemplo fixos primeiro; documentos e arquitetura, que mudam a cada diagrama, por último
+        prompt = MODELO_VULNERABILIDADE.substitute(
+            tipo_analise=analysis_type,
+            exemplo=EXEMPLOS_VULNERABILIDADE[analysis_type],
+            documentos=content_doc_string,
+            arquitetura=arch_content
+        )
 
         messages = [
             {
@@ -136,12 +318,305 @@ class Chat:
                 ]
             }
         ]
-        logging.info(f"Enviando mensagem para análise de vulnerabilidade do tipo {analysis_type}.")
-        stream = self.client.chat.completions.create(
+        rastreamento.definir_atributos(bytes_payload=len(prompt.encode("utf-8")))
+        return messages
+
+    def check_vulnerability_per_item(self, analysis_type, docs_content, arch_content):
+
+        """
+        Faz análise STRIDE baseada em conteúdo retornado da busca.
+        
+        Parâmetros:
+            analysis_type (str): 'items' ou 'data-flow'
+            content (list[dict]): Lista com chaves 'id' e 'conteudo'
+            arch_content (str): Conteudo da arquitetura (itens ou dataflow)
+        """
+        with rastreamento.span("check_vulnerability_per_item", analysis_type=analysis_type, model=self.model):
+            messages = self._mensagens_vulnerabilidade(analysis_type, docs_content, arch_content)
+            logging.info(f"Enviando mensagem para análise de vulnerabilidade do tipo {analysis_type}.")
+            stream = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                )
+            rastreamento.registrar_uso(getattr(stream, "usage", None))
+
+            response = stream.choices[0].message.content
+            logging.info(f"Análise de vulnerabilidade do tipo {analysis_type} concluída.")
+            return response
+
+    def check_vulnerability_per_item_stream(self, analysis_type, docs_content, arch_content):
+        """Versão em streaming de check_vulnerability_per_item: devolve o texto em pedaços conforme é gerado."""
+        with rastreamento.span("check_vulnerability_per_item", analysis_type=analysis_type, model=self.model,
+                               streaming=True) as span:
+            messages = self._mensagens_vulnerabilidade(analysis_type, docs_content, arch_content)
+            logging.info(f"Enviando mensagem para análise de vulnerabilidade do tipo {analysis_type} (streaming).")
+            inicio = time.perf_counter()
+            stream = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+            yield from _texto_do_stream(stream, span, inicio)
+            logging.info(f"Análise de vulnerabilidade do tipo {analysis_type} concluída.")
+
+    def _chave_cache_secao(self, analysis_type, texto, contexto):
+        # Texto completo da unidade (com a descrição do passo) e impressão da arquitetura e dos documentos:
+        # a seção só é reaproveitada para exatamente o mesmo prompt
+        chave = f"{analysis_type}\0{normalizar_unidade(texto)}\0{contexto}".encode("utf-8")
+        return self.cache.gerar_chave(chave, self.model, f"secao-{PROMPT_VERSION_SECOES}")
+
+    def _chave_cache_relatorio(self, analysis_type, relatorio):
+        # Seções que compuseram um relatório, consultadas quando ele é a execução anterior de uma nova análise
+        chave = f"{analysis_type}\0relatorio\0{relatorio}".encode("utf-8")
+        return self.cache.gerar_chave(chave, self.model, f"secao-{PROMPT_VERSION_SECOES}")
+
+    def analisar_unidades(self, analysis_type, docs_content, arch_content, unidades, documentos=None):
+        """
+        Análise STRIDE restrita a algumas unidades (componentes ou interações do fluxo), com resposta
+        estruturada em uma seção por unidade.
+
+        Parâmetros:
+            documentos (str): Documentos já empacotados por _documentos_prompt; quando None, são empacotados
+                aqui com as unidades como consulta
+
+        Retorna:
+            dict: Chave normalizada da unidade -> seção (dict com 'ameacas', 'justificativa', 'mitigacoes').
+        """
+        content_doc_string = documentos
+        if content_doc_string is None:
+            content_doc_string = self._documentos_prompt(analysis_type, docs_content, "\n".join(unidades))
+        prompt = prompt_secoes(analysis_type, content_doc_string, arch_content, unidades)
+        rastreamento.definir_atributos(bytes_payload=len(prompt.encode("utf-8")))
+
+        logging.info(f"Enviando {len(unidades)} unidades para análise de vulnerabilidade do tipo {analysis_type}.")
+        resposta = self.client.chat.completions.create(
                 model=self.model,
-                messages=messages,
+                messages=[{"role": "user", "content": [{"type": "text", "text": prompt}]}],
+                response_format=FORMATO_JSON,
             )
-        
-        response = stream.choices[0].message.content
-        logging.info(f"Análise de vulnerabilidade do tipo {analysis_type} concluída.")
-        return response
\ No newline at end of file
+        rastreamento.registrar_uso(getattr(resposta, "usage", None))
+
+        try:
+            return extrair_secoes(carregar_json(resposta.choices[0].message.content), unidades)
+        except ErroSaidaEstruturada as e:
+            logging.error(f"Resposta da análise por unidades inválida ({str(e)}).")
+            return {}
+
+    def check_vulnerability_incremental(self, analysis_type, docs_content, arch_content, anterior=None):
+        """
+        Versão incremental de check_vulnerability_per_item: só as unidades novas ou alteradas desde a
+        execução anterior (e sem seção em cache) vão ao modelo, e o relatório é montado juntando as seções
+        novas com as já conhecidas, na ordem da arquitetura.
+
+        Parâmetros:
+            anterior (dict): Execução anterior do mesmo diagrama, com 'conteudo' (itens ou fluxo) e
+                'relatorio' (texto devolvido por ela). As unidades com o mesmo texto completo reaproveitam
+                a seção daquele relatório; as demais são analisadas de novo
+        """
+        return self._analisar_por_unidades(analysis_type, docs_content, arch_content, anterior)
+
+    def check_vulnerability_fanout(self, analysis_type, docs_content, arch_content, anterior=None,
+                                   max_concorrencia=MAX_CONCORRENCIA_UNIDADES):
+        """
+        Versão fan-out de check_vulnerability_per_item: cada componente ou interação do fluxo vai em uma
+        requisição própria, com até `max_concorrencia` ao mesmo tempo.
+
+        Cada resposta é curta e independente do tamanho da arquitetura, então o tempo total se aproxima
+        do de um único componente. As seções são cacheadas por unidade e a execução `anterior` é
+        aproveitada como no modo incremental.
+        """
+        return self._analisar_por_unidades(analysis_type, docs_content, arch_content, anterior,
+                                           unidades_por_requisicao=1, max_concorrencia=max_concorrencia)
+
+    def _secoes_anteriores(self, analysis_type, anterior):
+        """Seções do relatório da execução anterior (chave normalizada -> seção); vazio se não estiverem em cache."""
+        if not anterior or not anterior.get("relatorio"):
+            return {}
+        em_cache = self.cache.get(self._chave_cache_relatorio(analysis_type, anterior["relatorio"]))
+        if em_cache is None:
+            logging.info(f"Seções da execução anterior ({analysis_type}) fora do cache; nada será reaproveitado.")
+            return {}
+        return {normalizar_unidade(item["unidade"]): item["secao"] for item in json.loads(em_cache)}
+
+    def _analisar_por_unidades(self, analysis_type, docs_content, arch_content, anterior=None,
+                               unidades_por_requisicao=None, max_concorrencia=1):
+        """
+        Reaproveita as seções da execução anterior (unidades sem alteração) e as em cache e envia as
+        unidades restantes em lotes de `unidades_por_requisicao` (todas juntas quando None), com até
+        `max_concorrencia` requisições simultâneas.
+        """
+        with rastreamento.span("check_vulnerability_por_unidades", analysis_type=analysis_type, model=self.model,
+                               unidades_por_requisicao=unidades_por_requisicao or 0) as span:
+            unidades = unidades_com_texto(analysis_type, arch_content)
+            contexto = impressao_contexto(arch_content, docs_content)
+
+            # Só unidades com o mesmo rótulo e o mesmo texto completo da execução anterior são reaproveitadas
+            mantidas = set()
+            diferenca = None
+            if anterior is not None:
+                diferenca = diferenca_unidades(unidades_com_texto(analysis_type, anterior.get("conteudo")), unidades)
+                mantidas = {normalizar_unidade(rotulo) for rotulo, _ in diferenca["mantidas"]}
+            secoes_anteriores = self._secoes_anteriores(analysis_type, anterior) if mantidas else {}
+
+            secoes = {}
+            pendentes = []
+            reaproveitadas = 0
+            for unidade, texto in unidades:
+                chave = normalizar_unidade(unidade)
+                if chave in mantidas and chave in secoes_anteriores:
+                    secoes[chave] = secoes_anteriores[chave]
+                    reaproveitadas += 1
+                    continue
+                em_cache = self.cache.get(self._chave_cache_secao(analysis_type, texto, contexto))
+                if em_cache is None:
+                    pendentes.append((unidade, texto))
+                else:
+                    secoes[chave] = json.loads(em_cache)
+
+            if pendentes:
+                rotulos = [unidade for unidade, _ in pendentes]
+                # Os documentos são empacotados uma vez para todos os lotes: as requisições diferem só na
+                # lista de unidades, no fim do prompt, e o restante é aproveitado pelo cache de prompt
+                documentos = self._documentos_prompt(analysis_type, docs_content, "\n".join(rotulos))
+                tamanho = unidades_por_requisicao or len(rotulos)
+                lotes = [rotulos[i:i + tamanho] for i in range(0, len(rotulos), tamanho)]
+                with ThreadPoolExecutor(max_workers=max(1, min(len(lotes), max_concorrencia))) as executor:
+                    futures = [
+                        rastreamento.submeter(executor, self.analisar_unidades, analysis_type, docs_content,
+                                              arch_content, lote, documentos)
+                        for lote in lotes
+                    ]
+                    for future in as_completed(futures):
+                        secoes.update(future.result())
+
+                for unidade, texto in pendentes:
+                    chave = normalizar_unidade(unidade)
+                    if chave in secoes:
+                        self.cache.set(self._chave_cache_secao(analysis_type, texto, contexto),
+                                       json.dumps(secoes[chave]))
+
+            relatorio = montar_relatorio([unidade for unidade, _ in unidades], secoes)
+            # Guarda de que seções o relatório foi montado, para a próxima versão do diagrama reaproveitá-las
+            self.cache.set(self._chave_cache_relatorio(analysis_type, relatorio), json.dumps([
+                {"unidade": unidade, "texto": texto, "secao": secoes[normalizar_unidade(unidade)]}
+                for unidade, texto in unidades if normalizar_unidade(unidade) in secoes
+            ]))
+
+            estatisticas = {
+                "unidades": len(unidades),
+                "reaproveitadas": reaproveitadas,
+                "em_cache": len(unidades) - reaproveitadas - len(pendentes),
+                "enviadas": len(pendentes),
+                "requisicoes": -(-len(pendentes) // (unidades_por_requisicao or len(pendentes) or 1))
+            }
+            if diferenca is not None:
+                estatisticas.update(novas=len(diferenca["novas"]), alteradas=len(diferenca["alteradas"]),
+                                    removidas=len(diferenca["removidas"]))
+            self.estatisticas_incrementais[analysis_type] = estatisticas
+            span.definir(**estatisticas)
+            logging.info(f"Análise por unidades do tipo {analysis_type}: {estatisticas}")
+
+            return relatorio
+
+    def iter_vulnerability_analyses(self, analyses, docs_content, incremental=False, anteriores=None, fanout=False):
+        """
+        Executa várias análises STRIDE ao mesmo tempo e devolve cada resultado assim que fica pronto.
+
+        Parâmetros:
+            analyses (dict): Tipo de análise ('items', 'data-flow', ...) -> conteúdo da arquitetura
+            docs_content (list[dict] | dict): Lista com chaves 'id' e 'conteudo', compartilhada por todas as
+                análises, ou dict tipo de análise -> lista específica daquela análise
+            incremental (bool): Usa check_vulnerability_incremental, reaproveitando as seções em cache
+            anteriores (dict): Tipo de análise -> execução anterior ('conteudo' e 'relatorio'), nos modos
+                incremental e fan-out
+            fanout (bool): Usa check_vulnerability_fanout, com uma requisição por componente ou interação
+
+        Retorna:
+            Iterator[tuple[str, str]]: Pares (analysis_type, resposta) na ordem em que terminam.
+        """
+        anteriores = anteriores or {}
+        max_workers = max(1, min(len(analyses), self.max_conexoes))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for analysis_type, arch_content in analyses.items():
+                docs = docs_content.get(analysis_type, []) if isinstance(docs_content, dict) else docs_content
+                if fanout:
+                    future = rastreamento.submeter(
+                        executor, self.check_vulnerability_fanout, analysis_type, docs, arch_content,
+                        anteriores.get(analysis_type)
+                    )
+                elif incremental:
+                    future = rastreamento.submeter(
+                        executor, self.check_vulnerability_incremental, analysis_type, docs, arch_content,
+                        anteriores.get(analysis_type)
+                    )
+                else:
+                    future = rastreamento.submeter(
+                        executor, self.check_vulnerability_per_item, analysis_type, docs, arch_content
+                    )
+                futures[future] = analysis_type
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+    def check_vulnerabilities(self, analyses, docs_content, incremental=False, anteriores=None, fanout=False):
+        """
+        Versão bloqueante de iter_vulnerability_analyses: aguarda todas as análises e retorna um dict
+        tipo de análise -> resposta. O tempo total é o da análise mais lenta, não a soma delas.
+        """
+        return dict(self.iter_vulnerability_analyses(analyses, docs_content, incremental, anteriores, fanout))
+
+    def iter_vulnerability_analyses_stream(self, analyses, docs_content):
+        """
+        Executa várias análises STRIDE em streaming ao mesmo tempo, intercalando os pedaços de texto.
+
+        Parâmetros iguais aos de iter_vulnerability_analyses.
+
+        Retorna:
+            Iterator[tuple[str, str | None]]: Pares (analysis_type, pedaço de texto). Um pedaço None indica
+            que aquela análise terminou.
+        """
+        fila = queue.Queue()
+
+        def consumir(analysis_type, docs, arch_content):
+            try:
+                for delta in self.check_vulnerability_per_item_stream(analysis_type, docs, arch_content):
+                    fila.put((analysis_type, delta))
+                fila.put((analysis_type, None))
+            except Exception as e:
+                fila.put((analysis_type, e))
+
+        max_workers = max(1, min(len(analyses), self.max_conexoes))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for analysis_type, arch_content in analyses.items():
+                docs = docs_content.get(analysis_type, []) if isinstance(docs_content, dict) else docs_content
+                rastreamento.submeter(executor, consumir, analysis_type, docs, arch_content)
+
+            pendentes = len(analyses)
+            while pendentes:
+                analysis_type, delta = fila.get()
+                if isinstance(delta, Exception):
+                    raise delta
+                if delta is None:
+                    pendentes -= 1
+                yield analysis_type, delta
+
+
+def _texto_do_stream(stream, span=None, inicio=None):
+    """
+    Extrai os pedaços de texto dos chunks de uma resposta em streaming.
+
+    O último chunk (sem choices) traz o consumo de tokens, registrado em `span` quando informado, junto
+    com o tempo até o primeiro token contado a partir de `inicio` (time.perf_counter() antes do envio).
+    """
+    inicio = time.perf_counter() if inicio is None else inicio
+    primeiro = True
+    for chunk in stream:
+        if span is not None and getattr(chunk, "usage", None):
+            span.definir(**rastreamento.atributos_uso(chunk.usage))
+        if chunk.choices and chunk.choices[0].delta.content:
+            if primeiro and span is not None:
+                # Tempo até o primeiro token: cai quando o prefixo do prompt é aproveitado do cache
+                span.definir(ms_primeiro_token=round((time.perf_counter() - inicio) * 1000, 1))
+            primeiro = False
+            yield chunk.choices[0].delta.content
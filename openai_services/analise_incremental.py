@@ -0,0 +1,212 @@
+import hashlib
+import json
+import re
+import unicodedata
+
+from openai_services.modelos_prompt import carregar_modelo
+from services.recuperacao import extrair_passos_fluxo
+
+# Versão do prompt (prompts/secoes_v<versão>.txt) e do formato das seções; altere para invalidar as seções em cache
+PROMPT_VERSION_SECOES = "2"
+
+MODELO_SECOES = carregar_modelo("secoes", PROMPT_VERSION_SECOES)
+
+CATEGORIAS_STRIDE = (
+    "S (Spoofing)",
+    "T (Tampering)",
+    "R (Repudiation)",
+    "I (Information Disclosure)",
+    "D (Denial of Service)",
+    "E (Elevation of Privilege)"
+)
+
+# Linha que ocupa, no relatório, o lugar da seção de uma unidade que o modelo não devolveu
+AVISO_SEM_ANALISE = "Análise não retornada pelo modelo."
+
+_PADRAO_NUMERO_PASSO = re.compile(r'^\s*\d+[.)]\s+')
+_PADRAO_TRACOS = re.compile(r'[‐-―−]')
+_PADRAO_CATEGORIA = re.compile(r'^\s*([STRIDE])\b')
+
+
+def normalizar_unidade(texto):
+    """Chave de comparação de um componente ou passo: sem acentos, caixa, numeração ou variações de traço."""
+    texto = _PADRAO_NUMERO_PASSO.sub('', str(texto))
+    texto = _PADRAO_TRACOS.sub('-', texto)
+    texto = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    return " ".join(texto.casefold().split())
+
+
+def rotulo_passo(passo):
+    """
+    Identidade de um passo do fluxo: a interação antes dos ':' (ex.: 'API Gateway → Lambda').
+
+    A descrição depois dos ':' não identifica o passo, mas faz parte do texto comparado entre versões
+    (ver unidades_com_texto).
+    """
+    passo = _PADRAO_NUMERO_PASSO.sub('', passo).strip()
+    interacao, separador, _ = passo.partition(':')
+    return interacao.strip() if separador and interacao.strip() else passo
+
+
+def unidades_com_texto(analysis_type, arch_content):
+    """
+    Divide o conteúdo da arquitetura nas unidades analisadas separadamente: componentes para 'items' e
+    interações do fluxo para 'data-flow'.
+
+    Retorna:
+        list[tuple[str, str]]: (rótulo, texto completo) de cada unidade, sem repetições, na ordem original.
+        Para um passo do fluxo o texto é o passo inteiro, com a descrição; para um componente, o nome.
+    """
+    if analysis_type == "data-flow":
+        pares = [(rotulo_passo(passo), _PADRAO_NUMERO_PASSO.sub('', passo).strip())
+                 for passo in extrair_passos_fluxo(arch_content)]
+    elif isinstance(arch_content, str):
+        pares = [(linha.strip(), linha.strip()) for linha in arch_content.split('\n') if linha.strip()]
+    else:
+        pares = [(str(item).strip(), str(item).strip()) for item in arch_content or [] if str(item).strip()]
+
+    unidades = []
+    vistas = set()
+    for rotulo, texto in pares:
+        chave = normalizar_unidade(rotulo)
+        if chave and chave not in vistas:
+            vistas.add(chave)
+            unidades.append((rotulo, texto))
+    return unidades
+
+
+def unidades_da_analise(analysis_type, arch_content):
+    """Rótulos das unidades de unidades_com_texto, na ordem original."""
+    return [rotulo for rotulo, _ in unidades_com_texto(analysis_type, arch_content)]
+
+
+def impressao_contexto(arch_content, docs_content):
+    """
+    SHA-256 da arquitetura e dos documentos recuperados: o que, além da unidade, o modelo recebe no prompt.
+
+    Entra na chave das seções em cache, para que uma seção só seja reaproveitada para a mesma arquitetura
+    e os mesmos documentos.
+    """
+    digest = hashlib.sha256(json.dumps(arch_content, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    for doc in docs_content or []:
+        digest.update(b"\0" + str(doc.get("id", "")).encode("utf-8"))
+        digest.update(b"\0" + str(doc.get("conteudo", "")).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def diferenca_unidades(anteriores, atuais):
+    """
+    Compara as unidades (rótulo, texto completo) de uma execução anterior com as atuais.
+
+    Retorna:
+        dict: 'novas' (rótulo ausente antes), 'alteradas' (mesmo rótulo com outro texto) e 'mantidas'
+        (mesmo rótulo e texto), na ordem de `atuais`, e 'removidas', na ordem de `anteriores`. Todas são
+        listas de pares (rótulo, texto).
+    """
+    textos_anteriores = {normalizar_unidade(rotulo): normalizar_unidade(texto) for rotulo, texto in anteriores}
+    chaves_atuais = {normalizar_unidade(rotulo) for rotulo, _ in atuais}
+    diferenca = {"novas": [], "alteradas": [], "mantidas": []}
+    for rotulo, texto in atuais:
+        anterior = textos_anteriores.get(normalizar_unidade(rotulo))
+        if anterior is None:
+            diferenca["novas"].append((rotulo, texto))
+        elif anterior != normalizar_unidade(texto):
+            diferenca["alteradas"].append((rotulo, texto))
+        else:
+            diferenca["mantidas"].append((rotulo, texto))
+    diferenca["removidas"] = [(r, t) for r, t in anteriores if normalizar_unidade(r) not in chaves_atuais]
+    return diferenca
+
+
+def _categoria(texto):
+    correspondencia = _PADRAO_CATEGORIA.match(str(texto))
+    if correspondencia is None:
+        return str(texto).strip()
+    letra = correspondencia.group(1)
+    return next(categoria for categoria in CATEGORIAS_STRIDE if categoria.startswith(letra))
+
+
+def formatar_secao(numero, unidade, secao):
+    """
+    Converte a seção estruturada de uma unidade no texto do relatório, no mesmo formato dos exemplos
+    (Ameaças / Justificativa / Mitigação) reconhecido por services.gerar_pdf._classificar_linha.
+    """
+    linhas = [f"{numero}. {unidade}", "Ameaças:"]
+    for ameaca in secao.get("ameacas", []):
+        linhas.append(f"{_categoria(ameaca.get('categoria', ''))} – {ameaca.get('descricao', '').strip()}")
+    if secao.get("justificativa"):
+        linhas.append(f"Justificativa: {secao['justificativa'].strip()}")
+    linhas.append("Mitigação:")
+    for mitigacao in secao.get("mitigacoes", []):
+        linhas.append(f"• {str(mitigacao).strip()}")
+    return "\n".join(linhas)
+
+
+def montar_relatorio(unidades, secoes):
+    """Junta as seções na ordem das unidades; unidades sem seção aparecem indicadas no relatório."""
+    blocos = []
+    for numero, unidade in enumerate(unidades, start=1):
+        secao = secoes.get(normalizar_unidade(unidade))
+        if secao is None:
+            blocos.append(f"{numero}. {unidade}\n{AVISO_SEM_ANALISE}")
+        else:
+            blocos.append(formatar_secao(numero, unidade, secao))
+    return "\n\n".join(blocos)
+
+
+def relatorio_incompleto(relatorio):
+    """Indica se alguma unidade do relatório ficou sem análise (ex.: resposta estruturada inválida)."""
+    return f"\n{AVISO_SEM_ANALISE}" in relatorio
+
+
+def _secao_valida(secao):
+    return (
+        isinstance(secao, dict)
+        and isinstance(secao.get("ameacas", []), list)
+        and all(isinstance(ameaca, dict) for ameaca in secao.get("ameacas", []))
+        and isinstance(secao.get("justificativa", ""), str)
+        and isinstance(secao.get("mitigacoes", []), list)
+    )
+
+
+def extrair_secoes(dados, unidades):
+    """
+    Associa as seções da resposta estruturada às unidades pedidas, pelo nome normalizado.
+
+    Quando o modelo reescreve alguns nomes, as seções sem correspondência são associadas pela posição às
+    unidades que ficaram sem seção, desde que as duas quantidades sejam iguais.
+
+    Retorna:
+        dict: Chave normalizada da unidade -> seção.
+    """
+    recebidas = [secao for secao in dados.get("secoes", []) if _secao_valida(secao)]
+    pedidas = list(dict.fromkeys(normalizar_unidade(unidade) for unidade in unidades))
+
+    secoes = {}
+    sem_correspondencia = []
+    for secao in recebidas:
+        chave = normalizar_unidade(secao.get("unidade", ""))
+        if chave in pedidas:
+            secoes.setdefault(chave, secao)
+        else:
+            sem_correspondencia.append(secao)
+
+    faltantes = [chave for chave in pedidas if chave not in secoes]
+    if faltantes and len(faltantes) == len(sem_correspondencia):
+        secoes.update(zip(faltantes, sem_correspondencia))
+    return secoes
+
+
+def prompt_secoes(analysis_type, content_doc_string, arch_content, unidades):
+    """
+    Prompt da análise STRIDE restrita a `unidades`, com resposta em JSON com uma seção por unidade.
+
+    A lista de unidades fica no fim: as requisições de uma mesma análise (ex.: no fan-out) compartilham
+    todo o resto como prefixo.
+    """
+    return MODELO_SECOES.substitute(
+        tipo_unidades="componentes" if analysis_type == "items" else "interações do fluxo de dados",
+        documentos=content_doc_string,
+        arquitetura=arch_content,
+        unidades="\n".join(f"- {unidade}" for unidade in unidades)
+    )
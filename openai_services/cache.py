@@ -0,0 +1,130 @@
+from contextlib import contextmanager
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# Configuração do logging
+logging.basicConfig(level=logging.INFO)
+
+# Local padrão do cache persistente (relativo à raiz do projeto, como os demais arquivos do app)
+CAMINHO_CACHE = os.path.join('.cache', 'resultados_llm.sqlite')
+
+
+class CacheResultados:
+    """
+    Cache persistente (SQLite) de respostas do LLM endereçado por conteúdo.
+
+    As entradas expiram após `ttl_segundos` e, quando o número de entradas ou o tamanho total
+    passam dos limites, as menos usadas recentemente (LRU) são removidas.
+    """
+
+    def __init__(self, caminho=CAMINHO_CACHE, ttl_segundos=7 * 24 * 3600, max_entradas=1000,
+                 max_bytes=50 * 1024 * 1024):
+        self.caminho = caminho
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        diretorio = os.path.dirname(caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+        with self._conectar() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cache (
+                    chave TEXT PRIMARY KEY,
+                    valor TEXT NOT NULL,
+                    tamanho INTEGER NOT NULL,
+                    criado_em REAL NOT NULL,
+                    acessado_em REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_acessado_em ON cache (acessado_em)")
+
+    @contextmanager
+    def _conectar(self):
+        conn = sqlite3.connect(self.caminho, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def gerar_chave(conteudo, model, prompt_version):
+        """Gera a chave SHA-256 a partir dos bytes do arquivo, do modelo e da versão do prompt."""
+        digest = hashlib.sha256()
+        digest.update(conteudo)
+        digest.update(b'\0' + model.encode('utf-8'))
+        digest.update(b'\0' + str(prompt_version).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, chave):
+        """Retorna o valor armazenado para a chave ou None se não existir ou estiver expirado."""
+        agora = time.time()
+        with self._lock, self._conectar() as conn:
+            linha = conn.execute("SELECT valor, criado_em FROM cache WHERE chave = ?", (chave,)).fetchone()
+
+            if linha is None or agora - linha[1] > self.ttl_segundos:
+                if linha is not None:
+                    conn.execute("DELETE FROM cache WHERE chave = ?", (chave,))
+                self.misses += 1
+                return None
+
+            conn.execute("UPDATE cache SET acessado_em = ? WHERE chave = ?", (agora, chave))
+            self.hits += 1
+            return linha[0]
+
+    def set(self, chave, valor):
+        """Armazena o valor e aplica as políticas de expiração e de tamanho."""
+        agora = time.time()
+        tamanho = len(valor.encode('utf-8'))
+        with self._lock, self._conectar() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (chave, valor, tamanho, criado_em, acessado_em) VALUES (?, ?, ?, ?, ?)",
+                (chave, valor, tamanho, agora, agora)
+            )
+            self._remover_excedentes(conn, agora)
+
+    def _remover_excedentes(self, conn, agora):
+        conn.execute("DELETE FROM cache WHERE criado_em < ?", (agora - self.ttl_segundos,))
+
+        total_entradas, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM cache").fetchone()
+        if total_entradas <= self.max_entradas and total_bytes <= self.max_bytes:
+            return
+
+        # Remove as entradas menos acessadas até voltar aos limites
+        for chave, tamanho in conn.execute("SELECT chave, tamanho FROM cache ORDER BY acessado_em ASC").fetchall():
+            if total_entradas <= self.max_entradas and total_bytes <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM cache WHERE chave = ?", (chave,))
+            total_entradas -= 1
+            total_bytes -= tamanho
+
+    def limpar(self):
+        """Remove todas as entradas e zera os contadores."""
+        with self._lock, self._conectar() as conn:
+            conn.execute("DELETE FROM cache")
+        self.hits = 0
+        self.misses = 0
+
+    def estatisticas(self):
+        """Retorna os contadores de acerto/erro e o tamanho atual do cache."""
+        with self._conectar() as conn:
+            total_entradas, total_bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM cache"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entradas": total_entradas,
+            "bytes": total_bytes
+        }
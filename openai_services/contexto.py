@@ -0,0 +1,150 @@
+import re
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken é opcional; sem ele a contagem é aproximada
+    tiktoken = None
+
+# Orçamento padrão de tokens para os documentos de apoio enviados em cada análise
+ORCAMENTO_TOKENS_PADRAO = 3000
+
+# Similaridade (Jaccard de 3-gramas de palavras) a partir da qual um parágrafo é considerado repetido
+LIMIAR_DUPLICADO = 0.8
+
+# Trechos menores que isso não compensam ser truncados para caber no que sobrou do orçamento
+MIN_TOKENS_TRECHO = 40
+
+_PADRAO_PALAVRA = re.compile(r"\w+")
+_PADRAO_FRASE = re.compile(r"(?<=[.!?])\s+")
+
+_encoding = None
+
+
+def contar_tokens(texto):
+    """Conta os tokens do texto com tiktoken, quando instalado, ou pela aproximação de 4 caracteres por token."""
+    global _encoding
+    if not texto:
+        return 0
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        return len(_encoding.encode(texto))
+    return max(1, len(texto) // 4)
+
+
+def _dividir_paragrafos(conteudo):
+    """Divide o conteúdo em parágrafos; textos sem quebra de linha são agrupados em blocos de frases."""
+    paragrafos = [p.strip() for p in re.split(r"\n\s*\n|\n", conteudo) if p.strip()]
+    if len(paragrafos) > 1:
+        return paragrafos
+
+    # Conteúdo extraído das páginas costuma vir em uma única linha
+    blocos, atual = [], []
+    for frase in _PADRAO_FRASE.split(conteudo.strip()):
+        atual.append(frase)
+        if len(atual) == 4:
+            blocos.append(" ".join(atual))
+            atual = []
+    if atual:
+        blocos.append(" ".join(atual))
+    return blocos
+
+
+def _shingles(texto):
+    palavras = _PADRAO_PALAVRA.findall(texto.lower())
+    if len(palavras) < 3:
+        return {tuple(palavras)}
+    return {tuple(palavras[i:i + 3]) for i in range(len(palavras) - 2)}
+
+
+def _truncar(texto, max_tokens):
+    """Trunca o texto no limite de tokens, preferindo terminar em fim de frase."""
+    frases = _PADRAO_FRASE.split(texto)
+    resultado = ""
+    for frase in frases:
+        candidato = f"{resultado} {frase}".strip()
+        if contar_tokens(candidato) > max_tokens:
+            break
+        resultado = candidato
+    if not resultado:
+        # Nenhuma frase inteira coube: busca binária pela maior quantidade de palavras que cabe
+        palavras = texto.split()
+        baixo, alto = 0, len(palavras)
+        while baixo < alto:
+            meio = (baixo + alto + 1) // 2
+            if contar_tokens(" ".join(palavras[:meio])) <= max_tokens:
+                baixo = meio
+            else:
+                alto = meio - 1
+        resultado = " ".join(palavras[:baixo])
+    return resultado
+
+
+def empacotar_contexto(docs_content, consulta="", orcamento_tokens=ORCAMENTO_TOKENS_PADRAO):
+    """
+    Seleciona os trechos dos documentos que cabem no orçamento de tokens.
+
+    Os parágrafos quase repetidos são removidos e os restantes são ordenados pela sobreposição de termos
+    com a consulta (conteúdo da arquitetura), desempatando pela ordem de relevância da busca.
+
+    Parâmetros:
+        docs_content (list[dict]): Lista com chaves 'id' e 'conteudo', na ordem de relevância
+        consulta (str): Texto usado para priorizar os parágrafos
+        orcamento_tokens (int): Máximo de tokens de documentos no prompt
+
+    Retorna:
+        tuple[list[dict], dict]: Documentos empacotados (mesmo formato da entrada) e estatísticas com
+        tokens originais, tokens enviados, tokens economizados e parágrafos duplicados removidos.
+    """
+    termos_consulta = set(_PADRAO_PALAVRA.findall(str(consulta).lower()))
+
+    tokens_originais = 0
+    paragrafos = []
+    shingles_vistos = []
+    duplicados = 0
+    for ordem_doc, doc in enumerate(docs_content):
+        tokens_originais += contar_tokens(doc["conteudo"])
+        for ordem_par, paragrafo in enumerate(_dividir_paragrafos(doc["conteudo"])):
+            shingles = _shingles(paragrafo)
+            if any(len(shingles & outro) / len(shingles | outro) >= LIMIAR_DUPLICADO for outro in shingles_vistos):
+                duplicados += 1
+                continue
+            shingles_vistos.append(shingles)
+
+            sobreposicao = len(termos_consulta & set(_PADRAO_PALAVRA.findall(paragrafo.lower())))
+            paragrafos.append((-sobreposicao, ordem_doc, ordem_par, doc["id"], paragrafo))
+
+    selecionados = []
+    tokens_usados = 0
+    for chave in sorted(paragrafos):
+        paragrafo = chave[4]
+        tokens = contar_tokens(paragrafo)
+        restante = orcamento_tokens - tokens_usados
+        if tokens > restante:
+            if restante < MIN_TOKENS_TRECHO:
+                break
+            paragrafo = _truncar(paragrafo, restante)
+            if not paragrafo:
+                break
+            tokens = contar_tokens(paragrafo)
+        selecionados.append((chave[1], chave[2], chave[3], paragrafo))
+        tokens_usados += tokens
+
+    # Remonta os documentos mantendo a ordem original dos trechos selecionados
+    docs_empacotados = []
+    por_doc = {}
+    for ordem_doc, _, doc_id, paragrafo in sorted(selecionados):
+        if doc_id not in por_doc:
+            por_doc[doc_id] = []
+            docs_empacotados.append({"id": doc_id, "conteudo": None})
+        por_doc[doc_id].append(paragrafo)
+    for doc in docs_empacotados:
+        doc["conteudo"] = "\n".join(por_doc[doc["id"]])
+
+    estatisticas = {
+        "tokens_originais": tokens_originais,
+        "tokens_enviados": tokens_usados,
+        "tokens_economizados": max(0, tokens_originais - tokens_usados),
+        "paragrafos_duplicados": duplicados
+    }
+    return docs_empacotados, estatisticas
@@ -0,0 +1,26 @@
+import os
+from string import Template
+
+DIRETORIO_OPENAI_SERVICES = os.path.dirname(os.path.abspath(__file__))
+DIRETORIO_PROMPTS = os.path.join(DIRETORIO_OPENAI_SERVICES, "..", "prompts")
+
+
+def carregar_modelo(nome, versao):
+    """
+    Lê o modelo prompts/<nome>_v<versao>.txt. Os módulos chamam na importação, então cada arquivo é lido
+    uma única vez por processo.
+
+    Os modelos começam pelas instruções fixas e terminam no conteúdo de cada requisição, para que as
+    chamadas compartilhem o maior prefixo possível e aproveitem o cache de prompt da OpenAI.
+
+    Retorna:
+        string.Template: Modelo com os campos no formato $campo.
+    """
+    with open(os.path.join(DIRETORIO_PROMPTS, f"{nome}_v{versao}.txt"), "r", encoding="utf-8") as f:
+        return Template(f.read())
+
+
+def carregar_exemplo(nome):
+    """Lê um dos exemplos de relatório de openai_services (sample_items.txt ou sample_dataflow.txt)."""
+    with open(os.path.join(DIRETORIO_OPENAI_SERVICES, nome), "r", encoding="utf-8") as f:
+        return f.read()
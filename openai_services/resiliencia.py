@@ -0,0 +1,386 @@
+from email.utils import parsedate_to_datetime
+from types import SimpleNamespace
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+
+import openai
+
+from openai_services.contexto import contar_tokens
+from services import rastreamento
+
+# Cota de cada conta na OpenAI; o balde da conta mantém as chamadas do processo abaixo dela
+REQUISICOES_POR_MINUTO = int(os.environ.get("OPENAI_RPM", "500"))
+TOKENS_POR_MINUTO = int(os.environ.get("OPENAI_TPM", "200000"))
+
+# Concorrência adaptativa: começa em INICIAL, cresce 1 a cada janela sem erros e cai pela metade em sobrecarga
+CONCORRENCIA_INICIAL = int(os.environ.get("OPENAI_CONCORRENCIA_INICIAL", "4"))
+CONCORRENCIA_MAXIMA = int(os.environ.get("OPENAI_CONCORRENCIA_MAXIMA", "16"))
+FATOR_REDUCAO = 0.5
+# Sobrecargas seguidas dentro deste intervalo contam como uma só redução
+INTERVALO_REDUCAO_SEGUNDOS = 2.0
+
+# Tentativas por chamada e prazo total de cada chamada, somando esperas e tentativas
+MAX_TENTATIVAS = 5
+PRAZO_PADRAO_SEGUNDOS = float(os.environ.get("OPENAI_PRAZO_SEGUNDOS", "300"))
+ESPERA_BASE_SEGUNDOS = 1.0
+ESPERA_MAXIMA_SEGUNDOS = 60.0
+
+# Estimativa de tokens reservados antes da chamada; a diferença é acertada com o `usage` da resposta
+TOKENS_POR_IMAGEM = 1000
+TOKENS_RESPOSTA_ESTIMADOS = 1500
+
+
+class ErroPrazoEsgotado(TimeoutError):
+    """A chamada não terminou dentro do prazo, contando filas, esperas entre tentativas e a própria requisição."""
+
+
+class BaldeTaxa:
+    """
+    Balde de fichas com dois limites por minuto, requisições e tokens, compartilhado entre as threads.
+
+    Os dois baldes começam cheios e são reabastecidos continuamente; uma chamada espera até que haja
+    fichas para ela nos dois. Um limite None ou 0 desativa o balde correspondente.
+    """
+
+    def __init__(self, requisicoes_por_minuto=REQUISICOES_POR_MINUTO, tokens_por_minuto=TOKENS_POR_MINUTO):
+        self.requisicoes_por_minuto = requisicoes_por_minuto or 0
+        self.tokens_por_minuto = tokens_por_minuto or 0
+        self.requisicoes = float(self.requisicoes_por_minuto)
+        self.tokens = float(self.tokens_por_minuto)
+        self._atualizado_em = time.monotonic()
+        self._pausado_ate = 0.0
+        self._lock = threading.Lock()
+
+    def _repor(self, agora):
+        # Chamado com o lock adquirido
+        decorrido = agora - self._atualizado_em
+        self._atualizado_em = agora
+        if self.requisicoes_por_minuto:
+            self.requisicoes = min(self.requisicoes_por_minuto,
+                                   self.requisicoes + decorrido * self.requisicoes_por_minuto / 60)
+        if self.tokens_por_minuto:
+            self.tokens = min(self.tokens_por_minuto, self.tokens + decorrido * self.tokens_por_minuto / 60)
+
+    def _espera(self, agora, tokens):
+        # Chamado com o lock adquirido
+        espera = self._pausado_ate - agora
+        if self.requisicoes_por_minuto and self.requisicoes < 1:
+            espera = max(espera, (1 - self.requisicoes) * 60 / self.requisicoes_por_minuto)
+        if self.tokens_por_minuto and self.tokens < tokens:
+            espera = max(espera, (tokens - self.tokens) * 60 / self.tokens_por_minuto)
+        return espera
+
+    def adquirir(self, tokens, prazo=None):
+        """
+        Bloqueia até haver uma requisição e `tokens` disponíveis e os consome.
+
+        Levanta:
+            ErroPrazoEsgotado: Se a espera ultrapassar o `prazo` (instante de time.monotonic()).
+        """
+        if self.tokens_por_minuto:
+            # Uma chamada maior que a cota por minuto nunca caberia no balde
+            tokens = min(tokens, self.tokens_por_minuto)
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._repor(agora)
+                espera = self._espera(agora, tokens)
+                if espera <= 0:
+                    self.requisicoes -= 1
+                    self.tokens -= tokens
+                    return
+            if prazo is not None and agora + espera > prazo:
+                raise ErroPrazoEsgotado("Prazo esgotado aguardando a cota de requisições e tokens.")
+            time.sleep(espera)
+
+    def ajustar(self, diferenca_tokens):
+        """Acerta a reserva com o consumo real: positivo cobra tokens a mais, negativo devolve."""
+        if not self.tokens_por_minuto:
+            return
+        with self._lock:
+            self._repor(time.monotonic())
+            self.tokens = min(self.tokens_por_minuto, self.tokens - diferenca_tokens)
+
+    def pausar(self, segundos):
+        """Suspende novas chamadas de todas as threads (ex.: pelo Retry-After de um 429)."""
+        with self._lock:
+            self._pausado_ate = max(self._pausado_ate, time.monotonic() + segundos)
+
+
+class ConcorrenciaAdaptativa:
+    """
+    Limite de chamadas simultâneas ajustado por AIMD: cada sucesso soma 1/limite (cerca de +1 por janela
+    completa de chamadas) e cada sobrecarga (429, 5xx ou timeout) multiplica o limite por FATOR_REDUCAO.
+    """
+
+    def __init__(self, inicial=CONCORRENCIA_INICIAL, minimo=1, maximo=CONCORRENCIA_MAXIMA):
+        self.minimo = minimo
+        self.maximo = maximo
+        self.limite = float(max(minimo, min(inicial, maximo)))
+        self.em_uso = 0
+        self._ultima_reducao = 0.0
+        self._condicao = threading.Condition()
+
+    def entrar(self, prazo=None):
+        """
+        Ocupa uma vaga, esperando enquanto o limite atual estiver atingido.
+
+        Levanta:
+            ErroPrazoEsgotado: Se nenhuma vaga abrir antes do `prazo` (instante de time.monotonic()).
+        """
+        with self._condicao:
+            while self.em_uso >= int(self.limite):
+                restante = None if prazo is None else prazo - time.monotonic()
+                if restante is not None and restante <= 0:
+                    raise ErroPrazoEsgotado("Prazo esgotado aguardando uma vaga de concorrência.")
+                self._condicao.wait(restante)
+            self.em_uso += 1
+
+    def sair(self, sucesso=True, sobrecarga=False):
+        """Libera a vaga e ajusta o limite pelo resultado da chamada; outros erros não alteram o limite."""
+        with self._condicao:
+            self.em_uso -= 1
+            if sobrecarga:
+                agora = time.monotonic()
+                if agora - self._ultima_reducao >= INTERVALO_REDUCAO_SEGUNDOS:
+                    self._ultima_reducao = agora
+                    self.limite = max(self.minimo, self.limite * FATOR_REDUCAO)
+                    logging.warning(f"Sobrecarga na OpenAI: concorrência reduzida para {int(self.limite)}.")
+            elif sucesso:
+                self.limite = min(self.maximo, self.limite + 1 / self.limite)
+            self._condicao.notify_all()
+
+
+class _LimitesConta:
+    """Balde e concorrência de uma conta; existem enquanto algum ClienteResiliente os usar."""
+
+    def __init__(self):
+        self.balde = BaldeTaxa()
+        self.concorrencia = ConcorrenciaAdaptativa()
+
+
+_limites_por_conta = weakref.WeakValueDictionary()
+_lock_limites = threading.Lock()
+
+
+def chave_conta(client):
+    """Identifica a conta de um cliente da OpenAI: SHA-256 da chave de API, da organização e do endereço da API."""
+    partes = [str(getattr(client, atributo, None) or "") for atributo in ("api_key", "organization", "base_url")]
+    return hashlib.sha256("\0".join(partes).encode("utf-8")).hexdigest()
+
+
+def limites_da_conta(chave):
+    """
+    Balde e concorrência dos clientes de uma mesma conta: a cota é da conta, então esses clientes a dividem,
+    e os 429 de uma conta não reduzem a vazão das demais.
+
+    Retorna:
+        _LimitesConta: Com os atributos `balde` e `concorrencia`.
+    """
+    with _lock_limites:
+        limites = _limites_por_conta.get(chave)
+        if limites is None:
+            limites = _limites_por_conta[chave] = _LimitesConta()
+        return limites
+
+
+def estimar_tokens(messages, max_tokens=None):
+    """Tokens reservados para a chamada: texto das mensagens, imagens e a resposta esperada."""
+    total = 0
+    for mensagem in messages:
+        conteudo = mensagem.get("content", "")
+        partes = conteudo if isinstance(conteudo, list) else [{"type": "text", "text": conteudo}]
+        for parte in partes:
+            if parte.get("type") == "image_url":
+                total += TOKENS_POR_IMAGEM
+            else:
+                total += contar_tokens(parte.get("text", ""))
+    return total + (max_tokens or TOKENS_RESPOSTA_ESTIMADOS)
+
+
+def _retry_after(erro):
+    """Segundos pedidos pelo servidor nos cabeçalhos retry-after-ms ou Retry-After, ou None."""
+    resposta = getattr(erro, "response", None)
+    if resposta is None:
+        return None
+    cabecalhos = resposta.headers
+    try:
+        if cabecalhos.get("retry-after-ms"):
+            return float(cabecalhos["retry-after-ms"]) / 1000
+        valor = cabecalhos.get("retry-after")
+        if not valor:
+            return None
+        try:
+            return float(valor)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(valor).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _classificar(erro):
+    """
+    Retorna:
+        tuple[bool, bool]: (pode tentar de novo, indica sobrecarga do serviço).
+    """
+    if isinstance(erro, openai.RateLimitError):
+        # Falta de crédito também vem como 429, mas não se resolve esperando
+        return getattr(erro, "code", None) != "insufficient_quota", True
+    if isinstance(erro, openai.APITimeoutError):
+        return True, True
+    if isinstance(erro, openai.APIConnectionError):
+        return True, False
+    if isinstance(erro, openai.APIStatusError):
+        return erro.status_code >= 500 or erro.status_code == 409, erro.status_code >= 500
+    return False, False
+
+
+class _Completions:
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+
+    def create(self, **kwargs):
+        return self.cliente._criar(**kwargs)
+
+
+class ClienteResiliente:
+    """
+    Envolve um cliente da OpenAI (ou compatível) com a mesma interface `chat.completions.create`, somando:
+    balde de requisições e tokens por minuto, concorrência adaptativa, novas tentativas com espera
+    exponencial e jitter (respeitando Retry-After) e prazo total por chamada.
+
+    Em streams, só a abertura é repetida: depois que os primeiros pedaços foram entregues, um erro é
+    repassado ao chamador. A vaga de concorrência fica ocupada até o stream terminar.
+    """
+
+    def __init__(self, client, balde=None, concorrencia=None, max_tentativas=MAX_TENTATIVAS,
+                 prazo_segundos=PRAZO_PADRAO_SEGUNDOS):
+        self.client = client
+        # Sem balde e concorrência próprios, usa os da conta do cliente (a referência os mantém vivos)
+        self._limites = limites_da_conta(chave_conta(client)) if balde is None or concorrencia is None else None
+        self.balde = balde or self._limites.balde
+        self.concorrencia = concorrencia or self._limites.concorrencia
+        self.max_tentativas = max_tentativas
+        self.prazo_segundos = prazo_segundos
+        self._random = random.Random()
+        self.chat = SimpleNamespace(completions=_Completions(self))
+        # Consumo acumulado das respostas, para acompanhar o aproveitamento do cache de prompt da OpenAI
+        self.uso = {"chamadas": 0, "tokens_prompt": 0, "tokens_cache": 0, "tokens_resposta": 0}
+        self._lock_uso = threading.Lock()
+
+    def estatisticas_uso(self):
+        """Consumo acumulado e a fração dos tokens de prompt servida pelo cache de prompt."""
+        with self._lock_uso:
+            uso = dict(self.uso)
+        uso["fracao_cache"] = uso["tokens_cache"] / uso["tokens_prompt"] if uso["tokens_prompt"] else 0.0
+        return uso
+
+    def _espera(self, tentativa, erro):
+        # Jitter completo sobre a espera exponencial, nunca abaixo do que o servidor pediu
+        espera = self._random.uniform(0, min(ESPERA_MAXIMA_SEGUNDOS, ESPERA_BASE_SEGUNDOS * 2 ** tentativa))
+        pedido = _retry_after(erro)
+        if pedido is not None:
+            self.balde.pausar(pedido)
+            espera = max(espera, pedido)
+        return espera
+
+    def _criar(self, prazo_segundos=None, timeout=None, **kwargs):
+        prazo = time.monotonic() + (prazo_segundos or self.prazo_segundos)
+        max_tokens = kwargs.get("max_completion_tokens") or kwargs.get("max_tokens")
+        reservados = estimar_tokens(kwargs.get("messages", []), max_tokens)
+
+        for tentativa in range(self.max_tentativas):
+            self.balde.adquirir(reservados, prazo)
+            try:
+                self.concorrencia.entrar(prazo)
+            except ErroPrazoEsgotado:
+                self.balde.ajustar(-reservados)
+                raise
+            restante = prazo - time.monotonic()
+            try:
+                if restante <= 0:
+                    raise ErroPrazoEsgotado("Prazo esgotado antes do envio da requisição.")
+                resposta = self.client.chat.completions.create(
+                    **kwargs, timeout=min(restante, timeout or restante)
+                )
+            except Exception as e:
+                repetir, sobrecarga = _classificar(e)
+                self.concorrencia.sair(sucesso=False, sobrecarga=sobrecarga)
+                # Uma requisição recusada não consumiu a cota de tokens
+                self.balde.ajustar(-reservados)
+                if not repetir or tentativa == self.max_tentativas - 1:
+                    raise
+                espera = self._espera(tentativa, e)
+                if time.monotonic() + espera >= prazo:
+                    raise ErroPrazoEsgotado(f"Prazo esgotado após {tentativa + 1} tentativas.") from e
+                logging.warning(f"Falha na chamada à OpenAI ({type(e).__name__}), nova tentativa em {espera:.1f}s.")
+                time.sleep(espera)
+                continue
+
+            rastreamento.definir_atributos(tentativas=tentativa + 1)
+            if kwargs.get("stream"):
+                return _StreamAcompanhado(resposta, self, reservados)
+            self._encerrar(True, getattr(resposta, "usage", None), reservados)
+            return resposta
+
+    def _encerrar(self, sucesso, usage, reservados):
+        """Libera a vaga de concorrência e acerta a reserva de tokens com o `usage` da resposta, se houver."""
+        self.concorrencia.sair(sucesso=sucesso)
+        if usage is None:
+            return
+        total = getattr(usage, "total_tokens", None)
+        if total is not None:
+            self.balde.ajustar(total - reservados)
+
+        atributos = rastreamento.atributos_uso(usage)
+        with self._lock_uso:
+            self.uso["chamadas"] += 1
+            self.uso["tokens_prompt"] += atributos["tokens_prompt"]
+            self.uso["tokens_cache"] += atributos["tokens_cache"]
+            self.uso["tokens_resposta"] += atributos["tokens_resposta"]
+        logging.info(f"Tokens do prompt: {atributos['tokens_prompt']} ({atributos['tokens_cache']} do cache de prompt).")
+
+
+class _StreamAcompanhado:
+    """Repassa os pedaços do stream e libera a vaga do ClienteResiliente quando ele termina ou é descartado."""
+
+    def __init__(self, stream, cliente, reservados):
+        self.stream = stream
+        self.cliente = cliente
+        self.reservados = reservados
+        self.usage = None
+        self._encerrado = False
+        self._lock = threading.Lock()
+
+    def _encerrar(self, sucesso):
+        with self._lock:
+            if self._encerrado:
+                return
+            self._encerrado = True
+        self.cliente._encerrar(sucesso, self.usage, self.reservados)
+
+    def __iter__(self):
+        sucesso = False
+        try:
+            for chunk in self.stream:
+                if getattr(chunk, "usage", None) is not None:
+                    self.usage = chunk.usage
+                yield chunk
+            sucesso = True
+        finally:
+            self._encerrar(sucesso)
+
+    def close(self):
+        fechar = getattr(self.stream, "close", None)
+        if fechar is not None:
+            fechar()
+        self._encerrar(False)
+
+    def __del__(self):
+        self._encerrar(False)
@@ -0,0 +1,176 @@
+import json
+import re
+
+# Pedido de saída em JSON à API (JSON mode); o prompt de arquitetura já descreve as chaves esperadas
+FORMATO_JSON = {"type": "json_object"}
+
+_PADRAO_VIRGULA_FINAL = re.compile(r',\s*([}\]])')
+_PADRAO_STRING_JSON = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+_PADRAO_FINAL_INCOMPLETO = re.compile(r'[,:\s]+$')
+
+
+class ErroSaidaEstruturada(ValueError):
+    """A resposta do modelo não pôde ser convertida em um JSON válido para o esquema esperado."""
+
+
+def _varrer_objeto(texto):
+    """
+    Percorre o texto uma única vez a partir do primeiro '{', respeitando strings e escapes.
+
+    Retorna:
+        tuple[int, int | None, list[str], bool]: Início do objeto, fim (exclusivo) quando as chaves se
+        fecham, fechamentos ainda pendentes e se o texto terminou dentro de uma string.
+    """
+    inicio = texto.find('{')
+    if inicio < 0:
+        return -1, None, [], False
+
+    pendentes = []
+    em_string = False
+    escape = False
+    for i in range(inicio, len(texto)):
+        c = texto[i]
+        if em_string:
+            if escape:
+                escape = False
+            elif c == '\\':
+                escape = True
+            elif c == '"':
+                em_string = False
+        elif c == '"':
+            em_string = True
+        elif c == '{':
+            pendentes.append('}')
+        elif c == '[':
+            pendentes.append(']')
+        elif c in '}]' and pendentes and pendentes[-1] == c:
+            pendentes.pop()
+            if not pendentes:
+                return inicio, i + 1, [], False
+    return inicio, None, pendentes, em_string
+
+
+def extrair_objeto_json(texto):
+    """
+    Retorna o primeiro objeto JSON balanceado do texto ou None.
+
+    Só o texto fora do objeto é ignorado (cercas markdown, explicações antes ou depois); comentários dentro
+    dele continuam no trecho devolvido e o tornam inválido para json.loads.
+    """
+    inicio, fim, _, _ = _varrer_objeto(texto)
+    if fim is None:
+        return None
+    return texto[inicio:fim]
+
+
+def reparar_json(texto):
+    """
+    Correção barata para os defeitos comuns da saída do modelo: vírgulas sobrando antes de '}' ou ']' e
+    respostas truncadas, que têm a string aberta e as chaves pendentes fechadas.
+    """
+    inicio, fim, pendentes, em_string = _varrer_objeto(texto)
+    if inicio < 0:
+        return None
+    if fim is not None:
+        trecho = texto[inicio:fim]
+    else:
+        trecho = texto[inicio:] + ('"' if em_string else '')
+        trecho = _PADRAO_FINAL_INCOMPLETO.sub('', trecho) + ''.join(reversed(pendentes))
+    return _remover_virgulas_finais(trecho)
+
+
+def _remover_virgulas_finais(trecho):
+    # Só fora das strings: "a, ]" dentro de um valor é texto do modelo, não vírgula sobrando
+    partes = []
+    fim_anterior = 0
+    for string in _PADRAO_STRING_JSON.finditer(trecho):
+        partes.append(_PADRAO_VIRGULA_FINAL.sub(r'\1', trecho[fim_anterior:string.start()]))
+        partes.append(string.group())
+        fim_anterior = string.end()
+    partes.append(_PADRAO_VIRGULA_FINAL.sub(r'\1', trecho[fim_anterior:]))
+    return ''.join(partes)
+
+
+def carregar_json(texto):
+    """
+    Converte a resposta do modelo em dict: extrai o primeiro objeto JSON e, se ele não for válido,
+    tenta uma vez a correção de reparar_json.
+    """
+    bruto = extrair_objeto_json(texto)
+    if bruto is not None:
+        try:
+            dados = json.loads(bruto)
+        except json.JSONDecodeError:
+            pass
+        else:
+            if isinstance(dados, dict):
+                return dados
+
+    reparado = reparar_json(texto)
+    if reparado is None:
+        raise ErroSaidaEstruturada("A resposta não contém um objeto JSON.")
+    try:
+        dados = json.loads(reparado)
+    except json.JSONDecodeError as e:
+        raise ErroSaidaEstruturada(f"JSON inválido mesmo após correção: {e}") from e
+    if not isinstance(dados, dict):
+        raise ErroSaidaEstruturada("A resposta não contém um objeto JSON.")
+    return dados
+
+
+def _lista_de_textos(valor):
+    return isinstance(valor, list) and all(isinstance(item, str) for item in valor)
+
+
+def validar_arquitetura(dados):
+    """
+    Valida o resultado da leitura de arquitetura contra o esquema esperado pelo app.
+
+    Retorna:
+        list[str]: Problemas encontrados; vazia quando o resultado é válido.
+    """
+    erros = []
+    if not _lista_de_textos(dados.get("componentes_identificados")):
+        erros.append("'componentes_identificados' deve ser uma lista de textos.")
+
+    descricoes = dados.get("descricao_componentes", {})
+    if not isinstance(descricoes, dict) or not all(isinstance(v, str) for v in descricoes.values()):
+        erros.append("'descricao_componentes' deve ser um objeto componente -> descrição.")
+
+    fluxo = dados.get("fluxo_aplicacao")
+    if not (isinstance(fluxo, str) or _lista_de_textos(fluxo)):
+        erros.append("'fluxo_aplicacao' deve ser um texto ou uma lista de textos.")
+    return erros
+
+
+def interpretar_arquitetura(texto):
+    """
+    Converte e valida a resposta da leitura de arquitetura.
+
+    Retorna:
+        dict: Resultado com 'componentes_identificados', 'descricao_componentes' e 'fluxo_aplicacao'.
+
+    Levanta:
+        ErroSaidaEstruturada: Se a resposta não for um JSON válido ou não seguir o esquema.
+    """
+    dados = carregar_json(texto)
+    erros = validar_arquitetura(dados)
+    if erros:
+        raise ErroSaidaEstruturada(" ".join(erros))
+    dados.setdefault("descricao_componentes", {})
+    return dados
+
+
+def mensagens_correcao(texto, erro):
+    """
+    Mensagens do pedido de correção: só texto, sem a imagem, então custa uma fração da análise original.
+    """
+    prompt = f"""A resposta abaixo deveria ser um JSON com as chaves "componentes_identificados" (lista de textos),
+        "descricao_componentes" (objeto componente -> descrição) e "fluxo_aplicacao" (texto com os passos enumerados),
+        mas não pôde ser usada: {erro}
+
+        Devolva somente o JSON corrigido, sem alterar o conteúdo da análise.
+
+        {texto}
+    """
+    return [{"role": "user", "content": [{"type": "text", "text": prompt}]}]
@@ -0,0 +1,239 @@
+"""
+Avaliação BLEU da extração de componentes: compara as listas esperadas com as retornadas pelo sistema.
+
+Reproduz o cálculo do notebook metricas/blue_score.ipynb (sentence_bleu do NLTK com suavização method1
+e os mesmos pesos) sem depender do NLTK, e grava um CSV no formato de resultados_bluescore.csv.
+
+Exemplo (a partir da raiz do projeto):
+    python -m services.avaliacao_bleu --saida metricas/resultados_bluescore.csv --relatorio metricas/relatorio_bluescore.txt
+"""
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import csv
+import json
+import logging
+import math
+import os
+import re
+import statistics
+
+import numpy as np
+
+# Configuração do logging
+logging.basicConfig(level=logging.INFO)
+
+DIRETORIO_ESPERADAS = os.path.join('metricas', 'respostas esperadas')
+DIRETORIO_RETORNADAS = os.path.join('metricas', 'respostas retornadas')
+CAMINHO_RESULTADOS = os.path.join('metricas', 'resultados_bluescore.csv')
+
+COLUNAS = ("arquivo", "componentes_esperados", "componentes_retornados",
+           "bleu_1", "bleu_2", "bleu_3", "bleu_4", "bleu_avg")
+
+MAX_N = 4
+
+# Pesos de BLEU-1 a BLEU-4, os mesmos do notebook; cada linha multiplica o log das precisões de 1 a 4-gramas
+PESOS = (
+    (1, 0, 0, 0),
+    (0.5, 0.5, 0, 0),
+    (0.33, 0.33, 0.33, 0),
+    (0.25, 0.25, 0.25, 0.25)
+)
+
+# Numerador usado pela suavização method1 do NLTK quando não há n-gramas em comum
+EPSILON = 0.1
+
+# Abaixo disso, abrir o pool de processos custa mais do que avaliar tudo no processo atual
+MIN_PARES_PARALELO = 64
+
+_PADRAO_ESPECIAIS = re.compile(r'[^\w\s-]')
+
+
+def normalizar_texto(texto):
+    """Minúsculas, sem caracteres especiais (exceto '-') e com espaços simples, como no notebook."""
+    return ' '.join(_PADRAO_ESPECIAIS.sub('', texto.lower()).split())
+
+
+def extrair_componentes(texto):
+    """
+    Lista de componentes normalizados do conteúdo de um arquivo: lista JSON, senão uma linha por
+    componente, senão separados por vírgula, senão um único componente.
+    """
+    texto = texto.strip()
+    if texto.startswith('[') and texto.endswith(']'):
+        try:
+            return [normalizar_texto(componente) for componente in json.loads(texto)]
+        except json.JSONDecodeError:
+            pass
+    if '\n' in texto:
+        return [normalizar_texto(linha.strip()) for linha in texto.split('\n') if linha.strip()]
+    if ',' in texto:
+        return [normalizar_texto(parte.strip()) for parte in texto.split(',') if parte.strip()]
+    return [normalizar_texto(texto)]
+
+
+def ler_componentes(caminho):
+    try:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            return extrair_componentes(f.read())
+    except (OSError, UnicodeDecodeError) as e:
+        logging.error(f"Erro ao processar arquivo {caminho}: {str(e)}")
+        return []
+
+
+def contar_ngramas(tokens, max_n=MAX_N):
+    """Contagem dos n-gramas de 1 a `max_n` dos tokens, uma Counter por ordem."""
+    return [Counter(zip(*(tokens[i:] for i in range(n)))) for n in range(1, max_n + 1)]
+
+
+def pontuar(referencia, candidato, ngramas_referencia=None):
+    """
+    BLEU-1 a BLEU-4 do candidato contra uma referência (listas de tokens), iguais ao sentence_bleu do
+    NLTK com SmoothingFunction().method1.
+
+    Parâmetros:
+        ngramas_referencia: Contagens já calculadas por contar_ngramas(referencia), para reaproveitar a
+            mesma referência contra vários candidatos
+
+    Retorna:
+        np.ndarray: Os quatro escores, na ordem de PESOS.
+    """
+    ngramas_referencia = ngramas_referencia or contar_ngramas(referencia)
+    ngramas_candidato = contar_ngramas(candidato)
+
+    # Precisão modificada: cada n-grama do candidato conta no máximo quantas vezes aparece na referência
+    acertos = np.array([sum((cand & ref).values()) for cand, ref in zip(ngramas_candidato, ngramas_referencia)],
+                       dtype=float)
+    if acertos[0] == 0:
+        return np.zeros(len(PESOS))
+    totais = np.array([max(1, sum(cand.values())) for cand in ngramas_candidato], dtype=float)
+    precisoes = np.where(acertos == 0, EPSILON, acertos) / totais
+
+    tamanho_candidato, tamanho_referencia = len(candidato), len(referencia)
+    penalidade = 1 if tamanho_candidato > tamanho_referencia else math.exp(1 - tamanho_referencia / tamanho_candidato)
+    # Soma com math.fsum e exp do math, como o NLTK, para reproduzir os escores até o último dígito do CSV
+    logs = [math.log(precisao) for precisao in precisoes]
+    return np.array([penalidade * math.exp(math.fsum(w * log for w, log in zip(pesos, logs))) for pesos in PESOS])
+
+
+def tokenizar(componentes):
+    return [token for componente in componentes for token in componente.split()]
+
+
+def avaliar_par(arquivo, caminho_esperado, caminho_retornado):
+    """Linha do CSV de resultados para um par de arquivos esperado/retornado."""
+    esperados = ler_componentes(caminho_esperado)
+    retornados = ler_componentes(caminho_retornado)
+    escores = pontuar(tokenizar(esperados), tokenizar(retornados))
+    return {
+        "arquivo": arquivo,
+        "componentes_esperados": len(esperados),
+        "componentes_retornados": len(retornados),
+        "bleu_1": float(escores[0]),
+        "bleu_2": float(escores[1]),
+        "bleu_3": float(escores[2]),
+        "bleu_4": float(escores[3]),
+        "bleu_avg": sum(escores.tolist()) / len(PESOS)
+    }
+
+
+def _avaliar_lote(pares):
+    return [avaliar_par(*par) for par in pares]
+
+
+def listar_pares(diretorio_esperadas=DIRETORIO_ESPERADAS, diretorio_retornadas=DIRETORIO_RETORNADAS):
+    """Pares (arquivo, esperado, retornado) com o mesmo nome nas duas pastas, em ordem alfabética."""
+    pares = []
+    for nome in sorted(os.listdir(diretorio_esperadas)):
+        if not nome.endswith('.txt'):
+            continue
+        retornado = os.path.join(diretorio_retornadas, nome)
+        if os.path.exists(retornado):
+            pares.append((nome, os.path.join(diretorio_esperadas, nome), retornado))
+        else:
+            logging.warning(f"Arquivo correspondente não encontrado: {retornado}")
+    return pares
+
+
+def avaliar(pares, processos=None):
+    """
+    Avalia os pares em um pool de processos (no processo atual quando são poucos).
+
+    Retorna:
+        list[dict]: Uma linha por par, na ordem de `pares`.
+    """
+    processos = processos or os.cpu_count() or 1
+    if processos == 1 or len(pares) < MIN_PARES_PARALELO:
+        return _avaliar_lote(pares)
+
+    # Lotes contíguos: cada processo recebe poucas tarefas grandes e a ordem é preservada
+    tamanho = -(-len(pares) // (processos * 4))
+    lotes = [pares[i:i + tamanho] for i in range(0, len(pares), tamanho)]
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        return [linha for lote in executor.map(_avaliar_lote, lotes) for linha in lote]
+
+
+def gravar_csv(resultados, caminho=CAMINHO_RESULTADOS):
+    with open(caminho, 'w', encoding='utf-8', newline='') as f:
+        escritor = csv.DictWriter(f, fieldnames=COLUNAS, lineterminator='\n')
+        escritor.writeheader()
+        escritor.writerows(resultados)
+
+
+def _media_desvio(valores):
+    desvio = statistics.stdev(valores) if len(valores) > 1 else float('nan')
+    return f"{statistics.mean(valores):.4f} (±{desvio:.4f})"
+
+
+def gravar_relatorio(resultados, caminho):
+    """Relatório em texto no formato de relatorio_bluescore.txt (estatísticas gerais, por nuvem e por arquivo)."""
+    linhas = ["=== RELATÓRIO DETALHADO DA AVALIAÇÃO BLUESCORE ===", "",
+              f"Data da avaliação: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+              f"Número total de arquivos avaliados: {len(resultados)}", "",
+              "=== ESTATÍSTICAS GERAIS ==="]
+    for coluna, rotulo in (("bleu_1", "BLEU-1"), ("bleu_2", "BLEU-2"), ("bleu_3", "BLEU-3"), ("bleu_4", "BLEU-4"),
+                           ("bleu_avg", "BLEU Average")):
+        linhas.append(f"{rotulo} médio: {_media_desvio([r[coluna] for r in resultados])}")
+    linhas.append("")
+
+    for chave, nome in (("aws", "AWS"), ("azure", "Azure")):
+        medias = [r["bleu_avg"] for r in resultados if chave in r["arquivo"]]
+        if medias:
+            linhas += [f"=== RESULTADOS {nome.upper()} ===",
+                       f"Número de arquivos {nome}: {len(medias)}",
+                       f"BLEU Average médio {nome}: {_media_desvio(medias)}",
+                       f"Melhor resultado {nome}: {max(medias):.4f}",
+                       f"Pior resultado {nome}: {min(medias):.4f}", ""]
+
+    linhas.append("=== RESULTADOS DETALHADOS POR ARQUIVO ===")
+    for r in resultados:
+        linhas += ["", f"Arquivo: {r['arquivo']}",
+                   f"  Componentes esperados: {r['componentes_esperados']}",
+                   f"  Componentes retornados: {r['componentes_retornados']}",
+                   f"  BLEU-1: {r['bleu_1']:.4f}", f"  BLEU-2: {r['bleu_2']:.4f}",
+                   f"  BLEU-3: {r['bleu_3']:.4f}", f"  BLEU-4: {r['bleu_4']:.4f}",
+                   f"  BLEU Average: {r['bleu_avg']:.4f}"]
+
+    with open(caminho, 'w', encoding='utf-8') as f:
+        f.write("\n".join(linhas) + "\n")
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Avaliação BLEU das listas de componentes extraídas.")
+    parser.add_argument("--esperadas", default=DIRETORIO_ESPERADAS, help="Pasta com as listas de referência")
+    parser.add_argument("--retornadas", default=DIRETORIO_RETORNADAS, help="Pasta com as listas retornadas")
+    parser.add_argument("--saida", default=CAMINHO_RESULTADOS, help="CSV de resultados")
+    parser.add_argument("--relatorio", default=None, help="Grava também o relatório em texto neste caminho")
+    parser.add_argument("--processos", type=int, default=None, help="Processos do pool (padrão: número de CPUs)")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    pares = listar_pares(args.esperadas, args.retornadas)
+    resultados = avaliar(pares, args.processos)
+    gravar_csv(resultados, args.saida)
+    if args.relatorio and resultados:
+        gravar_relatorio(resultados, args.relatorio)
+    logging.info(f"{len(resultados)} pares avaliados em {time.perf_counter() - inicio:.2f}s; resultados em {args.saida}.")
@@ -0,0 +1,173 @@
+import hashlib
+import itertools
+import json
+import logging
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+# Configuração do logging
+logging.basicConfig(level=logging.INFO)
+
+# Estado das páginas já baixadas (ETag, Last-Modified e hash do conteúdo), relativo à raiz do projeto. O hash
+# diz o que um consumidor já processou, então cada consumidor tem o próprio arquivo (caminho_estado_consumidor)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DIRETORIO_ESTADO = os.path.join(SCRIPT_DIR, "..", ".cache")
+# Arquivo único de antes da separação por consumidor
+CAMINHO_ESTADO_LEGADO = os.path.join(DIRETORIO_ESTADO, "crawler_estado.json")
+
+MAX_CONCORRENCIA = 8
+TIMEOUT_SEGUNDOS = 15
+
+
+def caminho_estado_consumidor(consumidor):
+    """Arquivo de estado do crawler para um consumidor (ex.: "indice", "corpus")."""
+    return os.path.join(DIRETORIO_ESTADO, f"crawler_estado_{consumidor}.json")
+
+
+def extrair_conteudo_html(html, url):
+    """Extrai título e conteúdo principal de uma página da documentação STRIDE."""
+    soup = BeautifulSoup(html, 'html.parser')
+    titulo = str(soup.title.string) if soup.title and soup.title.string else "Sem título"
+
+    conteudo_documentacoes_divs = soup.find_all('div', class_='content')
+    if conteudo_documentacoes_divs:
+        conteudo = ""
+        for div in conteudo_documentacoes_divs:
+            paragrafos = div.find_all('p')
+            # Concatena o texto de todos os parágrafos encontrados em cada div
+            conteudo += ' ' + ' '.join(p.get_text(strip=True) for p in paragrafos)
+        conteudo = conteudo.strip()
+    else:
+        # Fallback
+        conteudo_principal = soup.find('main') or soup.find('article') or soup.find('div', id='main')
+        if conteudo_principal:
+            # Remover scripts e estilos
+            for script in conteudo_principal(["script", "style"]):
+                script.extract()
+            conteudo = conteudo_principal.get_text(separator=' ', strip=True)
+        else:
+            conteudo = soup.body.get_text(separator=' ', strip=True) if soup.body else ""
+
+    return {
+        "titulo": titulo,
+        "conteudo": conteudo,
+        "url": url
+    }
+
+
+def criar_sessao(max_concorrencia=MAX_CONCORRENCIA):
+    """Cria uma sessão HTTP com pool de conexões dimensionado para a concorrência do crawler."""
+    sessao = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max_concorrencia, pool_maxsize=max_concorrencia)
+    sessao.mount("http://", adapter)
+    sessao.mount("https://", adapter)
+    return sessao
+
+
+class Crawler:
+    """
+    Baixa páginas em paralelo com requisições condicionais.
+
+    Para cada URL guarda ETag, Last-Modified e o hash do conteúdo. Páginas que respondem 304, ou cujo
+    conteúdo não mudou, são marcadas como inalteradas e não precisam ser processadas novamente. O estado
+    vale para um único consumidor; sem `caminho_estado`, ele fica só em memória.
+    """
+
+    def __init__(self, caminho_estado=None, max_concorrencia=MAX_CONCORRENCIA, timeout=TIMEOUT_SEGUNDOS,
+                 sessao=None):
+        self.caminho_estado = caminho_estado
+        self.max_concorrencia = max_concorrencia
+        self.timeout = timeout
+        self.sessao = sessao or criar_sessao(max_concorrencia)
+        self._lock = threading.Lock()
+        self.estado = self._carregar_estado()
+
+    def _carregar_estado(self):
+        if self.caminho_estado and os.path.exists(self.caminho_estado):
+            with open(self.caminho_estado, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {}
+
+    def salvar_estado(self):
+        """Grava o estado; chame depois que as páginas alteradas tiverem sido processadas com sucesso."""
+        if not self.caminho_estado:
+            return
+        diretorio = os.path.dirname(self.caminho_estado)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        with self._lock:
+            with open(self.caminho_estado, "w", encoding="utf-8") as f:
+                json.dump(self.estado, f, ensure_ascii=False, indent=2)
+
+    def baixar(self, url):
+        """
+        Baixa uma URL usando os validadores salvos.
+
+        Retorna:
+            dict: Chaves 'url', 'status' ('alterada', 'inalterada' ou 'erro'), 'html' (se alterada) e 'erro'.
+        """
+        with self._lock:
+            anterior = dict(self.estado.get(url, {}))
+
+        headers = {}
+        if anterior.get("etag"):
+            headers["If-None-Match"] = anterior["etag"]
+        if anterior.get("last_modified"):
+            headers["If-Modified-Since"] = anterior["last_modified"]
+
+        try:
+            response = self.sessao.get(url, headers=headers, timeout=self.timeout)
+            if response.status_code == 304:
+                return {"url": url, "status": "inalterada"}
+            response.raise_for_status()
+        except Exception as e:
+            logging.error(f"Erro ao baixar URL {url}: {str(e)}")
+            return {"url": url, "status": "erro", "erro": str(e)}
+
+        hash_conteudo = hashlib.sha256(response.content).hexdigest()
+        with self._lock:
+            # Mantém dados extras gravados por quem consome o crawler (ex.: quantidade de trechos indexados)
+            self.estado[url] = {
+                **anterior,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "hash": hash_conteudo
+            }
+
+        if anterior.get("hash") == hash_conteudo:
+            return {"url": url, "status": "inalterada"}
+        return {"url": url, "status": "alterada", "html": response.text}
+
+    def esquecer(self, url):
+        """Descarta os validadores e o hash da URL: o próximo download a trata como alterada."""
+        with self._lock:
+            self.estado.pop(url, None)
+
+    def baixar_varias(self, urls):
+        """
+        Baixa as URLs em paralelo (até `max_concorrencia` ao mesmo tempo) e devolve cada uma ao terminar.
+
+        Uma nova URL só começa quando outra termina, então o HTML em memória é o de no máximo
+        2 x `max_concorrencia` páginas, não o do corpus inteiro.
+        """
+        urls = iter(dict.fromkeys(urls))
+        with ThreadPoolExecutor(max_workers=self.max_concorrencia) as executor:
+            em_andamento = {executor.submit(self.baixar, url) for url in itertools.islice(urls, self.max_concorrencia)}
+            while em_andamento:
+                prontos, em_andamento = wait(em_andamento, return_when=FIRST_COMPLETED)
+                for future in prontos:
+                    proxima = next(urls, None)
+                    if proxima is not None:
+                        em_andamento.add(executor.submit(self.baixar, proxima))
+                    yield future.result()
+
+    def paginas_alteradas(self, urls):
+        """Baixa as URLs e devolve já extraídas apenas as páginas novas ou com conteúdo alterado."""
+        for resultado in self.baixar_varias(urls):
+            if resultado["status"] == "alterada":
+                yield extrair_conteudo_html(resultado["html"], resultado["url"])
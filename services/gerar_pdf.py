@@ -1,6 +1,11 @@
+from collections import OrderedDict
 from datetime import datetime
 from io import BytesIO
+import hashlib
+import json
+import os
 import re
+import threading
 
 import streamlit as st
 from reportlab.lib.enums import TA_CENTER
@@ -9,79 +14,104 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
 
+from services import rastreamento
 
-def _processar_texto_formatado(texto):
-    """
-    Processa o texto para preservar a formatação original com quebras de linha e estrutura.
-    """
-    if not texto:
-        return []
 
-    # Dividir o texto em linhas
-    linhas = texto.split('\n')
-    elementos = []
+# Relatórios gerados mantidos em memória, pela impressão digital do resultado
+MAX_RELATORIOS_MEMORIA = 16
+
+_PREFIXOS_STRIDE = ('S (', 'T (', 'R (', 'I (', 'D (', 'E (')
+_SECOES = frozenset(('Ameaças:', 'Justificativa:', 'Mitigação:'))
+_PADRAO_AMEACA = re.compile(r'^[A-Z] \([^)]+\)')
+
+INTRO_ITENS = """A seguir está uma análise STRIDE "item–a–item" para cada componente listado. Para cada um, você encontrará:
+
+    • Principais ameaças STRIDE
+    • Justificativa técnica
+    • Recomendações de mitigação"""
+
+INTRO_FLUXO = """Seguem as principais cadeias de fluxo de dados do seu ambiente e, para cada uma, as ameaças STRIDE, justificativas técnicas e recomendações de mitigação."""
+
+
+def _criar_estilos():
+    styles = getSampleStyleSheet()
+    return {
+        'titulo': ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=18, spaceAfter=30,
+                                 alignment=TA_CENTER),
+        'cabecalho': ParagraphStyle('CustomHeading', parent=styles['Heading2'], fontSize=14, spaceAfter=12,
+                                    spaceBefore=20),
+        'subcabecalho': ParagraphStyle('CustomSubHeading', parent=styles['Heading3'], fontSize=12, spaceAfter=8,
+                                       spaceBefore=12),
+        'normal': styles['Normal'],
+        'negrito': ParagraphStyle('BoldStyle', parent=styles['Normal'], fontSize=10, spaceAfter=6)
+    }
+
 
-    for linha in linhas:
+# Os estilos não mudam entre relatórios: criados uma vez, na importação
+ESTILOS = _criar_estilos()
+
+_relatorios = OrderedDict()
+_lock_relatorios = threading.Lock()
+
+
+def _classificar_linha(linha):
+    """Tipo de uma linha (já sem espaços nas pontas) do texto das análises STRIDE."""
+    if not linha:
+        return 'espaco'
+    # Título de seção (contém "–"), exceto as próprias ameaças STRIDE
+    if '–' in linha and not linha.startswith(_PREFIXOS_STRIDE):
+        return 'titulo'
+    # Seção principal (Ameaças:, Justificativa:, Mitigação:)
+    if linha in _SECOES:
+        return 'secao'
+    if _PADRAO_AMEACA.match(linha):
+        return 'ameaca'
+    # Linha de mitigação (começa com •)
+    if linha.startswith('•'):
+        return 'mitigacao'
+    return 'normal'
+
+
+def _elementos_analise(texto):
+    """Converte o texto de uma análise STRIDE nos elementos do PDF, classificando cada linha uma única vez."""
+    elementos = []
+    for linha in texto.split('\n'):
         linha = linha.strip()
-        if linha:
-            # Verificar se é um título de seção (contém "–" ou ":")
-            if '–' in linha and not linha.startswith(('S (', 'T (', 'R (', 'I (', 'D (', 'E (')):
-                elementos.append(('titulo', linha))
-            # Verificar se é uma seção principal (Ameaças:, Justificativa:, Mitigação:)
-            elif linha.endswith(':') and linha in ['Ameaças:', 'Justificativa:', 'Mitigação:']:
-                elementos.append(('secao', linha))
-            # Verificar se é uma ameaça STRIDE
-            elif re.match(r'^[A-Z] \([^)]+\)', linha):
-                elementos.append(('ameaca', linha))
-            # Verificar se é uma linha de mitigação (começa com •)
-            elif linha.startswith('•'):
-                elementos.append(('mitigacao', linha))
-            else:
-                elementos.append(('normal', linha))
+        tipo = _classificar_linha(linha)
+        if tipo == 'espaco':
+            elementos.append(Spacer(1, 8))
+        elif tipo == 'titulo':
+            elementos.append(Paragraph(f"<b>{linha}</b>", ESTILOS['subcabecalho']))
+        elif tipo == 'secao':
+            elementos.append(Paragraph(f"<b>{linha}</b>", ESTILOS['negrito']))
         else:
-            elementos.append(('espaco', ''))
-
+            elementos.append(Paragraph(linha, ESTILOS['normal']))
     return elementos
 
 
-def _gerar_relatorio_pdf(resultados_itens, descricao_componentes, resultados_fluxo, resultado_items,
-                         resultado_flow):
-    """
-    Gera um relatório em PDF com todos os resultados da análise de vulnerabilidade.
-    """
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=1 * inch, bottomMargin=1 * inch)
+def _secao_analise(story, titulo, introducao, resultado, mensagem_vazia):
+    """Seção de uma análise STRIDE (por item ou do fluxo de dados); as duas têm a mesma estrutura."""
+    normal_style = ESTILOS['normal']
+    story.append(Paragraph(titulo, ESTILOS['cabecalho']))
+    story.append(Paragraph(introducao, normal_style))
+    story.append(Spacer(1, 15))
 
-    # Estilos
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceAfter=12,
-        spaceBefore=20
-    )
-    subheading_style = ParagraphStyle(
-        'CustomSubHeading',
-        parent=styles['Heading3'],
-        fontSize=12,
-        spaceAfter=8,
-        spaceBefore=12
-    )
-    normal_style = styles['Normal']
-    bold_style = ParagraphStyle(
-        'BoldStyle',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceAfter=6
-    )
+    if not resultado:
+        story.append(Paragraph(mensagem_vazia, normal_style))
+    elif isinstance(resultado, str):
+        story.extend(_elementos_analise(resultado))
+    else:
+        # Se for uma estrutura de dados, processar cada elemento
+        for elemento in resultado:
+            story.append(Paragraph(str(elemento), normal_style))
+            story.append(Spacer(1, 10))
+
+
+def _montar_story(resultados_itens, descricao_componentes, resultados_fluxo, resultado_items, resultado_flow,
+                  data_atual):
+    title_style = ESTILOS['titulo']
+    heading_style = ESTILOS['cabecalho']
+    normal_style = ESTILOS['normal']
 
     # Conteúdo do PDF
     story = []
@@ -91,7 +121,6 @@ def _gerar_relatorio_pdf(resultados_itens, descricao_componentes, resultados_flu
     story.append(Spacer(1, 20))
 
     # Data e hora do relatório
-    data_atual = datetime.now().strftime("%d/%m/%Y às %H:%M")
     story.append(Paragraph(f"Relatório gerado em: {data_atual}", normal_style))
     story.append(Spacer(1, 20))
 
@@ -119,19 +148,12 @@ def _gerar_relatorio_pdf(resultados_itens, descricao_componentes, resultados_flu
     # Fluxo da aplicação
     story.append(Paragraph("🔁 Fluxo da Aplicação", heading_style))
     if resultados_fluxo:
-        if isinstance(resultados_fluxo, list):
-            for fluxo in resultados_fluxo:
-                if isinstance(fluxo, str):
-                    story.append(Paragraph(fluxo, normal_style))
-                    story.append(Spacer(1, 6))
-        elif isinstance(resultados_fluxo, str):
-            # Dividir por quebras de linha mantendo a estrutura
-            linhas_fluxo = resultados_fluxo.split('\n')
-            for linha in linhas_fluxo:
-                linha = linha.strip()
-                if linha:
-                    story.append(Paragraph(linha, normal_style))
-                    story.append(Spacer(1, 6))
+        # Texto: uma linha por passo, mantendo a estrutura
+        passos = resultados_fluxo.split('\n') if isinstance(resultados_fluxo, str) else resultados_fluxo
+        for passo in passos:
+            if isinstance(passo, str) and passo.strip():
+                story.append(Paragraph(passo.strip(), normal_style))
+                story.append(Spacer(1, 6))
     else:
         story.append(Paragraph("Nenhum fluxo identificado.", normal_style))
     story.append(Spacer(1, 15))
@@ -139,86 +161,79 @@ def _gerar_relatorio_pdf(resultados_itens, descricao_componentes, resultados_flu
     # Nova página para análises de vulnerabilidade
     story.append(PageBreak())
 
-    # Análise de vulnerabilidade por item
-    story.append(Paragraph("🔍 Análise de Vulnerabilidade por Item", heading_style))
-
-    # Texto introdutório
-    intro_text = """A seguir está uma análise STRIDE "item–a–item" para cada componente listado. Para cada um, você encontrará:
-
-• Principais ameaças STRIDE
-• Justificativa técnica
-• Recomendações de mitigação"""
+    _secao_analise(story, "🔍 Análise de Vulnerabilidade por Item", INTRO_ITENS, resultado_items,
+                   "Nenhuma análise de item disponível.")
+    story.append(Spacer(1, 20))
+    _secao_analise(story, "🔍 Análise de Vulnerabilidade do Fluxo de Dados", INTRO_FLUXO, resultado_flow,
+                   "Nenhuma análise de fluxo disponível.")
+    return story
 
-    story.append(Paragraph(intro_text, normal_style))
-    story.append(Spacer(1, 15))
 
-    if resultado_items:
-        if isinstance(resultado_items, str):
-            # Processar o texto formatado
-            elementos = _processar_texto_formatado(resultado_items)
-
-            for tipo, conteudo in elementos:
-                if tipo == 'titulo':
-                    story.append(Paragraph(f"<b>{conteudo}</b>", subheading_style))
-                elif tipo == 'secao':
-                    story.append(Paragraph(f"<b>{conteudo}</b>", bold_style))
-                elif tipo == 'ameaca':
-                    story.append(Paragraph(conteudo, normal_style))
-                elif tipo == 'mitigacao':
-                    story.append(Paragraph(conteudo, normal_style))
-                elif tipo == 'normal':
-                    story.append(Paragraph(conteudo, normal_style))
-                elif tipo == 'espaco':
-                    story.append(Spacer(1, 8))
-        else:
-            # Se for uma estrutura de dados, processar cada item
-            for item in resultado_items:
-                story.append(Paragraph(str(item), normal_style))
-                story.append(Spacer(1, 10))
-    else:
-        story.append(Paragraph("Nenhuma análise de item disponível.", normal_style))
+def chave_relatorio(resultados_itens, descricao_componentes, resultados_fluxo, resultado_items, resultado_flow):
+    """Impressão digital do resultado da análise: relatórios com a mesma chave têm o mesmo conteúdo."""
+    conteudo = json.dumps(
+        [resultados_itens, descricao_componentes, resultados_fluxo, resultado_items, resultado_flow],
+        ensure_ascii=False, sort_keys=True, default=str
+    )
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
 
-    story.append(Spacer(1, 20))
 
-    # Análise de vulnerabilidade do fluxo de dados
-    story.append(Paragraph("🔍 Análise de Vulnerabilidade do Fluxo de Dados", heading_style))
+def gerar_relatorio_pdf(resultados_itens, descricao_componentes, resultados_fluxo, resultado_items,
+                        resultado_flow, destino=None, memorizar=True):
+    """
+    Gera um relatório em PDF com todos os resultados da análise de vulnerabilidade.
 
-    # Texto introdutório
-    intro_fluxo_text = """Seguem as principais cadeias de fluxo de dados do seu ambiente e, para cada uma, as ameaças STRIDE, justificativas técnicas e recomendações de mitigação."""
+    Parâmetros:
+        destino: Caminho ou arquivo aberto em modo binário onde o PDF é gravado diretamente, sem passar
+            por um buffer em memória (ex.: execuções em lote). Quando None, o PDF é retornado em bytes.
+        memorizar (bool): Reaproveita o PDF já gerado para o mesmo resultado no mesmo minuto, em vez de
+            montá-lo de novo.
 
-    story.append(Paragraph(intro_fluxo_text, normal_style))
-    story.append(Spacer(1, 15))
+    Retorna:
+        bytes | None: O PDF, quando `destino` é None.
+    """
+    with rastreamento.span("gerar_relatorio_pdf", componentes=len(resultados_itens or [])) as span:
+        # O horário impresso no relatório faz parte da chave: o PDF memorizado só é reaproveitado dentro do
+        # mesmo minuto, e um clique posterior gera o relatório de novo com o horário atual
+        data_atual = datetime.now().strftime("%d/%m/%Y às %H:%M")
+        chave = None
+        if memorizar:
+            chave = chave_relatorio(resultados_itens, descricao_componentes, resultados_fluxo, resultado_items,
+                                    resultado_flow) + data_atual
+            with _lock_relatorios:
+                pdf = _relatorios.get(chave)
+                if pdf is not None:
+                    _relatorios.move_to_end(chave)
+            span.definir(memoria_hit=pdf is not None)
+            if pdf is not None:
+                span.definir(bytes_pdf=len(pdf))
+                if destino is None:
+                    return pdf
+                if isinstance(destino, (str, os.PathLike)):
+                    with open(destino, "wb") as f:
+                        f.write(pdf)
+                else:
+                    destino.write(pdf)
+                return None
 
-    if resultado_flow:
-        if isinstance(resultado_flow, str):
-            # Processar o texto formatado
-            elementos = _processar_texto_formatado(resultado_flow)
-
-            for tipo, conteudo in elementos:
-                if tipo == 'titulo':
-                    story.append(Paragraph(f"<b>{conteudo}</b>", subheading_style))
-                elif tipo == 'secao':
-                    story.append(Paragraph(f"<b>{conteudo}</b>", bold_style))
-                elif tipo == 'ameaca':
-                    story.append(Paragraph(conteudo, normal_style))
-                elif tipo == 'mitigacao':
-                    story.append(Paragraph(conteudo, normal_style))
-                elif tipo == 'normal':
-                    story.append(Paragraph(conteudo, normal_style))
-                elif tipo == 'espaco':
-                    story.append(Spacer(1, 8))
-        else:
-            # Se for uma lista ou estrutura de dados, processar cada fluxo
-            for fluxo in resultado_flow:
-                story.append(Paragraph(str(fluxo), normal_style))
-                story.append(Spacer(1, 10))
-    else:
-        story.append(Paragraph("Nenhuma análise de fluxo disponível.", normal_style))
+        story = _montar_story(resultados_itens, descricao_componentes, resultados_fluxo, resultado_items,
+                              resultado_flow, data_atual)
+        saida = BytesIO() if destino is None else destino
+        if isinstance(saida, os.PathLike):
+            saida = os.fspath(saida)
+        doc = SimpleDocTemplate(saida, pagesize=A4, topMargin=1 * inch, bottomMargin=1 * inch)
+        doc.build(story)
 
-    # Construir o PDF
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
+        if destino is not None:
+            return None
+        pdf = saida.getvalue()
+        span.definir(bytes_pdf=len(pdf))
+        if chave is not None:
+            with _lock_relatorios:
+                _relatorios[chave] = pdf
+                while len(_relatorios) > MAX_RELATORIOS_MEMORIA:
+                    _relatorios.popitem(last=False)
+        return pdf
 
 
 @st.fragment()
@@ -226,7 +241,8 @@ def pdf_button(resultados_itens, descricao_componentes, resultados_fluxo, result
                resultado_flow):
     if st.button("Gerar PDF do Relatório"):
         with st.spinner('Gerando PDF... Por favor, aguarde.'):
-            pdf_buffer = _gerar_relatorio_pdf(
+            # Cliques repetidos para o mesmo resultado reaproveitam o PDF já gerado
+            pdf_buffer = gerar_relatorio_pdf(
                 resultados_itens=resultados_itens,
                 descricao_componentes=descricao_componentes,
                 resultados_fluxo=resultados_fluxo,
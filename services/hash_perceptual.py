@@ -0,0 +1,197 @@
+from contextlib import contextmanager
+from io import BytesIO
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+from services.imagem import remover_transparencia
+
+CAMINHO_INDICE = os.path.join('.cache', 'indice_perceptual.sqlite')
+
+# Lado da grade do dHash: 8 gera um hash de 64 bits
+TAMANHO_HASH = 8
+
+# Distância de Hamming máxima (em bits, de 64) para considerar dois diagramas a mesma arquitetura.
+# Reexportações, recortes leves e mudança de formato ficam abaixo disso; diagramas diferentes, bem acima.
+DISTANCIA_MAXIMA = int(os.environ.get("DISTANCIA_MAXIMA_SIMILAR", "6"))
+
+
+def dhash(conteudo, tamanho=TAMANHO_HASH):
+    """
+    Hash perceptual por diferença (dHash) da imagem: compara o brilho de pixels vizinhos em uma versão
+    reduzida para (tamanho + 1) x tamanho em tons de cinza.
+
+    Retorna:
+        int | None: Hash de tamanho² bits, ou None se o conteúdo não for uma imagem.
+    """
+    try:
+        with Image.open(BytesIO(conteudo)) as imagem:
+            cinza = remover_transparencia(imagem).convert("L")
+    except (UnidentifiedImageError, OSError):
+        return None
+
+    pixels = np.asarray(cinza.resize((tamanho + 1, tamanho), Image.Resampling.LANCZOS), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def distancia_hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class ArvoreBK:
+    """
+    Árvore BK sobre a distância de Hamming: a desigualdade triangular permite descartar subárvores
+    inteiras, então a busca por vizinhos próximos visita só uma fração dos hashes.
+    """
+
+    def __init__(self):
+        self.raiz = None
+        self.tamanho = 0
+
+    def inserir(self, valor, item):
+        no = (valor, item, {})
+        self.tamanho += 1
+        if self.raiz is None:
+            self.raiz = no
+            return
+        atual = self.raiz
+        while True:
+            distancia = distancia_hamming(valor, atual[0])
+            filho = atual[2].get(distancia)
+            if filho is None:
+                atual[2][distancia] = no
+                return
+            atual = filho
+
+    def buscar(self, valor, max_distancia):
+        """Retorna [(distância, item)] dos valores a no máximo `max_distancia`, do mais próximo ao mais distante."""
+        if self.raiz is None:
+            return []
+        encontrados = []
+        pendentes = [self.raiz]
+        while pendentes:
+            no_valor, item, filhos = pendentes.pop()
+            distancia = distancia_hamming(valor, no_valor)
+            if distancia <= max_distancia:
+                encontrados.append((distancia, item))
+            for distancia_filho, filho in filhos.items():
+                if distancia - max_distancia <= distancia_filho <= distancia + max_distancia:
+                    pendentes.append(filho)
+        return sorted(encontrados, key=lambda par: par[0])
+
+
+class IndicePerceptual:
+    """
+    Índice persistente (SQLite) de leituras de arquitetura já feitas, pesquisável por semelhança visual.
+
+    Cada combinação de modelo e versão do prompt tem a própria árvore BK em memória. Antes de cada consulta
+    a árvore recebe as linhas gravadas desde a última leitura, inclusive por outras instâncias e processos,
+    então ela não fica desatualizada.
+    """
+
+    def __init__(self, caminho=CAMINHO_INDICE, max_distancia=DISTANCIA_MAXIMA):
+        self.caminho = caminho
+        self.max_distancia = max_distancia
+        # (modelo, versão do prompt) -> (árvore, último rowid carregado)
+        self._arvores = {}
+        self._lock = threading.Lock()
+
+        diretorio = os.path.dirname(caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+        with self._conectar() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS imagens (
+                    hash TEXT NOT NULL,
+                    modelo TEXT NOT NULL,
+                    versao_prompt TEXT NOT NULL,
+                    resultado TEXT NOT NULL,
+                    criado_em REAL NOT NULL
+                )
+                """
+            )
+            # Índices criados antes da restrição de unicidade podem ter o mesmo hash repetido
+            conn.execute(
+                "DELETE FROM imagens WHERE rowid NOT IN "
+                "(SELECT MIN(rowid) FROM imagens GROUP BY hash, modelo, versao_prompt)"
+            )
+            conn.execute("DROP INDEX IF EXISTS idx_imagens_combinacao")
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_imagens_hash ON imagens (modelo, versao_prompt, hash)"
+            )
+
+    @contextmanager
+    def _conectar(self):
+        conn = sqlite3.connect(self.caminho, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _arvore(self, modelo, versao_prompt):
+        # Chamado com o lock adquirido
+        chave = (modelo, versao_prompt)
+        arvore, ultimo = self._arvores.get(chave, (None, 0))
+        if arvore is None:
+            arvore = ArvoreBK()
+        with self._conectar() as conn:
+            linhas = conn.execute(
+                "SELECT rowid, hash, resultado FROM imagens WHERE modelo = ? AND versao_prompt = ? AND rowid > ? "
+                "ORDER BY rowid",
+                (modelo, versao_prompt, ultimo)
+            )
+            for ultimo, hash_hex, resultado in linhas:
+                arvore.inserir(int(hash_hex, 16), resultado)
+        self._arvores[chave] = (arvore, ultimo)
+        return arvore
+
+    def adicionar(self, conteudo, modelo, versao_prompt, resultado):
+        """
+        Indexa a leitura de arquitetura `resultado` (texto JSON) da imagem; conteúdos que não são imagem e
+        hashes já indexados para o modelo e a versão do prompt são ignorados.
+        """
+        valor = dhash(conteudo)
+        if valor is None:
+            return
+        # A árvore recebe a linha na próxima consulta
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO imagens (hash, modelo, versao_prompt, resultado, criado_em) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (format(valor, "x"), modelo, versao_prompt, resultado, time.time())
+            )
+
+    def buscar(self, conteudo, modelo, versao_prompt, max_distancia=None):
+        """
+        Procura a leitura de arquitetura de uma imagem visualmente parecida.
+
+        Retorna:
+            tuple[int, str] | None: (distância, resultado) da imagem mais próxima dentro do limite, ou None.
+        """
+        valor = dhash(conteudo)
+        if valor is None:
+            return None
+        max_distancia = self.max_distancia if max_distancia is None else max_distancia
+        with self._lock:
+            encontrados = self._arvore(modelo, versao_prompt).buscar(valor, max_distancia)
+        return encontrados[0] if encontrados else None
+
+
+_indices = {}
+_lock_indices = threading.Lock()
+
+
+def indice_compartilhado(caminho=CAMINHO_INDICE):
+    """Instância única do índice por arquivo, para que os clientes do processo não montem cada um as suas árvores."""
+    with _lock_indices:
+        if caminho not in _indices:
+            _indices[caminho] = IndicePerceptual(caminho)
+        return _indices[caminho]
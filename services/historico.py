@@ -0,0 +1,196 @@
+from contextlib import contextmanager
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+# Configuração do logging
+logging.basicConfig(level=logging.INFO)
+
+CAMINHO_HISTORICO = os.path.join('.cache', 'historico_analises.sqlite')
+
+# Destino padrão das listas exportadas. Os notebooks de métricas leem metricas/respostas retornadas, que
+# guarda as respostas usadas nos resultados publicados; para substituí-las, informe a pasta explicitamente
+DIRETORIO_EXPORTACAO = os.path.join('.cache', 'respostas retornadas')
+
+
+def hash_conteudo(conteudo):
+    """Impressão digital do diagrama: SHA-256 dos bytes enviados."""
+    return hashlib.sha256(conteudo).hexdigest()
+
+
+def execucoes_anteriores(registro):
+    """
+    Converte uma análise do histórico nas execuções anteriores aceitas por Chat.check_vulnerabilities nos
+    modos incremental e fan-out: tipo de análise -> 'conteudo' (itens ou fluxo) e 'relatorio'.
+    """
+    return {
+        "items": {"conteudo": registro["componentes"], "relatorio": registro["resultado_items"]},
+        "data-flow": {"conteudo": registro["fluxo_aplicacao"], "relatorio": registro["resultado_flow"]}
+    }
+
+
+class HistoricoAnalises:
+    """
+    Armazena em SQLite o resultado completo de cada análise: componentes, descrições, fluxo, os dois
+    relatórios STRIDE e o tempo de cada etapa.
+
+    As consultas por diagrama + modelo + versão do prompt e por data usam índices, então verificar se uma
+    combinação já foi analisada não depende do tamanho do histórico.
+    """
+
+    def __init__(self, caminho=CAMINHO_HISTORICO):
+        self.caminho = caminho
+        diretorio = os.path.dirname(caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+        with self._conectar() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS analises (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    hash_imagem TEXT NOT NULL,
+                    arquivo TEXT,
+                    modelo TEXT NOT NULL,
+                    versao_prompt TEXT NOT NULL,
+                    criado_em REAL NOT NULL,
+                    componentes TEXT NOT NULL,
+                    descricao_componentes TEXT NOT NULL,
+                    fluxo_aplicacao TEXT NOT NULL,
+                    resultado_items TEXT NOT NULL,
+                    resultado_flow TEXT NOT NULL,
+                    tempos TEXT NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_analises_combinacao "
+                "ON analises (hash_imagem, modelo, versao_prompt, criado_em)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_analises_modelo ON analises (modelo, criado_em)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_analises_versao ON analises (versao_prompt, criado_em)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_analises_criado_em ON analises (criado_em)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_analises_arquivo ON analises (arquivo, modelo, criado_em)")
+
+    @contextmanager
+    def _conectar(self):
+        conn = sqlite3.connect(self.caminho, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _como_dict(linha):
+        registro = dict(linha)
+        for campo in ("componentes", "descricao_componentes", "fluxo_aplicacao", "tempos"):
+            registro[campo] = json.loads(registro[campo])
+        return registro
+
+    def registrar(self, hash_imagem, modelo, versao_prompt, arquitetura, resultado_items, resultado_flow,
+                  tempos=None, arquivo=None):
+        """
+        Grava uma análise concluída e retorna seu ID.
+
+        Parâmetros:
+            arquitetura (dict): Resultado da leitura, com 'componentes_identificados', 'descricao_componentes'
+                e 'fluxo_aplicacao'
+            tempos (dict): Etapa -> duração em segundos
+        """
+        with self._conectar() as conn:
+            cursor = conn.execute(
+                """
+                INSERT INTO analises (hash_imagem, arquivo, modelo, versao_prompt, criado_em, componentes,
+                    descricao_componentes, fluxo_aplicacao, resultado_items, resultado_flow, tempos)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    hash_imagem, arquivo, modelo, versao_prompt, time.time(),
+                    json.dumps(arquitetura.get("componentes_identificados", []), ensure_ascii=False),
+                    json.dumps(arquitetura.get("descricao_componentes", {}), ensure_ascii=False),
+                    json.dumps(arquitetura.get("fluxo_aplicacao", ""), ensure_ascii=False),
+                    resultado_items, resultado_flow, json.dumps(tempos or {})
+                )
+            )
+            return cursor.lastrowid
+
+    def buscar(self, hash_imagem, modelo, versao_prompt):
+        """Retorna a análise mais recente deste diagrama com o mesmo modelo e versão do prompt, ou None."""
+        with self._conectar() as conn:
+            linha = conn.execute(
+                "SELECT * FROM analises WHERE hash_imagem = ? AND modelo = ? AND versao_prompt = ? "
+                "ORDER BY criado_em DESC LIMIT 1",
+                (hash_imagem, modelo, versao_prompt)
+            ).fetchone()
+        return self._como_dict(linha) if linha else None
+
+    def ultima_do_arquivo(self, arquivo, modelo):
+        """Retorna a análise mais recente de um arquivo com este nome (ex.: a versão anterior de um diagrama revisado)."""
+        with self._conectar() as conn:
+            linha = conn.execute(
+                "SELECT * FROM analises WHERE arquivo = ? AND modelo = ? ORDER BY criado_em DESC LIMIT 1",
+                (arquivo, modelo)
+            ).fetchone()
+        return self._como_dict(linha) if linha else None
+
+    def historico(self, limite=50, modelo=None, versao_prompt=None, hash_imagem=None, desde=None):
+        """Lista as análises mais recentes primeiro, filtrando pelos campos informados."""
+        condicoes = []
+        parametros = []
+        for campo, valor in (("modelo", modelo), ("versao_prompt", versao_prompt), ("hash_imagem", hash_imagem)):
+            if valor is not None:
+                condicoes.append(f"{campo} = ?")
+                parametros.append(valor)
+        if desde is not None:
+            condicoes.append("criado_em >= ?")
+            parametros.append(desde)
+
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+        with self._conectar() as conn:
+            linhas = conn.execute(
+                f"SELECT * FROM analises {where} ORDER BY criado_em DESC LIMIT ?", (*parametros, limite)
+            ).fetchall()
+        return [self._como_dict(linha) for linha in linhas]
+
+    def exportar_componentes(self, diretorio=DIRETORIO_EXPORTACAO, modelo=None, versao_prompt=None):
+        """
+        Grava, para cada diagrama, a lista de componentes da análise mais recente no formato lido pelos
+        notebooks de métricas (componentes_<nome do arquivo sem extensão>.txt com uma lista JSON).
+
+        Arquivos com o mesmo nome na pasta de destino são sobrescritos.
+
+        Retorna:
+            list[str]: Caminhos gravados.
+        """
+        os.makedirs(diretorio, exist_ok=True)
+        gravados = {}
+        # Do mais recente para o mais antigo: só a primeira ocorrência de cada arquivo é exportada
+        for registro in self.historico(limite=-1, modelo=modelo, versao_prompt=versao_prompt):
+            if not registro["arquivo"]:
+                continue
+            nome = os.path.splitext(os.path.basename(registro["arquivo"]))[0]
+            caminho = os.path.join(diretorio, f"componentes_{nome}.txt")
+            if caminho in gravados:
+                continue
+            with open(caminho, "w", encoding="utf-8") as f:
+                json.dump(registro["componentes"], f, ensure_ascii=False, separators=(",", ":"))
+            gravados[caminho] = registro["id"]
+        logging.info(f"{len(gravados)} listas de componentes exportadas para {diretorio}.")
+        return list(gravados)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Exporta o histórico de análises para os notebooks de métricas.")
+    parser.add_argument("--diretorio", default=DIRETORIO_EXPORTACAO, help="Pasta de destino das listas")
+    parser.add_argument("--modelo", default=None, help="Exporta apenas as análises deste modelo")
+    parser.add_argument("--versao-prompt", default=None, help="Exporta apenas as análises desta versão dos prompts")
+    args = parser.parse_args()
+
+    HistoricoAnalises().exportar_componentes(args.diretorio, modelo=args.modelo, versao_prompt=args.versao_prompt)
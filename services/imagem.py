@@ -0,0 +1,114 @@
+from io import BytesIO
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Maior lado da imagem enviada ao modelo de visão; acima disso o modelo reduz a imagem de qualquer forma
+MAX_LADO_PADRAO = 2048
+
+# Nível de compressão do PNG recodificado: o nível máximo (optimize) custa segundos de CPU por diagrama
+# grande para poucos por cento a menos de bytes
+NIVEL_COMPRESSAO_PNG = 6
+
+# Tag EXIF da orientação da foto (1 = sem rotação)
+TAG_ORIENTACAO = 0x0112
+
+# Formatos aceitos diretamente pelo modelo de visão
+MIME_POR_FORMATO = {
+    "PNG": "image/png",
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "GIF": "image/gif"
+}
+
+
+def detectar_formato(conteudo):
+    """Retorna o formato da imagem segundo o Pillow (ex.: 'PNG', 'JPEG') ou None se não for uma imagem."""
+    try:
+        with Image.open(BytesIO(conteudo)) as imagem:
+            return imagem.format
+    except (UnidentifiedImageError, OSError):
+        return None
+
+
+def remover_transparencia(imagem):
+    """Converte para RGB sobre fundo branco: diagramas costumam ter fundo transparente e o modelo enxerga melhor assim."""
+    if imagem.mode in ("RGBA", "LA") or (imagem.mode == "P" and "transparency" in imagem.info):
+        imagem = imagem.convert("RGBA")
+        fundo = Image.new("RGBA", imagem.size, (255, 255, 255, 255))
+        return Image.alpha_composite(fundo, imagem).convert("RGB")
+    return imagem.convert("RGB")
+
+
+def _tem_transparencia(imagem):
+    return imagem.mode in ("RGBA", "LA", "PA") or (imagem.mode == "P" and "transparency" in imagem.info)
+
+
+def _paleta_exata(imagem):
+    """Converte para paleta quando a imagem tem até 256 cores (sem aproximar nenhuma); senão retorna a imagem."""
+    if imagem.getcolors(maxcolors=256) is None:
+        return imagem
+    return imagem.quantize(colors=256, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+
+
+def _codificar(imagem, formato, **opcoes):
+    buffer = BytesIO()
+    imagem.save(buffer, format=formato, **opcoes)
+    return buffer.getvalue()
+
+
+def preprocessar_imagem(conteudo, max_lado=MAX_LADO_PADRAO):
+    """
+    Prepara a imagem para o modelo de visão.
+
+    Imagens em um formato aceito, dentro de `max_lado`, sem transparência e sem rotação EXIF seguem como
+    estão, sem decodificar os pixels. As demais são giradas, colocadas sobre fundo branco, reduzidas para
+    `max_lado` e recodificadas em PNG, em paleta só quando ela é exata: nenhuma cor é aproximada ou
+    convertida para cinza, para não apagar caixas e setas claras.
+
+    Retorna:
+        tuple[bytes, str | None, dict]: Bytes a enviar, MIME type correspondente (None se o conteúdo não for
+        uma imagem, caso em que os bytes são devolvidos sem alteração) e relatório com tamanhos e dimensões.
+    """
+    formato_original = detectar_formato(conteudo)
+    relatorio = {
+        "formato_original": formato_original,
+        "bytes_originais": len(conteudo)
+    }
+    if formato_original is None:
+        relatorio.update({"formato_final": None, "bytes_finais": len(conteudo)})
+        return conteudo, None, relatorio
+
+    with Image.open(BytesIO(conteudo)) as aberta:
+        relatorio["dimensoes_originais"] = aberta.size
+        redimensionar = max(aberta.size) > max_lado
+        girar = aberta.getexif().get(TAG_ORIENTACAO, 1) != 1
+        if (formato_original in MIME_POR_FORMATO and not redimensionar and not girar
+                and not _tem_transparencia(aberta)):
+            relatorio.update({
+                "dimensoes_finais": aberta.size,
+                "modo": aberta.mode,
+                "formato_final": formato_original,
+                "bytes_finais": len(conteudo),
+                "reducao_percentual": 0.0
+            })
+            return conteudo, MIME_POR_FORMATO[formato_original], relatorio
+
+        if redimensionar:
+            # Em JPEG, decodifica já em escala reduzida (no mínimo `max_lado`)
+            aberta.draft("RGB", (max_lado, max_lado))
+        aberta.seek(0)
+        imagem = remover_transparencia(ImageOps.exif_transpose(aberta))
+
+    if redimensionar:
+        imagem.thumbnail((max_lado, max_lado), Image.Resampling.LANCZOS)
+    imagem = _paleta_exata(imagem)
+    dados = _codificar(imagem, "PNG", compress_level=NIVEL_COMPRESSAO_PNG)
+
+    relatorio.update({
+        "dimensoes_finais": imagem.size,
+        "modo": imagem.mode,
+        "formato_final": "PNG",
+        "bytes_finais": len(dados),
+        "reducao_percentual": round(100 * (1 - len(dados) / len(conteudo)), 1) if conteudo else 0.0
+    })
+    return dados, MIME_POR_FORMATO["PNG"], relatorio
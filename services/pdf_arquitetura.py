@@ -0,0 +1,122 @@
+import atexit
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import pymupdf
+
+from openai_services.analise_incremental import normalizar_unidade
+from services.recuperacao import extrair_passos_fluxo
+
+# Resolução usada para rasterizar as páginas enviadas ao modelo de visão
+DPI_PADRAO = 150
+
+# Páginas sem imagens e com menos desenhos vetoriais que isso são consideradas só texto
+MIN_DESENHOS_DIAGRAMA = 20
+
+_PADRAO_NUMERO_PASSO = re.compile(r'^\s*\d+[.)]\s+')
+
+# Pool de processos único, criado no primeiro PDF com várias páginas. O PyMuPDF não pode ser usado por
+# várias threads ao mesmo tempo, então a rasterização paralela usa processos; "spawn" evita copiar via fork
+# um processo com threads (workers de análise, clientes HTTP) em andamento.
+_pool = None
+_lock_pool = threading.Lock()
+
+
+def _obter_pool():
+    global _pool
+    with _lock_pool:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                        mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def eh_pdf(conteudo):
+    """Verifica pela assinatura do arquivo se o conteúdo é um PDF."""
+    return conteudo[:5] == b"%PDF-"
+
+
+def _pagina_relevante(pagina):
+    """Descarta páginas em branco ou só com texto sem rasterizá-las."""
+    if pagina.get_images(full=False):
+        return True
+    return len(pagina.get_drawings()) >= MIN_DESENHOS_DIAGRAMA
+
+
+def _rasterizar_intervalo(conteudo, inicio, fim, dpi):
+    # Executado em outro processo: cada worker abre o PDF e cuida de um intervalo de páginas
+    imagens = []
+    with pymupdf.open(stream=conteudo, filetype="pdf") as documento:
+        for numero in range(inicio, fim):
+            pagina = documento[numero]
+            if not _pagina_relevante(pagina):
+                continue
+            imagens.append((numero + 1, pagina.get_pixmap(dpi=dpi).tobytes("png")))
+    return imagens
+
+
+def rasterizar_paginas(conteudo, dpi=DPI_PADRAO, max_processos=None):
+    """
+    Converte as páginas relevantes do PDF em imagens PNG usando o pool de processos do módulo.
+
+    Retorna:
+        list[tuple[int, bytes]]: Pares (número da página, PNG), em ordem de página.
+    """
+    with pymupdf.open(stream=conteudo, filetype="pdf") as documento:
+        total_paginas = documento.page_count
+    if total_paginas == 0:
+        return []
+
+    max_processos = min(max_processos or os.cpu_count() or 1, total_paginas)
+    if max_processos == 1:
+        return _rasterizar_intervalo(conteudo, 0, total_paginas, dpi)
+
+    tamanho = -(-total_paginas // max_processos)
+    intervalos = [(inicio, min(inicio + tamanho, total_paginas)) for inicio in range(0, total_paginas, tamanho)]
+    executor = _obter_pool()
+    futures = [executor.submit(_rasterizar_intervalo, conteudo, inicio, fim, dpi) for inicio, fim in intervalos]
+    return [imagem for future in futures for imagem in future.result()]
+
+
+def mesclar_resultados(resultados):
+    """
+    Junta as análises de várias páginas em um único resultado sem repetições.
+
+    Componentes, descrições e passos são comparados por normalizar_unidade (sem caixa, acentos ou
+    numeração); vale a primeira grafia e a primeira descrição encontradas, e os passos do fluxo são
+    renumerados na ordem das páginas.
+    """
+    componentes = {}
+    descricoes = {}
+    passos = []
+    passos_vistos = set()
+
+    for resultado in resultados:
+        for componente in resultado.get("componentes_identificados", []):
+            chave = normalizar_unidade(componente)
+            if chave:
+                componentes.setdefault(chave, componente)
+
+        for componente, descricao in resultado.get("descricao_componentes", {}).items():
+            chave = normalizar_unidade(componente)
+            if chave not in descricoes:
+                descricoes[chave] = (componente, descricao)
+
+        for passo in extrair_passos_fluxo(resultado.get("fluxo_aplicacao", "")):
+            passo = _PADRAO_NUMERO_PASSO.sub('', passo)
+            chave = normalizar_unidade(passo)
+            if chave not in passos_vistos:
+                passos_vistos.add(chave)
+                passos.append(passo)
+
+    return {
+        "componentes_identificados": list(componentes.values()),
+        # A descrição fica sob a mesma grafia do componente na lista, quando ele está nela
+        "descricao_componentes": {componentes.get(chave, componente): descricao
+                                  for chave, (componente, descricao) in descricoes.items()},
+        "fluxo_aplicacao": "\n".join(f"{i}. {passo}" for i, passo in enumerate(passos, start=1))
+    }
@@ -0,0 +1,240 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+
+# Configuração do logging
+logging.basicConfig(level=logging.INFO)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Exportador dos spans: "desativado" (padrão), "jsonl" (um span por linha) ou "otlp" (OTLP/JSON, lido pelo
+# filelog/otlpjsonfile do OpenTelemetry Collector)
+RASTREAMENTO = os.environ.get("RASTREAMENTO", "desativado")
+CAMINHO_RASTREAMENTO = os.environ.get(
+    "RASTREAMENTO_ARQUIVO", os.path.join(SCRIPT_DIR, "..", ".cache", "rastreamento.jsonl")
+)
+
+# Ao passar deste tamanho, o arquivo vira <arquivo>.1 (substituindo o anterior) e um novo é iniciado
+TAMANHO_MAXIMO_RASTREAMENTO = int(os.environ.get("RASTREAMENTO_TAMANHO_MAXIMO", str(50 * 1024 * 1024)))
+
+# Logs de respostas do LLM: tamanho máximo do trecho exibido e fração das chamadas que exibem o trecho
+LIMITE_LOG = 300
+TAXA_AMOSTRAGEM_LOG = 0.1
+
+_span_atual = contextvars.ContextVar("span_atual", default=None)
+
+
+class Span:
+    """Intervalo de tempo nomeado com atributos; use como context manager."""
+
+    def __init__(self, rastreador, nome, atributos):
+        pai = _span_atual.get()
+        self.rastreador = rastreador
+        self.nome = nome
+        self.atributos = dict(atributos)
+        self.trace_id = pai.trace_id if pai else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = pai.span_id if pai else None
+        self.inicio_ns = None
+        self.fim_ns = None
+        self.duracao_ms = None
+        self.erro = None
+        self._inicio_perf = None
+        self._token = None
+
+    def definir(self, **atributos):
+        self.atributos.update(atributos)
+
+    def __enter__(self):
+        self.inicio_ns = time.time_ns()
+        self._inicio_perf = time.perf_counter()
+        self._token = _span_atual.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duracao_ms = (time.perf_counter() - self._inicio_perf) * 1000
+        self.fim_ns = self.inicio_ns + int(self.duracao_ms * 1_000_000)
+        if exc is not None:
+            self.erro = f"{exc_type.__name__}: {exc}"
+        try:
+            _span_atual.reset(self._token)
+        except ValueError:
+            # Generators retomados em outro contexto: o span atual já foi restaurado por quem os consumiu
+            pass
+        self.rastreador._finalizar(self)
+        return False
+
+    def como_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "nome": self.nome,
+            "inicio_ns": self.inicio_ns,
+            "duracao_ms": round(self.duracao_ms, 3),
+            "atributos": self.atributos,
+            "erro": self.erro
+        }
+
+
+class ExportadorJSONL:
+    """
+    Grava cada span finalizado como uma linha JSON.
+
+    O arquivo fica aberto entre os spans; quando passa de `tamanho_maximo` bytes é rotacionado para
+    `<caminho>.1`, então o disco usado fica limitado a cerca de duas vezes esse tamanho.
+    """
+
+    def __init__(self, caminho=CAMINHO_RASTREAMENTO, tamanho_maximo=TAMANHO_MAXIMO_RASTREAMENTO):
+        self.caminho = caminho
+        self.tamanho_maximo = tamanho_maximo
+        self._lock = threading.Lock()
+        self._arquivo = None
+        diretorio = os.path.dirname(caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        atexit.register(self.fechar)
+
+    def _linha(self, span):
+        return span.como_dict()
+
+    def exportar(self, span):
+        linha = json.dumps(self._linha(span), ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            if self._arquivo is None:
+                self._arquivo = open(self.caminho, "a", encoding="utf-8")
+            elif self._arquivo.tell() >= self.tamanho_maximo:
+                self._arquivo.close()
+                os.replace(self.caminho, f"{self.caminho}.1")
+                self._arquivo = open(self.caminho, "a", encoding="utf-8")
+            self._arquivo.write(linha)
+            self._arquivo.flush()
+
+    def fechar(self):
+        with self._lock:
+            if self._arquivo is not None:
+                self._arquivo.close()
+                self._arquivo = None
+
+
+def _valor_otlp(valor):
+    if isinstance(valor, bool):
+        return {"boolValue": valor}
+    if isinstance(valor, int):
+        return {"intValue": str(valor)}
+    if isinstance(valor, float):
+        return {"doubleValue": valor}
+    return {"stringValue": str(valor)}
+
+
+class ExportadorOTLP(ExportadorJSONL):
+    """Grava cada span como uma requisição OTLP/JSON (ExportTraceServiceRequest) por linha."""
+
+    def _linha(self, span):
+        registro = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.nome,
+            "kind": 1,
+            "startTimeUnixNano": str(span.inicio_ns),
+            "endTimeUnixNano": str(span.fim_ns),
+            "attributes": [{"key": chave, "value": _valor_otlp(valor)} for chave, valor in span.atributos.items()],
+            "status": {"code": 2, "message": span.erro} if span.erro else {"code": 1}
+        }
+        if span.parent_id:
+            registro["parentSpanId"] = span.parent_id
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "analise-stride"}}]},
+                "scopeSpans": [{"scope": {"name": "services.rastreamento"}, "spans": [registro]}]
+            }]
+        }
+
+
+class ExportadorNulo:
+
+    def exportar(self, span):
+        pass
+
+
+def criar_exportador(tipo=None, caminho=None):
+    tipo = tipo or RASTREAMENTO
+    if tipo == "desativado":
+        return ExportadorNulo()
+    if tipo == "otlp":
+        return ExportadorOTLP(caminho or CAMINHO_RASTREAMENTO)
+    if tipo != "jsonl":
+        raise ValueError(f"Exportador de rastreamento desconhecido: {tipo}")
+    return ExportadorJSONL(caminho or CAMINHO_RASTREAMENTO)
+
+
+class Rastreador:
+
+    def __init__(self, exportador=None):
+        self.exportador = exportador or criar_exportador()
+
+    def span(self, nome, **atributos):
+        return Span(self, nome, atributos)
+
+    def _finalizar(self, span):
+        try:
+            self.exportador.exportar(span)
+        except Exception as e:
+            logging.error(f"Erro ao exportar span {span.nome}: {str(e)}")
+        logging.debug(f"span {span.nome}: {span.duracao_ms:.1f} ms {span.atributos}")
+
+
+rastreador = Rastreador()
+
+
+def span(nome, **atributos):
+    """Abre um span no rastreador padrão, filho do span atual se houver."""
+    return rastreador.span(nome, **atributos)
+
+
+def definir_atributos(**atributos):
+    """Adiciona atributos ao span atual, se houver."""
+    atual = _span_atual.get()
+    if atual is not None:
+        atual.definir(**atributos)
+
+
+def atributos_uso(usage):
+    """Converte o campo `usage` de uma resposta da OpenAI em atributos de span."""
+    detalhes = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "tokens_prompt": getattr(usage, "prompt_tokens", 0) or 0,
+        "tokens_resposta": getattr(usage, "completion_tokens", 0) or 0,
+        "tokens_cache": (getattr(detalhes, "cached_tokens", 0) or 0) if detalhes else 0
+    }
+
+
+def registrar_uso(usage):
+    """Registra no span atual o consumo de tokens da resposta da OpenAI."""
+    if usage is not None:
+        definir_atributos(**atributos_uso(usage))
+
+
+def submeter(executor, funcao, *args, **kwargs):
+    """executor.submit preservando o span atual, para que os spans das threads fiquem ligados ao pai."""
+    return executor.submit(contextvars.copy_context().run, funcao, *args, **kwargs)
+
+
+def log_truncado(rotulo, texto, limite=LIMITE_LOG, taxa_amostragem=TAXA_AMOSTRAGEM_LOG):
+    """
+    Registra um texto grande (ex.: resposta do LLM) sem inundar o log.
+
+    Sempre registra o tamanho; apenas uma amostra das chamadas inclui um trecho, limitado a `limite` caracteres.
+    """
+    texto = str(texto)
+    if random.random() >= taxa_amostragem:
+        logging.info(f"{rotulo}: {len(texto)} caracteres")
+        return
+    trecho = texto if len(texto) <= limite else f"{texto[:limite]}... (+{len(texto) - limite} caracteres)"
+    logging.info(f"{rotulo} ({len(texto)} caracteres): {trecho}")
@@ -0,0 +1,80 @@
+import re
+
+from services import rastreamento
+
+# Quantidade padrão de trechos relevantes mantidos por componente ou passo do fluxo
+TOP_K_POR_CONSULTA = 3
+
+# Termo acrescentado às consultas para que componentes sem correspondência ainda recuperem o conteúdo STRIDE
+TERMO_BASE = "Threat"
+
+_PADRAO_PASSO = re.compile(r'^\s*\d+[.)]\s+')
+
+
+def extrair_passos_fluxo(fluxo_aplicacao):
+    """
+    Separa o fluxo da aplicação em passos.
+
+    O modelo pode devolver `fluxo_aplicacao` como lista ou como texto com itens enumerados ("1. A ↔ B: ...").
+    """
+    if not fluxo_aplicacao:
+        return []
+    if isinstance(fluxo_aplicacao, list):
+        return [str(passo).strip() for passo in fluxo_aplicacao if str(passo).strip()]
+
+    passos = []
+    for linha in str(fluxo_aplicacao).split('\n'):
+        linha = linha.strip()
+        if not linha:
+            continue
+        # Linhas sem numeração continuam o passo anterior
+        if passos and not _PADRAO_PASSO.match(linha):
+            passos[-1] = f"{passos[-1]} {linha}"
+        else:
+            passos.append(linha)
+    return passos
+
+
+def montar_consultas(componentes_identificados, fluxo_aplicacao):
+    """Monta uma consulta por componente e uma por passo do fluxo, agrupadas pelo tipo de análise."""
+    return {
+        "items": [f"{componente} {TERMO_BASE}" for componente in componentes_identificados or []],
+        "data-flow": [f"{_PADRAO_PASSO.sub('', passo)} {TERMO_BASE}" for passo in extrair_passos_fluxo(fluxo_aplicacao)]
+    }
+
+
+def recuperar_documentos(search_rag, componentes_identificados, fluxo_aplicacao, top_k=TOP_K_POR_CONSULTA):
+    """
+    Recupera os documentos de apoio para cada tipo de análise com uma única busca em lote.
+
+    Cada consulta contribui com no máximo `top_k` trechos e os trechos repetidos entre consultas
+    aparecem uma única vez, preservando a ordem de relevância.
+
+    Retorna:
+        dict: Tipo de análise ('items', 'data-flow') -> lista de dicts com chaves 'id' e 'conteudo'.
+    """
+    consultas = montar_consultas(componentes_identificados, fluxo_aplicacao)
+
+    # Todas as consultas seguem juntas em um único lote
+    todas = [consulta for lista in consultas.values() for consulta in lista]
+    with rastreamento.span("recuperar_documentos", backend=type(search_rag).__name__, consultas=len(todas)):
+        resultados = search_rag.search_topics(todas, top_k=top_k) if todas else []
+
+    docs_por_tipo = {}
+    inicio = 0
+    for analysis_type, lista in consultas.items():
+        vistos = set()
+        docs = []
+        for resultado_consulta in resultados[inicio:inicio + len(lista)]:
+            for item in resultado_consulta[:top_k]:
+                if item["id"] in vistos:
+                    continue
+                vistos.add(item["id"])
+                docs.append({
+                    "id": item["id"],
+                    "conteudo": item["conteudo"]
+                })
+        docs_por_tipo[analysis_type] = docs
+        inicio += len(lista)
+
+    return docs_por_tipo
@@ -0,0 +1,309 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import io
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from openai_services.ai_flow import modo_analise
+from openai_services.analise_incremental import relatorio_incompleto
+from services import rastreamento
+from services.historico import HistoricoAnalises, execucoes_anteriores, hash_conteudo
+from services.recuperacao import recuperar_documentos
+
+# Configuração do logging
+logging.basicConfig(level=logging.INFO)
+
+CAMINHO_TAREFAS = os.path.join('.cache', 'tarefas.sqlite')
+
+# Análises executadas ao mesmo tempo no processo, compartilhadas por todos os usuários
+MAX_WORKERS = 4
+
+# Intervalo mínimo entre gravações do texto parcial das análises STRIDE
+INTERVALO_GRAVACAO_SEGUNDOS = 1.0
+
+# Modo incremental: só componentes e interações sem análise em cache vão ao modelo (sem streaming)
+ANALISE_INCREMENTAL = os.environ.get("ANALISE_INCREMENTAL", "0") == "1"
+
+# Modo fan-out: uma requisição por componente ou interação, em paralelo (também reaproveita o cache por unidade)
+ANALISE_FANOUT = os.environ.get("ANALISE_FANOUT", "0") == "1"
+
+# Cada processo renova periodicamente as tarefas que executa; as que ficam sem renovação por mais que o
+# limite pertencem a um processo que parou e são marcadas como interrompidas
+INTERVALO_BATIMENTO_SEGUNDOS = 15.0
+LIMITE_BATIMENTO_SEGUNDOS = 120.0
+
+# Tarefas concluídas ou com erro são apagadas depois deste prazo
+RETENCAO_TAREFAS_DIAS = float(os.environ.get("RETENCAO_TAREFAS_DIAS", "7"))
+
+# Estados possíveis de uma tarefa
+PENDENTE = "pendente"
+EXECUTANDO = "executando"
+CONCLUIDA = "concluida"
+ERRO = "erro"
+ESTADOS_FINAIS = (CONCLUIDA, ERRO)
+
+
+class ArmazemTarefas:
+    """
+    Registro persistente (SQLite) das tarefas de análise, com etapa atual e resultados parciais.
+
+    O resultado é um JSON com as chaves 'arquitetura' (dict da leitura) e 'analises' (tipo -> texto),
+    preenchidas à medida que as etapas avançam. Cada tarefa guarda o processo que a executa ('dono') e o
+    último sinal de vida dele ('batimento'), para que vários processos possam compartilhar o arquivo.
+    """
+
+    def __init__(self, caminho=CAMINHO_TAREFAS):
+        self.caminho = caminho
+        self.dono = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        diretorio = os.path.dirname(caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+        with self._conectar() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tarefas (
+                    id TEXT PRIMARY KEY,
+                    arquivo TEXT NOT NULL,
+                    estado TEXT NOT NULL,
+                    etapa TEXT,
+                    resultado TEXT NOT NULL,
+                    erro TEXT,
+                    criado_em REAL NOT NULL,
+                    atualizado_em REAL NOT NULL
+                )
+                """
+            )
+            # Arquivos criados antes do registro do processo dono
+            colunas = {linha[1] for linha in conn.execute("PRAGMA table_info(tarefas)")}
+            if "dono" not in colunas:
+                conn.execute("ALTER TABLE tarefas ADD COLUMN dono TEXT")
+            if "batimento" not in colunas:
+                conn.execute("ALTER TABLE tarefas ADD COLUMN batimento REAL")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tarefas_estado ON tarefas (estado)")
+
+    @contextmanager
+    def _conectar(self):
+        conn = sqlite3.connect(self.caminho, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def criar(self, arquivo):
+        """Registra uma nova tarefa pendente e retorna seu ID."""
+        tarefa_id = uuid.uuid4().hex
+        agora = time.time()
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT INTO tarefas (id, arquivo, estado, etapa, resultado, criado_em, atualizado_em, dono, batimento) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (tarefa_id, arquivo, PENDENTE, None, json.dumps({}), agora, agora, self.dono, agora)
+            )
+        return tarefa_id
+
+    def atualizar(self, tarefa_id, estado=None, etapa=None, resultado=None, erro=None):
+        """Atualiza os campos informados; os demais permanecem como estão."""
+        campos = {"estado": estado, "etapa": etapa, "erro": erro,
+                  "resultado": json.dumps(resultado, ensure_ascii=False) if resultado is not None else None}
+        campos = {chave: valor for chave, valor in campos.items() if valor is not None}
+        campos["atualizado_em"] = time.time()
+        atribuicoes = ", ".join(f"{chave} = ?" for chave in campos)
+        with self._conectar() as conn:
+            conn.execute(f"UPDATE tarefas SET {atribuicoes} WHERE id = ?", (*campos.values(), tarefa_id))
+
+    def obter(self, tarefa_id):
+        """Retorna a tarefa como dict ou None se o ID não existir."""
+        with self._conectar() as conn:
+            conn.row_factory = sqlite3.Row
+            linha = conn.execute("SELECT * FROM tarefas WHERE id = ?", (tarefa_id,)).fetchone()
+        if linha is None:
+            return None
+        tarefa = dict(linha)
+        tarefa["resultado"] = json.loads(tarefa["resultado"])
+        return tarefa
+
+    def renovar(self):
+        """Sinal de vida deste processo nas tarefas dele ainda em andamento."""
+        with self._conectar() as conn:
+            conn.execute(
+                "UPDATE tarefas SET batimento = ? WHERE dono = ? AND estado IN (?, ?)",
+                (time.time(), self.dono, PENDENTE, EXECUTANDO)
+            )
+
+    def marcar_interrompidas(self, limite_segundos=LIMITE_BATIMENTO_SEGUNDOS):
+        """
+        Marca como erro as tarefas em andamento de outros processos sem sinal de vida há mais de
+        `limite_segundos`: o processo que as executava parou e ninguém mais vai concluí-las.
+        """
+        agora = time.time()
+        with self._conectar() as conn:
+            cursor = conn.execute(
+                "UPDATE tarefas SET estado = ?, erro = ?, atualizado_em = ? "
+                "WHERE estado IN (?, ?) AND dono IS NOT ? AND COALESCE(batimento, atualizado_em) < ?",
+                (ERRO, "Tarefa interrompida: o processo que a executava parou.", agora, PENDENTE, EXECUTANDO,
+                 self.dono, agora - limite_segundos)
+            )
+            return cursor.rowcount
+
+    def expurgar(self, retencao_dias=RETENCAO_TAREFAS_DIAS):
+        """Apaga as tarefas concluídas ou com erro há mais de `retencao_dias`; retorna quantas foram apagadas."""
+        with self._conectar() as conn:
+            cursor = conn.execute(
+                "DELETE FROM tarefas WHERE estado IN (?, ?) AND atualizado_em < ?",
+                (*ESTADOS_FINAIS, time.time() - retencao_dias * 86400)
+            )
+            return cursor.rowcount
+
+
+class FilaAnalises:
+    """
+    Executa o pipeline de análise em segundo plano com um pool de workers limitado.
+
+    Cada tarefa lê a arquitetura, recupera os documentos e executa as duas análises STRIDE, gravando
+    etapa e resultados parciais no ArmazemTarefas; a interface acompanha a tarefa pelo ID. Análises
+    concluídas vão para o HistoricoAnalises, e um diagrama já analisado com o mesmo modelo, prompts,
+    modo de análise e backend de busca (versao_historico) é respondido a partir dele.
+    """
+
+    def __init__(self, search_rag, armazem=None, historico=None, max_workers=MAX_WORKERS,
+                 incremental=ANALISE_INCREMENTAL, fanout=ANALISE_FANOUT):
+        self.search_rag = search_rag
+        self.incremental = incremental
+        self.fanout = fanout
+        self.armazem = armazem or ArmazemTarefas()
+        self.historico = historico or HistoricoAnalises()
+        self._manter_armazem()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analise")
+        threading.Thread(target=self._batimentos, name="batimento-tarefas", daemon=True).start()
+
+    def _manter_armazem(self):
+        self.armazem.renovar()
+        interrompidas = self.armazem.marcar_interrompidas()
+        if interrompidas:
+            logging.warning(f"{interrompidas} tarefas de processos que pararam marcadas como erro.")
+        expurgadas = self.armazem.expurgar()
+        if expurgadas:
+            logging.info(f"{expurgadas} tarefas antigas apagadas do armazém.")
+
+    def _batimentos(self):
+        while True:
+            time.sleep(INTERVALO_BATIMENTO_SEGUNDOS)
+            try:
+                self._manter_armazem()
+            except sqlite3.Error as e:
+                logging.warning(f"Falha ao renovar as tarefas em andamento: {str(e)}")
+
+    def versao_historico(self, chat):
+        """Versão com que as análises desta fila são gravadas e procuradas no histórico."""
+        return chat.versao_analise(modo_analise(self.incremental, self.fanout), self.search_rag.backend)
+
+    def submeter(self, chat, conteudo, arquivo, arquitetura=None):
+        """
+        Cria a tarefa para os bytes do diagrama e a coloca na fila; retorna o ID da tarefa.
+
+        Uma `arquitetura` já conhecida (ex.: a leitura de um diagrama parecido) dispensa a chamada de visão.
+        """
+        tarefa_id = self.armazem.criar(arquivo)
+        self.executor.submit(self._executar, tarefa_id, chat, conteudo, arquivo, arquitetura)
+        logging.info(f"Tarefa {tarefa_id} criada para {arquivo}.")
+        return tarefa_id
+
+    def _executar(self, tarefa_id, chat, conteudo, arquivo, arquitetura=None):
+        resultado = {}
+        tempos = {}
+        try:
+            hash_imagem = hash_conteudo(conteudo)
+            versao = self.versao_historico(chat)
+            anterior = self.historico.buscar(hash_imagem, chat.model, versao)
+            if anterior is not None:
+                resultado = {
+                    "arquitetura": {
+                        "componentes_identificados": anterior["componentes"],
+                        "descricao_componentes": anterior["descricao_componentes"],
+                        "fluxo_aplicacao": anterior["fluxo_aplicacao"]
+                    },
+                    "analises": {"items": anterior["resultado_items"], "data-flow": anterior["resultado_flow"]}
+                }
+                self.armazem.atualizar(tarefa_id, estado=CONCLUIDA, etapa="concluida", resultado=resultado)
+                logging.info(f"Tarefa {tarefa_id} respondida pelo histórico (análise {anterior['id']}).")
+                return
+
+            self.armazem.atualizar(tarefa_id, estado=EXECUTANDO, etapa="arquitetura")
+            inicio = time.perf_counter()
+            if arquitetura is None:
+                arquitetura = chat.interpretar_arquitetura(chat.read_architecture(io.BytesIO(conteudo)))
+            tempos["arquitetura"] = time.perf_counter() - inicio
+            resultado["arquitetura"] = arquitetura
+            self.armazem.atualizar(tarefa_id, etapa="busca", resultado=resultado)
+
+            componentes = arquitetura.get("componentes_identificados", [])
+            fluxo = arquitetura.get("fluxo_aplicacao", [])
+            inicio = time.perf_counter()
+            docs_para_analise = recuperar_documentos(self.search_rag, componentes, fluxo)
+            tempos["busca"] = time.perf_counter() - inicio
+
+            self.armazem.atualizar(tarefa_id, etapa="analise")
+            inicio = time.perf_counter()
+            analises = {"items": "", "data-flow": ""}
+            resultado["analises"] = analises
+            if self.incremental or self.fanout:
+                self._analisar_por_unidades(tarefa_id, chat, arquivo, componentes, fluxo, docs_para_analise,
+                                           resultado)
+            else:
+                self._analisar_stream(tarefa_id, chat, componentes, fluxo, docs_para_analise, resultado)
+
+            tempos["analise"] = time.perf_counter() - inicio
+
+            # Um relatório com unidades sem análise é exibido, mas não vai para o histórico: senão seria
+            # devolvido para o mesmo diagrama dali em diante
+            incompletas = [tipo for tipo, texto in analises.items() if relatorio_incompleto(texto)]
+            if incompletas:
+                logging.warning(f"Tarefa {tarefa_id}: análises {incompletas} incompletas; não registradas no histórico.")
+            else:
+                self.historico.registrar(hash_imagem, chat.model, versao, arquitetura, analises["items"],
+                                         analises["data-flow"], tempos=tempos, arquivo=arquivo)
+            self.armazem.atualizar(tarefa_id, estado=CONCLUIDA, etapa="concluida", resultado=resultado)
+            logging.info(f"Tarefa {tarefa_id} concluída.")
+            rastreamento.log_truncado("Análise do fluxo de dados", analises["data-flow"])
+            rastreamento.log_truncado("Análise item a item", analises["items"])
+        except Exception as e:
+            logging.error(f"Erro na tarefa {tarefa_id}: {str(e)}")
+            self.armazem.atualizar(tarefa_id, estado=ERRO, erro=str(e), resultado=resultado)
+
+    def _analisar_stream(self, tarefa_id, chat, componentes, fluxo, docs_para_analise, resultado):
+        analises = resultado["analises"]
+        # Os pedaços só são acrescentados à lista; o texto é montado quando vai ser gravado, e não a cada pedaço
+        partes = {analysis_type: [] for analysis_type in analises}
+        ultima_gravacao = 0.0
+        em_andamento = chat.iter_vulnerability_analyses_stream(
+            {"items": componentes, "data-flow": fluxo}, docs_para_analise
+        )
+        for analysis_type, delta in em_andamento:
+            if delta is not None:
+                partes[analysis_type].append(delta)
+            # O texto parcial é gravado periodicamente para a interface exibir o progresso
+            if time.monotonic() - ultima_gravacao >= INTERVALO_GRAVACAO_SEGUNDOS:
+                analises.update({tipo: "".join(pedacos) for tipo, pedacos in partes.items()})
+                self.armazem.atualizar(tarefa_id, resultado=resultado)
+                ultima_gravacao = time.monotonic()
+        analises.update({tipo: "".join(pedacos) for tipo, pedacos in partes.items()})
+
+    def _analisar_por_unidades(self, tarefa_id, chat, arquivo, componentes, fluxo, docs_para_analise, resultado):
+        # A versão anterior do mesmo arquivo: unidades que não mudaram reaproveitam as seções dela
+        anterior = self.historico.ultima_do_arquivo(arquivo, chat.model)
+        anteriores = execucoes_anteriores(anterior) if anterior else None
+        em_andamento = chat.iter_vulnerability_analyses(
+            {"items": componentes, "data-flow": fluxo}, docs_para_analise, incremental=True, anteriores=anteriores,
+            fanout=self.fanout
+        )
+        for analysis_type, texto in em_andamento:
+            resultado["analises"][analysis_type] = texto
+            self.armazem.atualizar(tarefa_id, resultado=resultado)
@@ -0,0 +1,51 @@
+# Tamanho dos trechos e sobreposição entre trechos consecutivos, em palavras
+PALAVRAS_POR_TRECHO = 200
+PALAVRAS_SOBREPOSICAO = 40
+
+
+def dividir_em_trechos(documento, palavras_por_trecho=PALAVRAS_POR_TRECHO, sobreposicao=PALAVRAS_SOBREPOSICAO):
+    """
+    Divide o conteúdo de um documento em trechos sobrepostos.
+
+    O ID de cada trecho é o ID do documento seguido da posição do trecho, então a mesma página
+    sempre gera os mesmos IDs e uma reindexação substitui os trechos anteriores.
+
+    Parâmetros:
+        documento (dict): Documento com chaves 'id', 'titulo', 'conteudo' e 'url'
+
+    Retorna:
+        Iterator[dict]: Trechos com as mesmas chaves do documento.
+    """
+    if sobreposicao >= palavras_por_trecho:
+        raise ValueError("A sobreposição deve ser menor que o tamanho do trecho.")
+
+    palavras = documento.get("conteudo", "").split()
+    if not palavras:
+        return
+    passo = palavras_por_trecho - sobreposicao
+
+    posicao = 0
+    inicio = 0
+    while True:
+        yield {
+            "id": f"{documento['id']}-{posicao}",
+            "titulo": documento.get("titulo", "Sem título"),
+            "conteudo": " ".join(palavras[inicio:inicio + palavras_por_trecho]),
+            "url": documento.get("url", "URL não disponível")
+        }
+        posicao += 1
+        if inicio + palavras_por_trecho >= len(palavras):
+            break
+        inicio += passo
+
+
+def agrupar_em_lotes(itens, tamanho_lote):
+    """Agrupa um iterável em listas de até `tamanho_lote` itens sem materializar o iterável inteiro."""
+    lote = []
+    for item in itens:
+        lote.append(item)
+        if len(lote) >= tamanho_lote:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
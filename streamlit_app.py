@@ -1,4 +1,3 @@
-import json
 import logging
 
 import streamlit as st
@@ -6,10 +5,85 @@ import streamlit as st
 from azure_services import search
 from openai_services import ai_flow
 from services.gerar_pdf import pdf_button
+from services.historico import hash_conteudo
+from services.tarefas import CONCLUIDA, ESTADOS_FINAIS, FilaAnalises
 
 # Configuração do log
 logging.basicConfig(level=logging.INFO)
 
+MODELO = "o4-mini-2025-04-16"
+
+# Clientes guardados ao mesmo tempo e tempo de vida de cada um (depois disso é recriado). O cliente descartado
+# não é fechado: tarefas ainda em andamento continuam usando-o e ele é coletado quando elas terminam.
+MAX_CLIENTES = 32
+VALIDADE_CLIENTE = "1h"
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CLIENTES, ttl=VALIDADE_CLIENTE)
+def obter_chat(openai_api_key):
+    """Um cliente por chave de API, reaproveitado entre reruns e sessões (mantém o pool HTTP aberto)."""
+    return ai_flow.Chat(openai_api_key, model=MODELO)
+
+
+@st.cache_resource(show_spinner=False)
+def obter_search():
+    """Cliente de busca único para o processo."""
+    return search.criar_search()
+
+
+@st.cache_resource(show_spinner=False)
+def obter_fila():
+    """Fila de análises única para o processo: o pool de workers é compartilhado por todas as sessões."""
+    return FilaAnalises(obter_search())
+
+
+# Frequência com que a página consulta o progresso de uma análise em andamento
+INTERVALO_ATUALIZACAO_SEGUNDOS = 1.0
+
+MENSAGENS_ETAPA = {
+    "arquitetura": "Analisando arquitetura... Por favor, aguarde.",
+    "busca": "Buscando a documentação STRIDE relevante... Por favor, aguarde.",
+    "analise": "Analisando vulnerabilidade na arquitetura... Por favor, aguarde."
+}
+
+
+def exibir_arquitetura(resultado):
+    st.subheader("📦 Componentes Identificados")
+    st.write(resultado.get("componentes_identificados", []))
+
+    st.subheader("🧠 Descrição dos Componentes")
+    for componente, descricao in resultado.get("descricao_componentes", {}).items():
+        st.markdown(f"**{componente}**: {descricao}")
+
+    st.subheader("🔁 Fluxo da Aplicação")
+    st.write(resultado.get("fluxo_aplicacao", []))
+    st.success("Análise da arquitetura concluída com sucesso!", icon="✅")
+
+
+def exibir_analises(analises):
+    st.subheader("Resultado:")
+    with st.expander("🔍 Análise de vulnerabilidade item a item"):
+        st.text(analises.get("items", ""))
+
+    with st.expander("🔍 Análise de vulnerabilidade do fluxo de dados"):
+        st.text(analises.get("data-flow", ""))
+
+
+@st.fragment(run_every=INTERVALO_ATUALIZACAO_SEGUNDOS)
+def acompanhar_tarefa(tarefa_id):
+    """Exibe o progresso da análise em segundo plano; quando ela termina, recarrega a página com o resultado."""
+    tarefa = obter_fila().armazem.obter(tarefa_id)
+    if tarefa["estado"] in ESTADOS_FINAIS:
+        st.rerun()
+
+    st.info(MENSAGENS_ETAPA.get(tarefa["etapa"], "Análise na fila... Por favor, aguarde."), icon="⏳")
+    resultado = tarefa["resultado"]
+    if "arquitetura" in resultado:
+        exibir_arquitetura(resultado["arquitetura"])
+    if "analises" in resultado:
+        exibir_analises(resultado["analises"])
+
+
 # Show title and description.
 st.title("📄 Análise de Vulnerabilidade em Arquitetura de Software")
 st.write(
@@ -37,73 +111,69 @@ if not st.session_state["openai_api_key"]:
         st.session_state["openai_api_key"] = api_key
         st.rerun()
 else:
-    # Cria o cliente
-    chat = ai_flow.Chat(st.session_state["openai_api_key"], model="o4-mini-2025-04-16")
+    # Cliente reaproveitado entre reruns
+    chat = obter_chat(st.session_state["openai_api_key"])
+
+    fila = obter_fila()
 
     # Upload da arquitetura
     arquitetura = st.file_uploader(
         "Faça o upload da sua arquitetura (.pdf/.jpeg/.png)", type=("pdf", "jpeg", "png")
     )
     if arquitetura:
-        logging.info("Arquivo de arquitetura recebido.")
-        with st.spinner('Analisando arquitetura... Por favor, aguarde.'):
-            response = chat.read_architecture(arquitetura)
-            try:
-                response = response.replace('```', '')
-                response = response.replace('json', '')
-                resultado = json.loads(response)
-            except json.JSONDecodeError as e:
-                logging.error(f"Erro ao decodificar JSON: {str(e)} response: {response}")
-                st.error("Erro ao converter resposta para JSON.")
-                raise e
-
-        st.subheader("📦 Componentes Identificados")
-        resultados_itens = resultado.get("componentes_identificados", [])
-        st.write(resultados_itens)
-
-        st.subheader("🧠 Descrição dos Componentes")
-        for componente, descricao in resultado.get("descricao_componentes", {}).items():
-            st.markdown(f"**{componente}**: {descricao}")
-
-        st.subheader("🔁 Fluxo da Aplicação")
-        resultados_fluxo = resultado.get("fluxo_aplicacao", [])
-        st.write(resultados_fluxo)
-        st.success("Análise da arquitetura concluída com sucesso!", icon="✅")
-
-        with st.spinner('Analisando vulnerabilidade na arquitetura... Por favor, aguarde.'):
-
-            search_rag = search.Search()
-            response = search_rag.search_topic("Threat")
-
-            docs_para_analise = []
-            for item in response:
-                docs_para_analise.append({
-                    "id": item["id"],
-                    "conteudo": item["conteudo"]
-                })
-
-            resultado_items = chat.check_vulnerability_per_item("items", docs_para_analise, resultados_itens)
-            resultado_flow = chat.check_vulnerability_per_item("data-flow", docs_para_analise, resultados_fluxo)
-
-            st.subheader("Resultado:")
-            with st.expander("🔍 Análise de vulnerabilidade item a item"):
-                st.write(resultado_items)
-
-            with st.expander("🔍 Análise de vulnerabilidade do fluxo de dados"):
-                st.write(resultado_flow)
-
+        # Uma tarefa por arquivo na sessão: reruns (botões, download do PDF) acompanham a mesma tarefa
+        conteudo = arquitetura.getvalue()
+        chave_analise = hash_conteudo(conteudo)
+        tarefas = st.session_state.setdefault("tarefas", {})
+        if chave_analise not in tarefas:
+            logging.info("Arquivo de arquitetura recebido.")
+            # O mesmo arquivo já analisado sai direto do histórico; só os demais procuram um diagrama parecido
+            if fila.historico.buscar(chave_analise, chat.model, fila.versao_historico(chat)) is not None:
+                similar = None
+            else:
+                similar = chat.buscar_similar(conteudo)
+            if similar is None:
+                tarefas[chave_analise] = fila.submeter(chat, conteudo, arquitetura.name)
+            else:
+                distancia, arquitetura_anterior = similar
+                st.info(
+                    "Este diagrama é praticamente igual a um já analisado "
+                    f"({distancia} de 64 bits diferentes na assinatura visual). "
+                    "Você pode reaproveitar a leitura da arquitetura e pular a análise da imagem.",
+                    icon="♻️"
+                )
+                coluna_reaproveitar, coluna_nova = st.columns(2)
+                if coluna_reaproveitar.button("Reaproveitar leitura anterior"):
+                    tarefas[chave_analise] = fila.submeter(chat, conteudo, arquitetura.name,
+                                                           arquitetura=arquitetura_anterior)
+                elif coluna_nova.button("Analisar a imagem novamente"):
+                    tarefas[chave_analise] = fila.submeter(chat, conteudo, arquitetura.name)
+                else:
+                    st.stop()
+        tarefa_id = tarefas[chave_analise]
+        # O ID na URL permite retomar o acompanhamento depois de recarregar a página
+        st.query_params["tarefa"] = tarefa_id
+    else:
+        tarefa_id = st.query_params.get("tarefa")
+
+    tarefa = fila.armazem.obter(tarefa_id) if tarefa_id else None
+    if tarefa is None:
+        if tarefa_id:
+            st.warning("Análise não encontrada. Faça o upload da arquitetura novamente.")
+    elif tarefa["estado"] not in ESTADOS_FINAIS:
+        acompanhar_tarefa(tarefa_id)
+    elif tarefa["estado"] != CONCLUIDA:
+        st.error(f"Erro na análise: {tarefa['erro']}")
+    else:
+        resultado = tarefa["resultado"]["arquitetura"]
+        analises = tarefa["resultado"]["analises"]
+        exibir_arquitetura(resultado)
+        exibir_analises(analises)
         st.success("Análise de vulnerabilidades concluída com sucesso!", icon="✅")
 
-
-        logging.info(resultado_flow)
-        logging.info(resultado_items)
-        logging.info(resultados_itens)
-        logging.info(resultados_fluxo)
-        logging.info(resultado.get("fluxo_aplicacao", []))
-        logging.info(resultado.get("descricao_componentes", {}))
         # Gerar o PDF
-        pdf_button(resultados_itens=resultados_itens,
-                   resultado_items=resultado_items,
-                   resultado_flow=resultado_flow,
+        pdf_button(resultados_itens=resultado.get("componentes_identificados", []),
+                   resultado_items=analises["items"],
+                   resultado_flow=analises["data-flow"],
                    resultados_fluxo=resultado.get("fluxo_aplicacao", []),
                    descricao_componentes=resultado.get("descricao_componentes", {}))
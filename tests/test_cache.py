@@ -0,0 +1,80 @@
+import pytest
+
+from openai_services import cache as modulo_cache
+from openai_services.cache import CacheResultados
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    """Relógio controlado pelo teste: cada acesso ao cache acontece em um instante diferente."""
+    agora = [1000.0]
+
+    def tempo():
+        agora[0] += 1
+        return agora[0]
+
+    monkeypatch.setattr(modulo_cache.time, "time", tempo)
+    return agora
+
+
+def test_gerar_chave_depende_do_conteudo_modelo_e_versao():
+    chave = CacheResultados.gerar_chave(b"diagrama", "modelo", "1")
+    assert chave == CacheResultados.gerar_chave(b"diagrama", "modelo", "1")
+    assert chave != CacheResultados.gerar_chave(b"diagrama", "modelo", "2")
+    assert chave != CacheResultados.gerar_chave(b"diagrama", "outro", "1")
+    assert chave != CacheResultados.gerar_chave(b"outro", "modelo", "1")
+
+
+def test_remove_a_entrada_menos_usada_ao_passar_do_limite(tmp_path, relogio):
+    cache = CacheResultados(str(tmp_path / "cache.sqlite"), max_entradas=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    # Acessar "a" a torna a mais recente: "b" é a que sai
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert cache.estatisticas()["entradas"] == 2
+
+
+def test_remove_entradas_ao_passar_do_tamanho_maximo(tmp_path, relogio):
+    cache = CacheResultados(str(tmp_path / "cache.sqlite"), max_bytes=10)
+    cache.set("a", "x" * 6)
+    cache.set("b", "y" * 6)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == "y" * 6
+    assert cache.estatisticas()["bytes"] == 6
+
+
+def test_entradas_expiram_depois_do_ttl(tmp_path, relogio):
+    cache = CacheResultados(str(tmp_path / "cache.sqlite"), ttl_segundos=60)
+    cache.set("a", "1")
+    assert cache.get("a") == "1"
+
+    relogio[0] += 120
+    assert cache.get("a") is None
+    # A entrada expirada é apagada na leitura
+    assert cache.estatisticas() == {"hits": 1, "misses": 1, "entradas": 0, "bytes": 0}
+
+
+def test_ttl_conta_da_gravacao_e_nao_do_ultimo_acesso(tmp_path, relogio):
+    cache = CacheResultados(str(tmp_path / "cache.sqlite"), ttl_segundos=60)
+    cache.set("a", "1")
+    relogio[0] += 40
+    assert cache.get("a") == "1"
+    relogio[0] += 40
+    assert cache.get("a") is None
+
+
+def test_persistencia_entre_instancias_e_limpar(tmp_path):
+    caminho = str(tmp_path / "cache.sqlite")
+    CacheResultados(caminho).set("a", "1")
+
+    cache = CacheResultados(caminho)
+    assert cache.get("a") == "1"
+    cache.limpar()
+    assert cache.get("a") is None
+    assert cache.estatisticas()["entradas"] == 0
@@ -0,0 +1,65 @@
+import io
+import random
+
+from PIL import Image
+
+from services.hash_perceptual import ArvoreBK, IndicePerceptual, distancia_hamming
+
+
+def test_busca_por_raio_igual_a_forca_bruta():
+    gerador = random.Random(7)
+    valores = [gerador.getrandbits(64) for _ in range(500)]
+    arvore = ArvoreBK()
+    for indice, valor in enumerate(valores):
+        arvore.inserir(valor, indice)
+
+    for consulta in valores[:20] + [gerador.getrandbits(64) for _ in range(20)]:
+        for raio in (0, 4, 24, 30):
+            esperado = sorted((distancia_hamming(consulta, valor), indice) for indice, valor in enumerate(valores)
+                              if distancia_hamming(consulta, valor) <= raio)
+            encontrados = arvore.buscar(consulta, raio)
+            assert sorted(encontrados) == esperado
+            # Do mais próximo ao mais distante
+            assert [d for d, _ in encontrados] == sorted(d for d, _ in encontrados)
+
+
+def test_arvore_vazia_e_valores_repetidos():
+    arvore = ArvoreBK()
+    assert arvore.buscar(0, 64) == []
+    arvore.inserir(0b1010, "a")
+    arvore.inserir(0b1010, "b")
+    arvore.inserir(0b1011, "c")
+    assert sorted(arvore.buscar(0b1010, 0)) == [(0, "a"), (0, "b")]
+    assert arvore.buscar(0b1010, 1)[-1] == (1, "c")
+
+
+def diagrama(deslocamento=0):
+    imagem = Image.new("RGB", (128, 96), "white")
+    for x in range(10 + deslocamento, 60 + deslocamento):
+        for y in range(20, 70):
+            imagem.putpixel((x, y), (20, 60, 200))
+    saida = io.BytesIO()
+    imagem.save(saida, "PNG")
+    return saida.getvalue()
+
+
+def test_indice_encontra_diagrama_parecido_e_ignora_hash_repetido(tmp_path):
+    caminho = str(tmp_path / "indice.sqlite")
+    indice = IndicePerceptual(caminho)
+    indice.adicionar(diagrama(), "m", "1", '{"primeira": true}')
+    indice.adicionar(diagrama(), "m", "1", '{"segunda": true}')
+
+    distancia, resultado = indice.buscar(diagrama(1), "m", "1")
+    assert distancia <= indice.max_distancia
+    assert resultado == '{"primeira": true}'
+    assert indice.buscar(diagrama(), "m", "2") is None
+    assert indice.buscar(b"nao e imagem", "m", "1") is None
+
+
+def test_indice_ve_linhas_gravadas_por_outra_instancia(tmp_path):
+    caminho = str(tmp_path / "indice.sqlite")
+    leitor = IndicePerceptual(caminho)
+    assert leitor.buscar(diagrama(), "m", "1") is None
+
+    IndicePerceptual(caminho).adicionar(diagrama(), "m", "1", "{}")
+    assert leitor.buscar(diagrama(), "m", "1") == (0, "{}")
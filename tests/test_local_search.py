@@ -0,0 +1,57 @@
+import json
+import os
+
+import pytest
+
+from azure_services.local_search import LocalSearch, tokenizar
+
+CORPUS = [
+    "Spoofing: um atacante se passa por outro usuário ao roubar credenciais de autenticação.",
+    "Tampering: alteração maliciosa de dados em trânsito ou armazenados no banco de dados.",
+    "Denial of service: a fila de mensagens é inundada e o serviço deixa de responder.",
+    "Autenticação forte e rotação de credenciais reduzem o risco de spoofing de credenciais."
+]
+
+
+@pytest.fixture
+def busca(tmp_path):
+    caminho = tmp_path / "documentacao.json"
+    caminho.write_text(json.dumps({"documentacao_stride": CORPUS, "urls": [f"https://doc/{i}" for i in range(4)]}),
+                       encoding="utf-8")
+    return LocalSearch(caminho_corpus=str(caminho), diretorio_indice=str(tmp_path / "indice"))
+
+
+def test_tokenizar_normaliza_acentos_e_remove_stopwords():
+    assert tokenizar("A Autenticação do Usuário") == ["autenticacao", "usuario"]
+
+
+def test_ordena_pelo_score_bm25(busca):
+    resultados = busca.search_topic("credenciais spoofing")
+
+    # Os dois documentos que falam de credenciais e spoofing; o que repete os termos vem primeiro
+    assert [r["url"] for r in resultados] == ["https://doc/3", "https://doc/0"]
+    assert resultados[0]["score"] > resultados[1]["score"] > 0
+    assert resultados[0]["conteudo"] == CORPUS[3]
+
+
+def test_so_documentos_com_algum_termo_recebem_score(busca):
+    assert set(busca.pontuar("fila dados")) == {1, 2}
+    assert busca.search_topic("fila")[0]["url"] == "https://doc/2"
+
+
+def test_top_k_e_consulta_sem_termos_conhecidos(busca):
+    assert len(busca.search_topic("credenciais", top_k=1)) == 1
+    assert busca.search_topic("kubernetes") == []
+    assert busca.search_topics(["fila", "tampering"])[1][0]["url"] == "https://doc/1"
+
+
+def test_reconstroi_quando_o_corpus_muda_sem_afetar_quem_ja_leu(busca, tmp_path):
+    caminho = tmp_path / "documentacao.json"
+    caminho.write_text(json.dumps({"documentacao_stride": ["Repudiation: ações sem registro de auditoria."],
+                                   "urls": ["https://doc/novo"]}), encoding="utf-8")
+    nova = LocalSearch(caminho_corpus=str(caminho), diretorio_indice=str(tmp_path / "indice"))
+
+    assert nova.search_topic("auditoria")[0]["url"] == "https://doc/novo"
+    # A instância antiga continua lendo os arquivos que já tinha mapeado
+    assert busca.search_topic("fila")[0]["url"] == "https://doc/2"
+    assert "meta.json" in os.listdir(tmp_path / "indice")
@@ -0,0 +1,146 @@
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from openai_services import resiliencia
+from openai_services.resiliencia import BaldeTaxa, ClienteResiliente, ConcorrenciaAdaptativa, _retry_after
+
+
+def erro_429(cabecalhos=None, code=None):
+    resposta = httpx.Response(429, headers=cabecalhos or {},
+                              request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+    erro = openai.RateLimitError("Rate limit", response=resposta, body=None)
+    erro.code = code
+    return erro
+
+
+class ClienteFalso:
+    """Devolve (ou levanta) os itens de `respostas` em ordem, um por chamada."""
+
+    def __init__(self, respostas):
+        self.respostas = list(respostas)
+        self.chamadas = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._criar))
+
+    def _criar(self, **kwargs):
+        self.chamadas += 1
+        resposta = self.respostas.pop(0)
+        if isinstance(resposta, Exception):
+            raise resposta
+        return resposta
+
+
+@pytest.fixture
+def esperas(monkeypatch):
+    """Registra as esperas entre tentativas sem dormir de fato."""
+    registradas = []
+    monkeypatch.setattr(resiliencia.time, "sleep", registradas.append)
+    return registradas
+
+
+def criar_cliente(respostas, **kwargs):
+    return ClienteResiliente(ClienteFalso(respostas), balde=BaldeTaxa(None, None),
+                             concorrencia=ConcorrenciaAdaptativa(inicial=8), **kwargs)
+
+
+def chamar(cliente):
+    return cliente.chat.completions.create(model="m", messages=[{"role": "user", "content": "oi"}])
+
+
+def test_retry_after_em_segundos_milissegundos_e_data():
+    assert _retry_after(erro_429({"retry-after": "7"})) == 7.0
+    assert _retry_after(erro_429({"retry-after-ms": "1500", "retry-after": "9"})) == 1.5
+    data = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 <= _retry_after(erro_429({"retry-after": data})) <= 30
+    assert _retry_after(erro_429()) is None
+    assert _retry_after(erro_429({"retry-after": "depois"})) is None
+
+
+def test_429_respeita_retry_after_e_reduz_concorrencia(esperas):
+    cliente = criar_cliente([erro_429({"retry-after": "3"}), "ok"])
+
+    assert chamar(cliente) == "ok"
+    assert cliente.client.chamadas == 2
+    # A espera nunca fica abaixo do pedido pelo servidor, e o balde pausa as demais threads
+    assert esperas[0] >= 3
+    assert cliente.balde._pausado_ate > 0
+    # Reduzida pela metade pelo 429 e acrescida de 1/limite pelo sucesso seguinte
+    assert cliente.concorrencia.limite == pytest.approx(4 + 1 / 4)
+    assert cliente.concorrencia.em_uso == 0
+
+
+def test_429_sem_retry_after_usa_espera_exponencial(esperas):
+    cliente = criar_cliente([erro_429(), erro_429(), erro_429(), "ok"])
+    # Jitter no máximo: a espera é o teto exponencial de cada tentativa
+    cliente._random.uniform = lambda minimo, maximo: maximo
+
+    assert chamar(cliente) == "ok"
+    base = resiliencia.ESPERA_BASE_SEGUNDOS
+    assert esperas == [base, base * 2, base * 4]
+
+
+def test_429_por_falta_de_credito_nao_e_repetido(esperas):
+    cliente = criar_cliente([erro_429(code="insufficient_quota"), "ok"])
+
+    with pytest.raises(openai.RateLimitError):
+        chamar(cliente)
+    assert cliente.client.chamadas == 1
+    assert esperas == []
+
+
+def test_desiste_depois_do_maximo_de_tentativas(esperas):
+    cliente = criar_cliente([erro_429() for _ in range(3)], max_tentativas=3)
+
+    with pytest.raises(openai.RateLimitError):
+        chamar(cliente)
+    assert cliente.client.chamadas == 3
+    assert len(esperas) == 2
+    assert cliente.concorrencia.em_uso == 0
+
+
+def test_retry_after_alem_do_prazo_levanta_prazo_esgotado(esperas):
+    cliente = criar_cliente([erro_429({"retry-after": "120"}), "ok"], prazo_segundos=10)
+
+    with pytest.raises(resiliencia.ErroPrazoEsgotado):
+        chamar(cliente)
+    assert esperas == []
+
+
+def test_concorrencia_cresce_com_sucessos_e_cai_em_sobrecarga(monkeypatch):
+    concorrencia = ConcorrenciaAdaptativa(inicial=4, maximo=16)
+    for _ in range(4):
+        concorrencia.entrar()
+        concorrencia.sair(sucesso=True)
+    assert 4.9 < concorrencia.limite < 5.1
+
+    limite = concorrencia.limite
+    relogio = iter([100.0, 100.5, 103.0])
+    monkeypatch.setattr(resiliencia.time, "monotonic", lambda: next(relogio))
+    for _ in range(3):
+        concorrencia.entrar()
+        concorrencia.sair(sucesso=False, sobrecarga=True)
+    # A segunda sobrecarga cai dentro do INTERVALO_REDUCAO_SEGUNDOS da primeira e não reduz de novo
+    assert concorrencia.limite == pytest.approx(limite * resiliencia.FATOR_REDUCAO ** 2)
+
+
+def test_balde_espera_a_reposicao_de_tokens(monkeypatch):
+    agora = [0.0]
+    monkeypatch.setattr(resiliencia.time, "monotonic", lambda: agora[0])
+
+    def dormir(segundos):
+        agora[0] += segundos
+
+    monkeypatch.setattr(resiliencia.time, "sleep", dormir)
+    balde = BaldeTaxa(requisicoes_por_minuto=60, tokens_por_minuto=600)
+
+    balde.adquirir(600)
+    balde.adquirir(300)
+    # 300 tokens a 600 por minuto levam 30 segundos para voltar ao balde
+    assert agora[0] == pytest.approx(30.0)
+
+    with pytest.raises(resiliencia.ErroPrazoEsgotado):
+        balde.adquirir(600, prazo=agora[0] + 1)
@@ -0,0 +1,36 @@
+import json
+
+import pytest
+
+from openai_services.saida_estruturada import (
+    ErroSaidaEstruturada, carregar_json, extrair_objeto_json, reparar_json
+)
+
+
+def test_extrai_o_objeto_entre_cercas_markdown():
+    texto = 'Segue o resultado:\n```json\n{"a": {"b": "}"}}\n```\nFim.'
+    assert extrair_objeto_json(texto) == '{"a": {"b": "}"}}'
+    assert extrair_objeto_json("sem json") is None
+
+
+def test_remove_virgulas_sobrando_antes_de_fechar():
+    assert json.loads(reparar_json('{"a": [1, 2,], "b": {"c": 3,},}')) == {"a": [1, 2], "b": {"c": 3}}
+
+
+def test_mantem_virgulas_dentro_de_strings():
+    texto = '{"lista": "a, ]", "fim": "x,}", "escape": "aspas \\" ,]", "itens": ["y",],}'
+    assert json.loads(reparar_json(texto)) == {
+        "lista": "a, ]", "fim": "x,}", "escape": 'aspas " ,]', "itens": ["y"]
+    }
+
+
+def test_fecha_resposta_truncada():
+    assert json.loads(reparar_json('{"a": ["x", "y')) == {"a": ["x", "y"]}
+    assert json.loads(reparar_json('{"a": 1, "b": [2,')) == {"a": 1, "b": [2]}
+
+
+def test_carregar_json_so_repara_quando_precisa():
+    assert carregar_json('```json\n{"a": "1, ]"}\n```') == {"a": "1, ]"}
+    assert carregar_json('{"a": [1,], "b": "c, ]"') == {"a": [1], "b": "c, ]"}
+    with pytest.raises(ErroSaidaEstruturada):
+        carregar_json("nenhum objeto aqui")